@@ -1,18 +1,56 @@
-from flask import Flask
-from routes.auth_routes import auth_bp
-from routes.entry_routes import entry_bp
-from routes.user_routes import user_bp
+from flask import Flask, jsonify
+from config import PREWARM_CLIENTS, DATA_BACKEND, STORAGE_BACKEND, UPLOAD_SIGNING_KEY
 
-app = Flask(__name__)
+def create_app():
+    """Build the Flask app.
 
-# Register blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(entry_bp)
-app.register_blueprint(user_bp)
+    No Google Cloud client is created here; they are built on first use, or
+    in the background when PREWARM_CLIENTS is set.
+    """
+    from cache import cache_stats
+    from routes.auth_routes import auth_bp
+    from routes.entry_routes import entry_bp
+    from routes.user_routes import user_bp
+    from routes.job_routes import job_bp
+    import metrics
 
-@app.route('/')
-def index():
-    return "<h1>Hello World</h1>"
+    # Upload ids are only as trustworthy as the key that signs them; without
+    # one the direct upload endpoints answer 503 and everything else works
+    if not UPLOAD_SIGNING_KEY:
+        print("Warning: UPLOAD_SIGNING_KEY is not set, direct photo uploads are disabled")
+
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(entry_bp)
+    app.register_blueprint(user_bp)
+    app.register_blueprint(job_bp)
+    if STORAGE_BACKEND == "local":
+        from routes.storage_routes import storage_bp
+        app.register_blueprint(storage_bp)
+
+    @app.route('/')
+    def index():
+        return "<h1>Hello World</h1>"
+
+    @app.route('/api/cache/stats')
+    def get_cache_stats():
+        return jsonify(cache_stats()), 200
+
+    if PREWARM_CLIENTS:
+        from clients import prewarm_clients
+        names = []
+        if DATA_BACKEND != "sqlite":
+            names.append("bigquery")
+        if STORAGE_BACKEND != "local":
+            names.append("storage")
+        prewarm_clients(names)
+
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,201 @@
+import uuid
+from datetime import datetime
+from config import MAX_PHOTOS_PER_BATCH_ENTRY, MIN_IDEMPOTENCY_KEY_LENGTH
+from batch_writer import insert_rows
+from repository import get_repository
+from storage_backend import get_bucket, blob_name_from_url
+from upload_executor import run_uploads, run_tasks
+from geo_index import index_entry
+from text_index import index_entry_text
+from expense_rollups import track_entry, track_expenses
+
+# Batch ingest for offline-sync clients. Every entry carries a client-chosen
+# idempotency key, scoped to the sending user and device, and all of its row
+# IDs are derived from that scoped key with UUIDv5, so a replayed batch
+# produces the same rows while other clients' keys never collide with it.
+# One existence check per table finds what an earlier attempt already wrote,
+# and only the missing rows are inserted, one insert call per table. A replay of a partially written
+# batch therefore fills in the gaps instead of duplicating anything.
+#
+# Photos are referenced by the URL of an image already in the bucket; new
+# images go through the two-phase upload endpoints with the returned entry_id.
+
+NAMESPACE = uuid.UUID("6f1d2c9e-5b7a-4e0b-9a43-2f8c1d7e3b60")
+
+def scoped_key(user_id, device_id, key):
+    return f"{user_id}:{device_id}:{key}"
+
+def entry_id_for(scope):
+    return str(uuid.uuid5(NAMESPACE, f"entry:{scope}"))
+
+def child_id_for(scope, kind, position):
+    return str(uuid.uuid5(NAMESPACE, f"{kind}:{scope}:{position}"))
+
+def parse_coordinate(value, limit):
+    if value in (None, ""):
+        return 0.0
+    value = float(value)
+    if not -limit <= value <= limit:
+        raise ValueError(value)
+    return value
+
+def validate_entry(item, now, user_id, device_id):
+    """Build the rows for one batch item; ValueError listing what is wrong with it."""
+    problems = []
+    key = item.get("idempotency_key")
+    if not isinstance(key, str) or not MIN_IDEMPOTENCY_KEY_LENGTH <= len(key.strip()) <= 200:
+        raise ValueError(
+            f"idempotency_key must be a string of {MIN_IDEMPOTENCY_KEY_LENGTH} to 200 characters, such as a UUID"
+        )
+
+    scope = scoped_key(user_id, device_id, key)
+    entry_id = entry_id_for(scope)
+    entry = {
+        "entry_id": entry_id,
+        "title": item.get("title"),
+        "content": item.get("content"),
+        "location": item.get("location"),
+        "user_id": user_id,
+        "created_at": now
+    }
+    for field, limit in (("latitude", 90), ("longitude", 180)):
+        try:
+            entry[field] = parse_coordinate(item.get(field), limit)
+        except (TypeError, ValueError):
+            problems.append(f"{field} must be a number between -{limit} and {limit}")
+
+    # Entries written offline keep the time they were written
+    if item.get("created_at"):
+        try:
+            entry["created_at"] = datetime.strptime(item["created_at"], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            problems.append("created_at must be formatted as YYYY-MM-DD HH:MM:SS")
+
+    expenses = []
+    for position, expense in enumerate(item.get("expenses") or []):
+        try:
+            amount = float(expense["amount"])
+        except (TypeError, KeyError, ValueError):
+            problems.append(f"expenses[{position}] needs a numeric amount")
+            continue
+        expenses.append({
+            "expense_id": child_id_for(scope, "expense", position),
+            "entry_id": entry_id,
+            "amount": amount,
+            "currency": expense.get("currency", "USD"),
+            "category": expense.get("category", "Other"),
+            "user_id": user_id,
+            "created_at": entry["created_at"]
+        })
+
+    photos = []
+    photo_urls = item.get("photos") or []
+    if len(photo_urls) > MAX_PHOTOS_PER_BATCH_ENTRY:
+        problems.append(f"At most {MAX_PHOTOS_PER_BATCH_ENTRY} photos per entry")
+        photo_urls = []
+    for position, photo_url in enumerate(photo_urls):
+        if not isinstance(photo_url, str) or not (blob_name_from_url(photo_url) or "").startswith("photos/"):
+            problems.append(f"photos[{position}] is not a stored photo URL")
+            continue
+        photos.append({
+            "photo_id": child_id_for(scope, "photo", position),
+            "entry_id": entry_id,
+            "photo_url": photo_url,
+            "user_id": user_id,
+            "uploaded_at": entry["created_at"]
+        })
+
+    if problems:
+        raise ValueError("; ".join(problems))
+    return key, {"entries": [entry], "expenses": expenses, "photos": photos}
+
+def missing_photo_urls(urls):
+    """Return the referenced photo URLs with no blob behind them, checked concurrently."""
+    bucket = get_bucket()
+    urls = list(urls)
+    results = run_uploads(lambda url: bucket.blob(blob_name_from_url(url, bucket)).exists(), urls)
+    return {url for url, (exists, error) in zip(urls, results) if error or not exists}
+
+def ingest_entries(items, user_id, device_id):
+    """Write a batch of entries with their expenses and photos for one user's device.
+
+    Returns {"results": {idempotency_key: result}, "errors": [...]}, where
+    each result has the entry_id, a status of "created", "exists" or "failed"
+    and the errors of its rows; "errors" lists items that could not be read.
+    """
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    results = {}
+    invalid = []
+    rows = {}
+
+    # Validate everything up front; a bad item doesn't hold back the others
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each entry must be an object")
+            key, item_rows = validate_entry(item, now, user_id, device_id)
+        except ValueError as e:
+            invalid.append({"index": index, "errors": [str(e)]})
+            continue
+        if key in rows:
+            invalid.append({"index": index, "errors": [f"Duplicate idempotency_key {key!r} in batch"]})
+            continue
+        rows[key] = item_rows
+        results[key] = {"entry_id": item_rows["entries"][0]["entry_id"], "status": "exists", "errors": []}
+
+    missing_urls = missing_photo_urls({photo["photo_url"] for item_rows in rows.values() for photo in item_rows["photos"]})
+    for key in [key for key, item_rows in rows.items() if any(p["photo_url"] in missing_urls for p in item_rows["photos"])]:
+        del rows[key]
+        results[key]["status"] = "failed"
+        results[key]["errors"].append("A referenced photo does not exist")
+
+    # Rows an earlier attempt already wrote: one query per table, run together
+    id_columns = {"entries": ("text_entries", "entry_id"), "expenses": ("expenses", "expense_id"), "photos": ("photos", "photo_id")}
+
+    def existing(name):
+        table, column = id_columns[name]
+        ids = [row[column] for item_rows in rows.values() for row in item_rows[name]]
+        return get_repository().find_existing_ids(table, column, ids) if ids else set()
+
+    written = {}
+    for name, (ids, error) in run_tasks({name: (lambda name=name: existing(name)) for name in id_columns}).items():
+        if error:
+            raise error
+        written[name] = ids
+
+    def pending(name):
+        column = id_columns[name][1]
+        return [(key, row) for key, item_rows in rows.items() for row in item_rows[name] if row[column] not in written[name]]
+
+    def write(name, pending_rows):
+        table = id_columns[name][0]
+        errors = insert_rows(table, [row for _, row in pending_rows], [key for key, _ in pending_rows])
+        for error in errors:
+            results[error["input"]]["errors"].append({"table": table, "errors": error["errors"]})
+            results[error["input"]]["status"] = "failed"
+        failed = {error["index"] for error in errors}
+        return [(key, row) for i, (key, row) in enumerate(pending_rows) if i not in failed]
+
+    # Entries first, so children are only written for entries that exist
+    new_entries = write("entries", pending("entries"))
+    for key, entry in new_entries:
+        results[key]["status"] = "created"
+        track_entry(entry["entry_id"], user_id, entry["location"])
+    present = {key for key in rows if results[key]["status"] != "failed"}
+
+    children = {
+        name: (lambda name=name: write(name, [(key, row) for key, row in pending(name) if key in present]))
+        for name in ("expenses", "photos")
+    }
+    new_rows = {}
+    for name, (written_rows, error) in run_tasks(children).items():
+        if error:
+            raise error
+        new_rows[name] = written_rows
+
+    for _, entry in new_entries:
+        index_entry(entry["entry_id"], entry["latitude"], entry["longitude"], user_id)
+        index_entry_text(entry["entry_id"], entry, user_id)
+    track_expenses([row for _, row in new_rows["expenses"]])
+
+    return {"results": results, "errors": invalid}
@@ -0,0 +1,131 @@
+import time
+import threading
+from concurrent.futures import Future
+from repository import get_repository
+from config import (
+    INSERT_MICRO_BATCHING,
+    INSERT_BATCH_MAX_ROWS,
+    INSERT_BATCH_MAX_DELAY_MS
+)
+
+def map_insert_errors(errors, inputs):
+    """Map insert errors back onto the inputs the rows came from.
+
+    Repositories report failures as [{"index": i, "errors": [...]}]
+    with i being the row's position in the request.
+    """
+    return [
+        {
+            "index": error["index"],
+            "input": inputs[error["index"]],
+            "errors": error["errors"]
+        }
+        for error in errors
+    ]
+
+def insert_rows(table, rows, inputs=None):
+    """Insert all rows into a table with a single streaming insert call.
+
+    Returns per-row errors mapped to `inputs` (defaults to the rows).
+    """
+    if not rows:
+        return []
+
+    inputs = rows if inputs is None else inputs
+    errors = get_repository().insert_rows(table, rows)
+    return map_insert_errors(errors, inputs)
+
+class InsertBatcher:
+    """Coalesce inserts from concurrent requests into fewer insert calls.
+
+    Rows are buffered per table and flushed once max_rows are pending or the
+    oldest pending row has waited max_delay_ms. Each submit() gets a Future
+    that resolves to the raw per-row errors for the rows it submitted.
+    """
+
+    def __init__(self, max_rows=INSERT_BATCH_MAX_ROWS, max_delay_ms=INSERT_BATCH_MAX_DELAY_MS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="insert-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, table, rows):
+        future = Future()
+        with self._cond:
+            batch = self._pending.setdefault(table, {"since": time.monotonic(), "parts": [], "count": 0})
+            batch["parts"].append((rows, future))
+            batch["count"] += len(rows)
+            self._cond.notify()
+        return future
+
+    def _due_tables(self, now):
+        return [
+            table for table, batch in self._pending.items()
+            if batch["count"] >= self.max_rows or now - batch["since"] >= self.max_delay
+        ]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = self._due_tables(now)
+                    if due:
+                        break
+                    if self._pending:
+                        oldest = min(batch["since"] for batch in self._pending.values())
+                        self._cond.wait(timeout=max(0, oldest + self.max_delay - now))
+                    else:
+                        self._cond.wait()
+                batches = {table: self._pending.pop(table) for table in due}
+
+            for table, batch in batches.items():
+                self._flush(table, batch["parts"])
+
+    def _flush(self, table, parts):
+        rows = [row for part_rows, _ in parts for row in part_rows]
+        try:
+            errors = get_repository().insert_rows(table, rows)
+        except Exception as e:
+            for _, future in parts:
+                future.set_exception(e)
+            return
+
+        # Hand each submitter back only its own rows' errors, re-indexed
+        offset = 0
+        for part_rows, future in parts:
+            part_errors = [
+                {"index": error["index"] - offset, "errors": error["errors"]}
+                for error in errors
+                if offset <= error["index"] < offset + len(part_rows)
+            ]
+            future.set_result(part_errors)
+            offset += len(part_rows)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    """Return the process-wide InsertBatcher, starting it on first use."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = InsertBatcher()
+        return _batcher
+
+def write_rows(table, rows, inputs=None):
+    """Write a request's rows for one table, mapping errors to `inputs`.
+
+    With INSERT_MICRO_BATCHING enabled the rows are merged with other
+    requests' rows before being sent; otherwise they go out in one call.
+    """
+    if not rows:
+        return []
+    if not INSERT_MICRO_BATCHING:
+        return insert_rows(table, rows, inputs)
+
+    inputs = rows if inputs is None else inputs
+    errors = get_batcher().submit(table, rows).result()
+    return map_insert_errors(errors, inputs)
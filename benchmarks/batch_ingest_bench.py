@@ -0,0 +1,80 @@
+"""Compare replaying offline entries one POST /api/entries at a time vs one POST /api/entries/batch.
+
+Runs the app against SQLite with a fixed delay added to every row insert
+and ID existence check, standing in for BigQuery round trips. Each entry
+carries --expenses expenses. The batch is then replayed to time the
+idempotent no-op path.
+
+    python benchmarks/batch_ingest_bench.py --entries 200 --latency-ms 80 --expenses 3
+"""
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def with_latency(fn, seconds):
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return fn(*args, **kwargs)
+    return call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--expenses", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.update(DATA_BACKEND="sqlite", LOCAL_DB_PATH=":memory:", STORAGE_BACKEND="local",
+                      LOCAL_STORAGE_DIR=tempfile.mkdtemp(), TRACE_LOGS="false")
+    sys.path.insert(0, ROOT)
+    import sqlite_repository
+    from app import app
+
+    delay = args.latency_ms / 1000
+    repository = sqlite_repository.SQLiteRepository
+    repository.insert_rows = with_latency(repository.insert_rows, delay)
+    repository.find_existing_ids = with_latency(repository.find_existing_ids, delay)
+
+    client = app.test_client()
+    entries = [
+        {
+            "idempotency_key": f"batch-bench-{i:08d}",
+            "title": f"Entry {i}",
+            "content": "Benchmark entry",
+            "location": "Lisbon",
+            "expenses": [{"category": "Food", "amount": j + 1} for j in range(args.expenses)],
+        }
+        for i in range(args.entries)
+    ]
+
+    start = time.perf_counter()
+    for entry in entries:
+        response = client.post("/api/entries", data={
+            "title": entry["title"],
+            "content": entry["content"],
+            "location": entry["location"],
+            "expenses": [f"Food:{expense['amount']}" for expense in entry["expenses"]],
+        }, content_type="multipart/form-data")
+        assert response.status_code == 201, response.get_json()
+    one_by_one = time.perf_counter() - start
+
+    timings = {}
+    for mode in ("batch", "replay"):
+        start = time.perf_counter()
+        response = client.post("/api/entries/batch", json={
+            "user_id": "bench-user", "device_id": "bench-device", "entries": entries
+        })
+        assert response.status_code == 200, response.get_json()
+        timings[mode] = time.perf_counter() - start
+
+    print(f"{args.entries} entries, {args.expenses} expenses each, {args.latency_ms:g} ms per backend call")
+    print(f"{'mode':<12}{'seconds':>10}{'entries/s':>12}")
+    for mode, seconds in (("one-by-one", one_by_one), ("batch", timings["batch"]), ("replay", timings["replay"])):
+        print(f"{mode:<12}{seconds:>10.2f}{args.entries / seconds:>12.1f}")
+
+if __name__ == "__main__":
+    main()
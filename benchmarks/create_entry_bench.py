@@ -0,0 +1,95 @@
+"""Compare POST /api/entries latency with its stages run sequentially vs fanned out.
+
+Runs the app against SQLite and local storage with a fixed delay added to
+every row insert, ID existence check and blob upload, standing in for
+BigQuery and Cloud Storage round trips. Each entry carries --photos photos
+and --expenses expenses. Each mode (CREATE_ENTRY_FAN_OUT=false/true) runs
+in a fresh interpreter.
+
+    python benchmarks/create_entry_bench.py --requests 50 --latency-ms 80 --photos 3 --expenses 3
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def with_latency(fn, seconds):
+    import time
+
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return fn(*args, **kwargs)
+    return call
+
+def run_child(args):
+    import io
+    import time
+    sys.path.insert(0, ROOT)
+    from PIL import Image
+    import sqlite_repository
+    import storage_backend
+    from app import app
+
+    delay = args.latency_ms / 1000
+    repository = sqlite_repository.SQLiteRepository
+    repository.insert_rows = with_latency(repository.insert_rows, delay)
+    repository.find_existing_ids = with_latency(repository.find_existing_ids, delay)
+    storage_backend.LocalBlob.upload_from_string = with_latency(storage_backend.LocalBlob.upload_from_string, delay)
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "teal").save(buffer, "JPEG")
+    photo = buffer.getvalue()
+
+    client = app.test_client()
+    timings = []
+    for i in range(args.requests + 1):
+        start = time.perf_counter()
+        response = client.post("/api/entries", data={
+            "title": f"Entry {i}",
+            "content": "Benchmark entry",
+            "location": "Lisbon",
+            "expenses": [f"Food:{j + 1}" for j in range(args.expenses)],
+            "photos": [(io.BytesIO(photo), f"photo{j}.jpg") for j in range(args.photos)],
+        }, content_type="multipart/form-data")
+        assert response.status_code == 201, response.get_json()
+        if i:  # the first request starts the image pool
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "p50": statistics.median(timings),
+        "p95": sorted(timings)[int(0.95 * (len(timings) - 1))],
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--photos", type=int, default=3)
+    parser.add_argument("--expenses", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    print(f"{args.requests} entries, {args.photos} photos and {args.expenses} expenses each, "
+          f"{args.latency_ms:g} ms per backend call")
+    print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, fan_out in (("sequential", "false"), ("fan-out", "true")):
+        with tempfile.TemporaryDirectory() as storage_dir:
+            env = dict(os.environ, DATA_BACKEND="sqlite", LOCAL_DB_PATH=":memory:", STORAGE_BACKEND="local",
+                       LOCAL_STORAGE_DIR=storage_dir, TRACE_LOGS="false", CREATE_ENTRY_FAN_OUT=fan_out)
+            command = [sys.executable, os.path.abspath(__file__), "--child",
+                       "--requests", str(args.requests), "--latency-ms", str(args.latency_ms),
+                       "--photos", str(args.photos), "--expenses", str(args.expenses)]
+            output = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<12}{result['p50']:>10.1f}{result['p95']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Time currency conversion of N expense rows against a per-row Python loop.
+
+Generates N amounts with random currencies and dates from the rates table
+and converts them to one currency with RatesTable.convert, then does the
+same for a sample of the rows with a plain dict lookup per row and
+extrapolates, since the loop is too slow to run on millions of rows.
+
+    python benchmarks/currency_bench.py --rows 5000000 --to EUR
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from currency import get_rates
+
+def make_rows(n_rows, rates, rng):
+    currencies = np.array(rates.currencies + [None], dtype=object)
+    days = (rates.dates[-1] - rates.dates[0]).astype(int) + 60
+    return (
+        rng.uniform(1, 500, n_rows).round(2),
+        currencies[rng.integers(0, len(currencies), n_rows)],
+        rates.dates[0] + rng.integers(0, days, n_rows).astype("timedelta64[D]"),
+    )
+
+def convert_per_row(amounts, currencies, dates, target, rates):
+    # What a caller without the vectorized path would write
+    table = {}
+    for row, date in enumerate(rates.dates):
+        for column, currency in enumerate(rates.currencies):
+            table[(date, currency)] = rates.matrix[row, column]
+    converted = []
+    for amount, currency, date in zip(amounts, currencies, dates):
+        rate_date = rates.dates[max(0, np.searchsorted(rates.dates, date, side="right") - 1)]
+        source = table[(rate_date, currency or "USD")]
+        converted.append(amount / source * table[(rate_date, target)])
+    return converted
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--loop-sample", type=int, default=100_000)
+    parser.add_argument("--to", default="EUR")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rates = get_rates()
+    amounts, currencies, dates = make_rows(args.rows, rates, np.random.default_rng(args.seed))
+
+    start = time.perf_counter()
+    converted = rates.convert(amounts, currencies, dates, args.to)
+    vectorized = time.perf_counter() - start
+
+    sample = min(args.loop_sample, args.rows)
+    start = time.perf_counter()
+    looped = convert_per_row(amounts[:sample], currencies[:sample], dates[:sample], args.to, rates)
+    loop = (time.perf_counter() - start) * args.rows / sample
+
+    assert np.allclose(converted[:sample], looped)
+    print(f"{args.rows:,} rows -> {args.to}, {len(rates.currencies)} currencies, {len(rates.dates)} rate dates")
+    print(f"vectorized: {vectorized * 1000:10.1f} ms ({args.rows / vectorized / 1e6:.1f}M rows/s)")
+    print(f"per-row:    {loop * 1000:10.1f} ms (extrapolated from {sample:,} rows)")
+    print(f"speedup:    {loop / vectorized:10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compare the old fan-out feed query with the pre-aggregated one.
+
+Seeds an in-memory SQLite database from entries.csv, photos.csv and
+expenses.csv, scaled up to a synthetic feed, and runs both query shapes.
+SQLite stands in for BigQuery here: the point is the intermediate row
+count (what BigQuery scans and shuffles), not absolute timings.
+
+    python benchmarks/feed_query_bench.py --entries 20000 --photos 10 --expenses 20
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAN_OUT_QUERY = """
+    SELECT t.entry_id,
+           json_group_array(p.photo_url) AS photo_urls,
+           json_group_array(e.category) AS expense_categories
+    FROM text_entries t
+    LEFT JOIN photos p ON t.entry_id = p.entry_id
+    LEFT JOIN expenses e ON t.entry_id = e.entry_id
+    LEFT JOIN users u ON t.user_id = u.user_id
+    GROUP BY t.entry_id
+"""
+
+FAN_OUT_ROWS = """
+    SELECT COUNT(*)
+    FROM text_entries t
+    LEFT JOIN photos p ON t.entry_id = p.entry_id
+    LEFT JOIN expenses e ON t.entry_id = e.entry_id
+"""
+
+PRE_AGGREGATED_QUERY = """
+    WITH photo_agg AS (
+        SELECT entry_id, json_group_array(photo_url) AS photo_urls
+        FROM photos GROUP BY entry_id
+    ),
+    expense_agg AS (
+        SELECT entry_id, json_group_array(json_object(
+            'expense_id', expense_id, 'category', category,
+            'amount', amount, 'currency', currency)) AS expenses
+        FROM expenses GROUP BY entry_id
+    )
+    SELECT t.entry_id, pa.photo_urls, ea.expenses
+    FROM text_entries t
+    LEFT JOIN photo_agg pa ON pa.entry_id = t.entry_id
+    LEFT JOIN expense_agg ea ON ea.entry_id = t.entry_id
+    LEFT JOIN users u ON t.user_id = u.user_id
+"""
+
+PRE_AGGREGATED_ROWS = """
+    SELECT (SELECT COUNT(*) FROM text_entries)
+         + (SELECT COUNT(*) FROM photos)
+         + (SELECT COUNT(*) FROM expenses)
+"""
+
+def read_csv(name):
+    with open(os.path.join(ROOT, name), newline="") as f:
+        return list(csv.DictReader(f))
+
+def seed(db, n_entries, photos_per_entry, expenses_per_entry):
+    """Create the feed tables and fill them with rows cloned from the CSVs."""
+    entries = read_csv("entries.csv")
+    photos = read_csv("photos.csv")
+    expenses = read_csv("expenses.csv")
+
+    db.executescript("""
+        CREATE TABLE users (user_id TEXT PRIMARY KEY, full_name TEXT);
+        CREATE TABLE text_entries (entry_id TEXT PRIMARY KEY, user_id TEXT, title TEXT, created_at TEXT);
+        CREATE TABLE photos (photo_id TEXT, entry_id TEXT, photo_url TEXT);
+        CREATE TABLE expenses (expense_id TEXT, entry_id TEXT, category TEXT, amount REAL, currency TEXT);
+        CREATE INDEX photos_entry ON photos (entry_id);
+        CREATE INDEX expenses_entry ON expenses (entry_id);
+    """)
+
+    user_ids = sorted({row["user_id"] for row in entries})
+    db.executemany("INSERT INTO users VALUES (?, ?)", [(u, u.title()) for u in user_ids])
+
+    for i in range(n_entries):
+        template = entries[i % len(entries)]
+        entry_id = f"entry{i:08d}"
+        db.execute(
+            "INSERT INTO text_entries VALUES (?, ?, ?, ?)",
+            (entry_id, template["user_id"], template["title"], template["created_at"]),
+        )
+        db.executemany("INSERT INTO photos VALUES (?, ?, ?)", [
+            (f"{entry_id}-p{j}", entry_id, photos[j % len(photos)]["photo_url"])
+            for j in range(photos_per_entry)
+        ])
+        db.executemany("INSERT INTO expenses VALUES (?, ?, ?, ?, ?)", [
+            (f"{entry_id}-e{j}", entry_id, expenses[j % len(expenses)]["category"],
+             float(expenses[j % len(expenses)]["amount"]), expenses[j % len(expenses)]["currency"])
+            for j in range(expenses_per_entry)
+        ])
+    db.commit()
+
+def timed(db, query, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(query).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--photos", type=int, default=10, help="photos per entry")
+    parser.add_argument("--expenses", type=int, default=20, help="expenses per entry")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    seed(db, args.entries, args.photos, args.expenses)
+
+    fan_out_rows = db.execute(FAN_OUT_ROWS).fetchone()[0]
+    pre_agg_rows = db.execute(PRE_AGGREGATED_ROWS).fetchone()[0]
+    fan_out_time = timed(db, FAN_OUT_QUERY, args.repeat)
+    pre_agg_time = timed(db, PRE_AGGREGATED_QUERY, args.repeat)
+
+    print(f"{args.entries} entries, {args.photos} photos and {args.expenses} expenses per entry")
+    print(f"{'query':<16}{'joined rows':>14}{'best time (s)':>16}")
+    print(f"{'fan-out':<16}{fan_out_rows:>14}{fan_out_time:>16.3f}")
+    print(f"{'pre-aggregated':<16}{pre_agg_rows:>14}{pre_agg_time:>16.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Offline load test for the API routes.
+
+Runs the Flask app in-process against the SQLite repository and local
+photo storage, seeded from the bundled CSVs and scaled up to a synthetic
+dataset. Worker threads then drive a weighted mix of feed pages,
+searches, photo listings, entry creation and deletes. Latency percentiles
+and throughput are reported per route. --save writes the results as a
+baseline; --compare fails when a route's p95 regresses past --tolerance.
+
+    python benchmarks/load_test.py --entries 1000000 --requests 20000 --concurrency 8 --save benchmarks/baselines/load_test.json
+    python benchmarks/load_test.py --entries 1000000 --requests 20000 --compare benchmarks/baselines/load_test.json
+"""
+import os
+import io
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Route name -> weight in the request mix
+MIX = {
+    "GET /api/entries": 30,
+    "GET /api/entries/search": 15,
+    "GET /api/entries/search?q": 5,
+    "GET /api/expenses/search": 15,
+    "GET /api/photos": 10,
+    "POST /api/entries": 15,
+    "DELETE /api/entries": 5,
+    "DELETE /api/photos/delete": 5,
+}
+
+WORDS = ["beach", "museum", "market", "hike", "sunset", "temple", "train", "harbour", "cafe", "festival",
+         "mountain", "river", "old town", "street food", "gallery", "castle", "island", "desert"]
+CITIES = [("Lisbon", 38.72, -9.14), ("Kyoto", 35.01, 135.77), ("Cape Town", -33.92, 18.42),
+          ("Mexico City", 19.43, -99.13), ("Hanoi", 21.03, 105.85), ("Reykjavik", 64.15, -21.94),
+          ("Buenos Aires", -34.60, -58.38), ("Barcelona", 41.39, 2.17), ("London", 51.51, -0.13)]
+CATEGORIES = ["Food", "Transportation", "Accommodation", "Activities", "Shopping"]
+
+def configure_environment(db_path, storage_dir):
+    # Must run before anything imports config
+    os.environ.update(
+        DATA_BACKEND="sqlite",
+        LOCAL_DB_PATH=db_path,
+        STORAGE_BACKEND="local",
+        LOCAL_STORAGE_DIR=storage_dir,
+        TRACE_LOGS="false",
+    )
+    sys.path.insert(0, ROOT)
+
+def seed(repository, n_entries, n_users, photos_per_entry, expenses_per_entry, rng, chunk=10000):
+    """Add synthetic users, entries, photos and expenses next to the CSV rows."""
+    start = datetime(2022, 1, 1)
+    repository.insert_rows("users", [
+        {"user_id": f"user{u}", "email": f"user{u}@example.com", "password_hash": "x",
+         "full_name": f"Traveller {u}", "created_at": (start + timedelta(minutes=u)).strftime("%Y-%m-%d %H:%M:%S")}
+        for u in range(n_users)
+    ])
+
+    for offset in range(0, n_entries, chunk):
+        entries, photos, expenses = [], [], []
+        for i in range(offset, min(offset + chunk, n_entries)):
+            city, lat, lon = CITIES[i % len(CITIES)]
+            entry_id = f"synthetic{i:08d}"
+            user_id = f"user{rng.randrange(n_users)}"
+            entries.append({
+                "entry_id": entry_id,
+                "title": f"{rng.choice(WORDS).title()} in {city}",
+                "content": " ".join(rng.choices(WORDS, k=12)),
+                "location": city,
+                "latitude": lat + rng.uniform(-0.5, 0.5),
+                "longitude": lon + rng.uniform(-0.5, 0.5),
+                "created_at": (start + timedelta(seconds=i * 30)).strftime("%Y-%m-%d %H:%M:%S"),
+                "user_id": user_id,
+            })
+            photos.extend({
+                "photo_id": f"{entry_id}-p{j}", "entry_id": entry_id, "user_id": user_id,
+                "photo_url": f"https://example.com/{entry_id}-{j}.jpg",
+            } for j in range(photos_per_entry))
+            expenses.extend({
+                "expense_id": f"{entry_id}-e{j}", "entry_id": entry_id, "user_id": user_id,
+                "category": rng.choice(CATEGORIES), "amount": round(rng.uniform(2, 200), 2), "currency": "USD",
+            } for j in range(expenses_per_entry))
+        repository.insert_rows("text_entries", entries)
+        repository.insert_rows("photos", photos)
+        repository.insert_rows("expenses", expenses)
+
+def sample_photo(size=(1600, 1200)):
+    """A camera-sized JPEG for entry uploads, so the image pipeline does real work."""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize(size).convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+class Workload:
+    """Builds randomized requests for each route in MIX."""
+
+    def __init__(self, n_entries, n_users, photos_per_entry, rng):
+        self.n_entries = n_entries
+        self.n_users = n_users
+        self.photos_per_entry = photos_per_entry
+        self.rng = rng
+        self.photo = sample_photo()
+        self.cursors = []
+        self.created = []
+        self.lock = threading.Lock()
+
+    def entry_id(self):
+        return f"synthetic{self.rng.randrange(self.n_entries):08d}"
+
+    def request(self, client, route):
+        rng = self.rng
+        if route == "GET /api/entries":
+            with self.lock:
+                cursor = rng.choice(self.cursors) if self.cursors and rng.random() < 0.5 else None
+            url = f"/api/entries?limit={rng.choice([10, 20, 50])}" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            next_cursor = (response.get_json() or {}).get("next_cursor")
+            if next_cursor:
+                with self.lock:
+                    self.cursors = (self.cursors + [next_cursor])[-1000:]
+            return response
+        if route == "GET /api/entries/search":
+            params = rng.choice([
+                f"user_id=user{rng.randrange(self.n_users)}",
+                f"entry_id={self.entry_id()}",
+                f"location={rng.choice(CITIES)[0]}",
+                f"title={rng.choice(WORDS)}",
+            ])
+            return client.get(f"/api/entries/search?{params}")
+        if route == "GET /api/entries/search?q":
+            return client.get(f"/api/entries/search?q={rng.choice(WORDS)}+{rng.choice(CITIES)[0]}")
+        if route == "GET /api/expenses/search":
+            params = rng.choice([
+                f"entry_id={self.entry_id()}",
+                f"user_id=user{rng.randrange(self.n_users)}",
+            ])
+            return client.get(f"/api/expenses/search?{params}")
+        if route == "GET /api/photos":
+            return client.get(f"/api/photos?entry_id={self.entry_id()}")
+        if route == "POST /api/entries":
+            city, lat, lon = rng.choice(CITIES)
+            response = client.post("/api/entries", data={
+                "title": f"{rng.choice(WORDS).title()} in {city}",
+                "content": " ".join(rng.choices(WORDS, k=12)),
+                "location": city,
+                "latitude": str(lat),
+                "longitude": str(lon),
+                "expenses": [f"{rng.choice(CATEGORIES)}:{rng.randint(1, 100)}"],
+                "photos": [(io.BytesIO(self.photo), "photo.jpg")],
+            }, content_type="multipart/form-data")
+            entry_id = (response.get_json() or {}).get("entry_id")
+            if entry_id:
+                with self.lock:
+                    self.created.append(entry_id)
+            return response
+        if route == "DELETE /api/entries":
+            with self.lock:
+                entry_id = self.created.pop() if self.created else self.entry_id()
+            return client.delete(f"/api/entries?entry_id={entry_id}")
+        if route == "DELETE /api/photos/delete":
+            photo_id = f"{self.entry_id()}-p{rng.randrange(max(self.photos_per_entry, 1))}"
+            return client.delete(f"/api/photos/delete?photo_id={photo_id}")
+        raise ValueError(route)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+def run(app, workload, n_requests, concurrency, seed_value):
+    routes = list(MIX)
+    weights = [MIX[route] for route in routes]
+    plan = random.Random(seed_value).choices(routes, weights, k=n_requests)
+    timings = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    position = iter(range(n_requests))
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                return
+            route = plan[index]
+            start = time.perf_counter()
+            try:
+                status = workload.request(client, route).status_code
+            except Exception:
+                status = 599
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings[route].append(elapsed)
+                if status >= 500:
+                    errors[route] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    results = {}
+    for route in routes:
+        values = timings[route]
+        results[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "p50_ms": percentile(values, 0.5),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+            "throughput_rps": len(values) / wall if wall else None,
+        }
+    return results, wall
+
+def compare(results, baseline, tolerance):
+    """Return the routes whose p95 exceeds the baseline's by more than tolerance."""
+    regressions = []
+    for route, result in results.items():
+        before = baseline["routes"].get(route, {}).get("p95_ms")
+        if before and result["p95_ms"] and result["p95_ms"] > before * (1 + tolerance):
+            regressions.append((route, before, result["p95_ms"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--photos", type=int, default=2, help="photos per entry")
+    parser.add_argument("--expenses", type=int, default=3, help="expenses per entry")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="baseline file to check for p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="nomadnest-load-")
+    configure_environment(os.path.join(workdir, "load.db"), os.path.join(workdir, "storage"))
+
+    from app import create_app
+    from repository import get_repository
+    from geo_index import get_geo_index
+    from text_index import get_text_index
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    repository = get_repository()
+    seed(repository, args.entries, args.users, args.photos, args.expenses, rng)
+    print(f"seeded {args.entries} entries in {time.perf_counter() - start:.1f}s")
+
+    # Build the in-memory indexes up front so their build isn't timed as a request
+    start = time.perf_counter()
+    get_geo_index()
+    get_text_index()
+    print(f"built indexes in {time.perf_counter() - start:.1f}s")
+
+    app = create_app()
+    workload = Workload(args.entries, args.users, args.photos, rng)
+    results, wall = run(app, workload, args.requests, args.concurrency, args.seed)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"{wall:.1f}s, {args.requests / wall:.1f} req/s overall")
+    print(f"{'route':<30}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}")
+    for route, result in results.items():
+        if not result["requests"]:
+            continue
+        print(f"{route:<30}{result['requests']:>7}{result['errors']:>8}{result['p50_ms']:>9.2f}"
+              f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['throughput_rps']:>8.1f}")
+
+    report = {
+        "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "wall_seconds": wall,
+        "routes": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for route, before, after in regressions:
+            print(f"REGRESSION {route}: p95 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"no p95 regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
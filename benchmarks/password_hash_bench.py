@@ -0,0 +1,107 @@
+"""Measure feed latency while logins run, with hashing inline vs in the process pool.
+
+Each mode runs in a fresh interpreter against the SQLite repository: feed
+threads page through GET /api/entries while login threads POST /login for
+registered users. "feed-only" has no logins, "inline" hashes on the
+request threads (PASSWORD_HASH_WORKERS=0) and "pool" uses the hashing
+process pool. Logins turned away with 503 by backpressure are counted
+separately.
+
+    python benchmarks/password_hash_bench.py --seconds 10 --feed-threads 4 --login-threads 8
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "feed-only": {"PASSWORD_HASH_WORKERS": "2"},
+    "inline": {"PASSWORD_HASH_WORKERS": "0"},
+    "pool": {},
+}
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else float("nan")
+
+def run_child(args):
+    import threading
+    import time
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    client = app.test_client()
+    users = [f"bench{i}@example.com" for i in range(args.users)]
+    for email in users:
+        client.post("/register", data={"email": email, "password": "correct horse", "full_name": "Bench User"})
+
+    stop = time.perf_counter() + args.seconds
+    feed_ms, logins = [], {"ok": 0, "busy": 0, "other": 0}
+    lock = threading.Lock()
+
+    def feed():
+        local = app.test_client()
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            local.get("/api/entries?limit=20")
+            with lock:
+                feed_ms.append(time.perf_counter() - start)
+
+    def login(i):
+        local = app.test_client()
+        while time.perf_counter() < stop:
+            status = local.post("/login", data={"email": users[i % len(users)], "password": "correct horse"}).status_code
+            with lock:
+                logins["ok" if status == 200 else "busy" if status == 503 else "other"] += 1
+            if status == 503:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=feed) for _ in range(args.feed_threads)]
+    if args.mode != "feed-only":
+        threads += [threading.Thread(target=login, args=(i,)) for i in range(args.login_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        "feed_requests": len(feed_ms),
+        "feed_p50": percentile(feed_ms, 0.50),
+        "feed_p95": percentile(feed_ms, 0.95),
+        "feed_p99": percentile(feed_ms, 0.99),
+        "logins": logins,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--feed-threads", type=int, default=4)
+    parser.add_argument("--login-threads", type=int, default=8)
+    parser.add_argument("--child", dest="mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_child(args)
+
+    print(f"{args.seconds:g}s per mode, {args.feed_threads} feed threads, {args.login_threads} login threads, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'mode':<10}{'feed req/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'logins/s':>10}{'503s':>8}")
+    for mode, overrides in MODES.items():
+        env = dict(os.environ, DATA_BACKEND="sqlite", LOCAL_DB_PATH=":memory:", STORAGE_BACKEND="local",
+                   TRACE_LOGS="false", **overrides)
+        command = [sys.executable, os.path.abspath(__file__), "--child", mode,
+                   "--seconds", str(args.seconds), "--users", str(args.users),
+                   "--feed-threads", str(args.feed_threads), "--login-threads", str(args.login_threads)]
+        output = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['feed_requests'] / args.seconds:>12.1f}{result['feed_p50']:>10.1f}"
+              f"{result['feed_p95']:>10.1f}{result['feed_p99']:>10.1f}"
+              f"{result['logins']['ok'] / args.seconds:>10.1f}{result['logins']['busy']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure app import time and first-request latency in fresh interpreters.
+
+Each run starts a new Python process, imports app and sends one request
+through the Flask test client. --eager imports google.cloud and builds the
+BigQuery and Storage clients before importing app, which is what every
+worker used to do at import time; it needs credentials to build them.
+
+    DATA_BACKEND=sqlite STORAGE_BACKEND=local python benchmarks/startup_bench.py --runs 10
+    python benchmarks/startup_bench.py --runs 10 --eager --path /api/entries?limit=1
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+eager_error = None
+if {eager!r}:
+    try:
+        from google.cloud import bigquery, storage
+        bigquery.Client(project="nomads-nest")
+        storage.Client()
+    except Exception as e:
+        eager_error = str(e)
+import app
+imported = time.perf_counter()
+google_loaded = any(name.startswith("google.cloud") for name in sys.modules)
+response = app.app.test_client().get({path!r})
+done = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (done - imported) * 1000,
+    "status": response.status_code,
+    "google_loaded_at_import": google_loaded,
+    "eager_error": eager_error,
+}}))
+"""
+
+def run_once(path, eager):
+    code = CHILD.format(root=ROOT, path=path, eager=eager)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--eager", action="store_true", help="build the clients up front, like before")
+    args = parser.parse_args()
+
+    results = [run_once(args.path, args.eager) for _ in range(args.runs)]
+    import_ms = [result["import_ms"] for result in results]
+    request_ms = [result["first_request_ms"] for result in results]
+
+    print(f"{args.runs} runs, GET {args.path} -> {results[-1]['status']}, "
+          f"DATA_BACKEND={os.getenv('DATA_BACKEND', 'bigquery')}, "
+          f"STORAGE_BACKEND={os.getenv('STORAGE_BACKEND', 'gcs')}, eager={args.eager}")
+    if results[-1]["eager_error"]:
+        print(f"client construction failed: {results[-1]['eager_error']}")
+    print(f"google.cloud imported with app: {results[-1]['google_loaded_at_import']}")
+    print(f"{'':<16}{'median ms':>12}{'max ms':>10}")
+    print(f"{'import':<16}{statistics.median(import_ms):>12.1f}{max(import_ms):>10.1f}")
+    print(f"{'first request':<16}{statistics.median(request_ms):>12.1f}{max(request_ms):>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Measure full-text search latency on a synthetic corpus.
+
+Builds a TextIndex over N generated entries and times single-term,
+multi-term and prefix queries against it, next to the LIKE scan that
+search_entries used before (run on SQLite, which stands in for BigQuery).
+The first query for a common term builds its champion list, so each query
+set is run once cold and then again warm; the target applies to warm runs.
+
+    python benchmarks/text_search_bench.py --entries 100000 --queries 500 --target-p95-ms 10
+"""
+import os
+import sys
+import random
+import sqlite3
+import argparse
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_index import TextIndex
+
+LOCATIONS = ["Barcelona", "Lisbon", "Kyoto", "Mexico City", "Cape Town", "Hanoi", "Reykjavik", "Buenos Aires"]
+
+def make_vocabulary(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def make_corpus(n_entries, vocabulary, rng):
+    # Zipf-like word choice, so a few words are common and most are rare
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    corpus = []
+    for i in range(n_entries):
+        corpus.append({
+            "entry_id": f"entry{i:08d}",
+            "user_id": f"user{i % 500}",
+            "title": " ".join(rng.choices(vocabulary, weights, k=rng.randint(2, 6))),
+            "content": " ".join(rng.choices(vocabulary, weights, k=rng.randint(20, 120))),
+            "location": rng.choice(LOCATIONS),
+        })
+    return corpus
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def time_queries(run, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--like-queries", type=int, default=20, help="LIKE scans to time (they are slow)")
+    parser.add_argument("--target-p95-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    corpus = make_corpus(args.entries, vocabulary, rng)
+
+    start = time.perf_counter()
+    index = TextIndex()
+    for row in corpus:
+        index.add(row["entry_id"], row, row["user_id"])
+    build_time = time.perf_counter() - start
+
+    common = vocabulary[:200]
+    query_sets = {
+        "single term": [rng.choice(vocabulary) for _ in range(args.queries)],
+        "common term": [rng.choice(common) for _ in range(args.queries)],
+        "three terms": [" ".join(rng.sample(vocabulary, 3)) for _ in range(args.queries)],
+        "prefix": [rng.choice(vocabulary)[:3] for _ in range(args.queries)],
+    }
+
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE text_entries (entry_id TEXT, title TEXT, content TEXT, location TEXT)")
+    db.executemany(
+        "INSERT INTO text_entries VALUES (:entry_id, :title, :content, :location)", corpus
+    )
+
+    def like_scan(term):
+        db.execute(
+            "SELECT entry_id FROM text_entries WHERE LOWER(title) LIKE '%' || ? || '%'"
+            " OR LOWER(content) LIKE '%' || ? || '%' OR LOWER(location) LIKE '%' || ? || '%'",
+            (term, term, term)
+        ).fetchall()
+
+    print(f"{args.entries} entries, {args.vocabulary} word vocabulary, index built in {build_time:.2f}s")
+    print(f"{'query':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    def report(name, timings):
+        print(f"{name:<22}{percentile(timings, 0.5):>10.3f}{percentile(timings, 0.95):>10.3f}{percentile(timings, 0.99):>10.3f}")
+
+    failed = False
+    for name, queries in query_sets.items():
+        report(f"{name} (cold)", time_queries(lambda q: index.search(q, args.limit), queries))
+        timings = time_queries(lambda q: index.search(q, args.limit), queries)
+        failed |= percentile(timings, 0.95) > args.target_p95_ms
+        report(f"{name} (warm)", timings)
+
+    report("LIKE scan", time_queries(like_scan, query_sets["single term"][:args.like_queries]))
+
+    print(f"p95 target {args.target_p95_ms} ms: {'FAIL' if failed else 'ok'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
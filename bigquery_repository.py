@@ -0,0 +1,290 @@
+from google.cloud import bigquery
+from config import PROJECT_ID, DATASET_NAME, MAX_PAGE_SIZE
+from clients import get_bigquery_client
+from metrics import record_bigquery_job
+from feed_query import build_feed_query
+from repository import Repository, USER_PUBLIC_FIELDS
+
+# Filters each query accepts: parameter name -> (condition, BigQuery type)
+ENTRY_FILTERS = {
+    "user_id": ("CAST(t.user_id AS STRING) = @user_id", "STRING"),
+    "entry_id": ("t.entry_id = @entry_id", "STRING"),
+    "location": ("LOWER(t.location) LIKE CONCAT('%', LOWER(@location), '%')", "STRING"),
+    "title": ("LOWER(t.title) LIKE CONCAT('%', LOWER(@title), '%')", "STRING"),
+    "latitude": ("t.latitude = @latitude", "FLOAT64"),
+    "longitude": ("t.longitude = @longitude", "FLOAT64"),
+}
+
+EXPENSE_FILTERS = {
+    "entry_id": ("e.entry_id = @entry_id", "STRING"),
+    "user_id": ("t.user_id = @user_id", "STRING"),
+    "category": ("e.category = @category", "STRING"),
+}
+
+PHOTO_FILTERS = {
+    "photo_id": ("photo_id = @photo_id", "STRING"),
+    "entry_id": ("entry_id = @entry_id", "STRING"),
+    "user_id": ("CAST(user_id AS STRING) = @user_id", "STRING"),
+}
+
+USER_FILTERS = {
+    "user_id": ("user_id = @user_id", "STRING"),
+    "email": ("email = @email", "STRING"),
+    "name": ("LOWER(full_name) LIKE CONCAT('%', LOWER(@name), '%')", "STRING"),
+}
+
+EXPENSE_UPDATE_FIELDS = {"amount": "FLOAT64", "category": "STRING", "currency": "STRING"}
+
+def build_conditions(filters, allowed):
+    """Turn a filter dict into SQL conditions and matching query parameters."""
+    conditions = []
+    query_params = []
+    for name, value in filters.items():
+        condition, type_ = allowed[name]
+        conditions.append(condition)
+        query_params.append(bigquery.ScalarQueryParameter(
+            name, type_, float(value) if type_ == "FLOAT64" else value
+        ))
+    return conditions, query_params
+
+class BigQueryRepository(Repository):
+    """Repository backed by the NomadNest BigQuery dataset."""
+
+    def table(self, name):
+        return f"`{PROJECT_ID}.{DATASET_NAME}.{name}`"
+
+    def query(self, operation, sql, query_params=(), **result_args):
+        """Run a query, wait for it and return its rows; bytes processed go to /metrics."""
+        job_config = bigquery.QueryJobConfig(query_parameters=list(query_params))
+        query_job = get_bigquery_client().query(sql, job_config=job_config)
+        rows = query_job.result(**result_args)
+        record_bigquery_job(operation, query_job)
+        return rows
+
+    def iter_feed(self, limit, cursor=None):
+        conditions = []
+        query_params = [bigquery.ScalarQueryParameter("limit", "INT64", limit)]
+
+        if cursor:
+            conditions.append(
+                "(t.created_at < @cursor_created_at"
+                " OR (t.created_at = @cursor_created_at AND t.entry_id < @cursor_entry_id))"
+            )
+            query_params.append(bigquery.ScalarQueryParameter("cursor_created_at", "TIMESTAMP", cursor[0]))
+            query_params.append(bigquery.ScalarQueryParameter("cursor_entry_id", "STRING", cursor[1]))
+
+        # Wait for the job here so query errors surface before streaming starts
+        return self.query(
+            "iter_feed", build_feed_query(conditions, limit=True), query_params,
+            page_size=min(limit, MAX_PAGE_SIZE)
+        )
+
+    def search_entries(self, filters):
+        conditions, query_params = build_conditions(filters, ENTRY_FILTERS)
+        return self.query("search_entries", build_feed_query(conditions), query_params)
+
+    def get_entries(self, entry_ids):
+        query_params = [bigquery.ArrayQueryParameter("entry_ids", "STRING", list(entry_ids))]
+        return self.query("get_entries", build_feed_query(["t.entry_id IN UNNEST(@entry_ids)"]), query_params)
+
+    def list_entry_texts(self):
+        query = f"""
+            SELECT entry_id, CAST(user_id AS STRING) AS user_id, title, content, location
+            FROM {self.table("text_entries")}
+        """
+        return self.query("list_entry_texts", query)
+
+    def list_entry_locations(self):
+        query = f"""
+            SELECT entry_id, CAST(user_id AS STRING) AS user_id, latitude, longitude
+            FROM {self.table("text_entries")}
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        """
+        return self.query("list_entry_locations", query)
+
+    def search_expenses(self, filters):
+        conditions, query_params = build_conditions(filters, EXPENSE_FILTERS)
+        query = f"""
+            SELECT
+                e.entry_id,
+                e.expense_id,
+                t.user_id,
+                e.category,
+                e.amount,
+                e.currency,
+                t.title,
+                t.location,
+                t.created_at,
+                u.full_name,
+                u.profile_pic_url
+            FROM {self.table("expenses")} e
+            JOIN {self.table("text_entries")} t ON e.entry_id = t.entry_id
+            LEFT JOIN {self.table("users")} u ON t.user_id = u.user_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY t.created_at DESC
+        """
+        return self.query("search_expenses", query, query_params)
+
+    def list_expense_facts(self):
+        query = f"""
+            SELECT
+                e.expense_id,
+                e.entry_id,
+                CAST(t.user_id AS STRING) AS user_id,
+                e.category,
+                e.currency,
+                e.amount,
+                t.location,
+                COALESCE(e.created_at, t.created_at) AS created_at
+            FROM {self.table("expenses")} e
+            JOIN {self.table("text_entries")} t ON e.entry_id = t.entry_id
+        """
+        return self.query("list_expense_facts", query)
+
+    def update_expense(self, entry_id, expense_id, fields):
+        assignments = []
+        query_params = [
+            bigquery.ScalarQueryParameter("expense_id", "STRING", expense_id),
+            bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id)
+        ]
+        for name, value in fields.items():
+            type_ = EXPENSE_UPDATE_FIELDS[name]
+            assignments.append(f"{name} = @new_{name}")
+            query_params.append(bigquery.ScalarQueryParameter(f"new_{name}", type_, value))
+
+        # Streaming-inserted rows can't be updated until they leave the
+        # streaming buffer, which can take from 30 minutes to a few hours
+        query = f"""
+            UPDATE {self.table("expenses")}
+            SET {', '.join(assignments)}
+            WHERE expense_id = @expense_id
+            AND entry_id = @entry_id
+        """
+        self.query("update_expense", query, query_params)
+
+    def delete_expense(self, expense_id):
+        query = f"""
+            DELETE FROM {self.table("expenses")}
+            WHERE expense_id = @expense_id
+        """
+        self.query("delete_expense", query, [bigquery.ScalarQueryParameter("expense_id", "STRING", expense_id)])
+
+    def delete_entry_expenses(self, entry_id):
+        query = f"""
+            DELETE FROM {self.table("expenses")}
+            WHERE entry_id = @entry_id
+        """
+        self.query("delete_entry_expenses", query, [bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id)])
+
+    def list_photos(self, filters):
+        conditions, query_params = build_conditions(filters, PHOTO_FILTERS)
+        query = f"""
+        SELECT
+            photo_id,
+            entry_id,
+            photo_url,
+            user_id
+        FROM {self.table("photos")}
+        WHERE {" AND ".join(conditions)}
+        """
+        return self.query("list_photos", query, query_params)
+
+    def delete_photos(self, filters):
+        conditions, query_params = build_conditions(filters, PHOTO_FILTERS)
+        query = f"""
+        DELETE FROM {self.table("photos")}
+        WHERE {" AND ".join(conditions)}
+        """
+        self.query("delete_photos", query, query_params)
+
+    def delete_entries(self, filters):
+        conditions, query_params = build_conditions(filters, PHOTO_FILTERS)
+        where = " AND ".join(conditions)
+        # One multi-statement script, so there is a single job to wait on
+        script = f"""
+        DELETE FROM {self.table("photos")} WHERE {where};
+        DELETE FROM {self.table("expenses")} WHERE {where};
+        DELETE FROM {self.table("text_entries")} WHERE {where};
+        """
+        self.query("delete_entries", script, query_params)
+
+    def get_user(self, column, value):
+        query = f"""
+            SELECT user_id, email, password_hash, full_name, profile_pic_url
+            FROM {self.table("users")}
+            WHERE {column} = @value
+        """
+        results = list(self.query("get_user", query, [bigquery.ScalarQueryParameter("value", "STRING", value)]))
+        return results[0] if results else None
+
+    def get_user_profiles(self, user_ids):
+        query = f"""
+            SELECT user_id, full_name, profile_pic_url
+            FROM {self.table("users")}
+            WHERE user_id IN UNNEST(@user_ids)
+        """
+        return self.query("get_user_profiles", query, [bigquery.ArrayQueryParameter("user_ids", "STRING", list(user_ids))])
+
+    def update_user_password(self, user_id, password_hash):
+        # Like update_expense, this fails for users still in the streaming buffer
+        query = f"""
+            UPDATE {self.table("users")}
+            SET password_hash = @password_hash
+            WHERE user_id = @user_id
+        """
+        self.query("update_user_password", query, [
+            bigquery.ScalarQueryParameter("password_hash", "STRING", password_hash),
+            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+        ])
+
+    def list_users(self, fields):
+        query = f"""
+            SELECT {', '.join(fields)}
+            FROM {self.table("users")}
+        """
+        return self.query("list_users", query)
+
+    def iter_users(self, limit, cursor=None, fields=USER_PUBLIC_FIELDS):
+        # BigQuery bills by the columns read, so select only what was asked for
+        columns = sorted(set(fields) | {"created_at", "user_id"})
+        conditions = []
+        query_params = [bigquery.ScalarQueryParameter("limit", "INT64", limit)]
+
+        if cursor:
+            conditions.append(
+                "(created_at < @cursor_created_at"
+                " OR (created_at = @cursor_created_at AND user_id < @cursor_user_id))"
+            )
+            query_params.append(bigquery.ScalarQueryParameter("cursor_created_at", "TIMESTAMP", cursor[0]))
+            query_params.append(bigquery.ScalarQueryParameter("cursor_user_id", "STRING", cursor[1]))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT {', '.join(columns)}
+            FROM {self.table("users")}
+            {where}
+            ORDER BY created_at DESC, user_id DESC
+            LIMIT @limit
+        """
+        return self.query("iter_users", query, query_params, page_size=min(limit, MAX_PAGE_SIZE))
+
+    def search_users(self, filters):
+        conditions, query_params = build_conditions(filters, USER_FILTERS)
+        query = f"""
+            SELECT user_id, email, full_name, profile_pic_url, created_at
+            FROM {self.table("users")}
+            WHERE {" OR ".join(conditions)}
+        """
+        return self.query("search_users", query, query_params)
+
+    def insert_rows(self, table, rows):
+        return get_bigquery_client().insert_rows_json(f"{PROJECT_ID}.{DATASET_NAME}.{table}", rows)
+
+    def find_existing_ids(self, table, column, ids):
+        query = f"""
+            SELECT {column} AS id
+            FROM {self.table(table)}
+            WHERE {column} IN UNNEST(@ids)
+        """
+        rows = self.query("find_existing_ids", query, [bigquery.ArrayQueryParameter("ids", "STRING", ids)])
+        return {row.id for row in rows}
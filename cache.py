@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from config import CACHE_BACKEND, REDIS_URL
+
+_caches = {}
+
+class Cache:
+    """Base class for named caches; counts hits and misses for cache_stats()."""
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._set(key, value, self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._delete(key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None
+        }
+
+class MemoryCache(Cache):
+    """In-process cache with per-entry TTL and LRU eviction past maxsize."""
+
+    def __init__(self, name, maxsize, ttl):
+        super().__init__(name, ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        stats = super().stats()
+        stats["size"] = len(self._data)
+        return stats
+
+class RedisCache(Cache):
+    """Cache shared between workers through Redis; values are stored as JSON.
+
+    Redis applies the TTL and evicts by its own maxmemory policy (configure
+    allkeys-lru for LRU behaviour).
+    """
+
+    def __init__(self, name, ttl, url=REDIS_URL):
+        super().__init__(name, ttl)
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = f"nomadnest:{name}:"
+
+    def _get(self, key):
+        raw = self._redis.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def _set(self, key, value, ttl):
+        self._redis.set(self._prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def _delete(self, key):
+        self._redis.delete(self._prefix + key)
+
+def make_cache(name, maxsize, ttl):
+    """Create a named cache on the configured CACHE_BACKEND ("memory" or "redis")."""
+    if CACHE_BACKEND == "redis":
+        cache = RedisCache(name, ttl)
+    else:
+        cache = MemoryCache(name, maxsize, ttl)
+    _caches[name] = cache
+    return cache
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
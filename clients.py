@@ -0,0 +1,46 @@
+import threading
+from config import PROJECT_ID
+
+# Google Cloud clients are built on first use and shared by every module.
+# Importing google.cloud and discovering credentials is the slowest part of
+# startup, and a worker serving only local backends never needs either.
+_clients = {}
+_lock = threading.Lock()
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _bigquery_client():
+    from google.cloud import bigquery
+    return bigquery.Client(project=PROJECT_ID)
+
+def _storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+def get_bigquery_client():
+    return _get("bigquery", _bigquery_client)
+
+def get_storage_client():
+    return _get("storage", _storage_client)
+
+def prewarm_clients(names=("bigquery", "storage")):
+    """Build clients in a background thread so the first request doesn't wait for them."""
+    factories = {"bigquery": get_bigquery_client, "storage": get_storage_client}
+
+    def warm():
+        for name in names:
+            try:
+                factories[name]()
+            except Exception as e:
+                print(f"Error initializing {name} client: {e}")
+
+    thread = threading.Thread(target=warm, name="client-prewarm", daemon=True)
+    thread.start()
+    return thread
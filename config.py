@@ -10,8 +10,120 @@ DATASET_NAME = 'NomadNest'
 TABLE_NAME = 'users'
 BUCKET_NAME = "nomads-nest-profile-pics"
 
-# Initialize clients
-from google.cloud import bigquery, storage
+# Feed pagination
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
 
-client = bigquery.Client(project=PROJECT_ID)
-storage_client = storage.Client()
\ No newline at end of file
+# IDs are time-ordered UUIDv7s; collisions are not expected, so the batched
+# existence check against BigQuery is off by default
+ID_COLLISION_CHECK = False
+
+# Streaming inserts: rows from one request always go out in one call per
+# table; micro-batching additionally merges rows across concurrent requests
+INSERT_MICRO_BATCHING = os.getenv("INSERT_MICRO_BATCHING", "false").lower() == "true"
+INSERT_BATCH_MAX_ROWS = 500
+INSERT_BATCH_MAX_DELAY_MS = 50
+
+# Photo storage. STORAGE_BACKEND=local writes blobs under LOCAL_STORAGE_DIR
+# instead of Cloud Storage, for tests and offline runs
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "local_storage")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "http://localhost:5000/local-storage")
+PHOTO_UPLOAD_CONCURRENCY = int(os.getenv("PHOTO_UPLOAD_CONCURRENCY", "8"))
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", "32"))
+
+# Two-phase photo uploads: clients PUT bytes straight to storage with a
+# signed URL, then call the completion endpoint. The key signs upload ids
+# and the local storage emulator's URLs. Only the local backend falls back to
+# a development key; with Cloud Storage the app refuses to start without one
+UPLOAD_SIGNING_KEY = os.getenv("UPLOAD_SIGNING_KEY") or (
+    "local-development-key" if STORAGE_BACKEND == "local" else None
+)
+UPLOAD_URL_EXPIRY_SECONDS = 900
+MAX_PHOTO_UPLOAD_BYTES = 25 * 1024 * 1024
+MAX_UPLOADS_PER_REQUEST = 20
+
+# POST /api/entries/batch limits for offline-sync replays
+MAX_BATCH_ENTRIES = 500
+MAX_PHOTOS_PER_BATCH_ENTRY = 20
+# Idempotency keys are scoped to user and device, but must still be unique
+# per device; the minimum length rules out counters like "1"
+MIN_IDEMPOTENCY_KEY_LENGTH = 16
+
+# POST /api/entries writes the text entry, photos and expenses concurrently
+# once the entry_id is allocated; false runs them one after another
+CREATE_ENTRY_FAN_OUT = os.getenv("CREATE_ENTRY_FAN_OUT", "true").lower() == "true"
+
+# Upload-time image renditions, by longest edge in pixels (None keeps the
+# original size). Every rendition is re-encoded without metadata in a
+# process pool of IMAGE_PROCESS_WORKERS
+IMAGE_RENDITIONS = {"thumb": 320, "medium": 1280, "original": None}
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(os.cpu_count() or 2)))
+
+# Password hashing runs in its own process pool. At most
+# PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE hashes are in flight; beyond
+# that /login and /register answer 503. PASSWORD_HASH_WORKERS=0 hashes on
+# the request thread. Hashes made with another method are upgraded on login
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "16"))
+PASSWORD_HASH_TIMEOUT_SECONDS = 10
+
+# Data access. DATA_BACKEND=sqlite serves everything from a local SQLite
+# database seeded from the bundled CSVs, for offline runs and load tests
+DATA_BACKEND = os.getenv("DATA_BACKEND", "bigquery")
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "nomadnest.db")
+
+# In-memory grid index for /api/entries/nearby. Cells are GEO_CELL_DEGREES
+# on a side; each worker rebuilds its index from the database every
+# GEO_INDEX_REFRESH_SECONDS to pick up entries written by other workers
+GEO_CELL_DEGREES = 0.5
+GEO_INDEX_REFRESH_SECONDS = 300
+NEARBY_MAX_RADIUS_KM = 20000
+
+# In-memory full-text index for /api/entries/search?q=, rebuilt like the
+# geo index. Term frequencies are weighted by the field they occur in
+TEXT_FIELD_WEIGHTS = {"title": 2.0, "location": 1.5, "content": 1.0}
+TEXT_PREFIX_EXPANSIONS = 50
+TEXT_CHAMPION_LIST_SIZE = 1000
+TEXT_INDEX_REFRESH_SECONDS = 300
+
+# In-memory typeahead index for /api/users/suggest, rebuilt like the others
+USER_INDEX_REFRESH_SECONDS = 300
+USER_SUGGEST_LIMIT = 10
+
+# In-memory expense rollups for /api/expenses/summary, rebuilt like the others
+EXPENSE_ROLLUP_REFRESH_SECONDS = 300
+
+# Dated exchange rates (date,currency,per_usd) used to report expense totals
+# in one currency. Expenses without a currency are taken to be DEFAULT_CURRENCY
+CURRENCY_RATES_PATH = os.getenv(
+    "CURRENCY_RATES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exchange_rates.csv")
+)
+DEFAULT_CURRENCY = "USD"
+
+# Metrics on /metrics and one JSON trace line per request on stdout
+TRACE_LOGS = os.getenv("TRACE_LOGS", "true").lower() == "true"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Background jobs for heavy deletes and uploads (?async=true)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_HISTORY_SIZE = 1000
+# Run those operations as jobs unless the caller passes ?async=false. Job
+# status lives in the accepting process's memory, so only turn this on when
+# /api/jobs/<id> polls reach the same process (one worker, or sticky routing)
+ASYNC_BY_DEFAULT = os.getenv("ASYNC_BY_DEFAULT", "false").lower() == "true"
+
+# Caches. CACHE_BACKEND=redis shares them between workers via REDIS_URL
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300
+RESPONSE_CACHE_SIZE = 1000
+RESPONSE_CACHE_TTL = 60
+
+# Google Cloud clients are created on first use (see clients.py);
+# PREWARM_CLIENTS starts building them in the background at app startup
+PREWARM_CLIENTS = os.getenv("PREWARM_CLIENTS", "false").lower() == "true"
@@ -0,0 +1,82 @@
+import csv
+import threading
+import numpy as np
+from config import CURRENCY_RATES_PATH, DEFAULT_CURRENCY
+
+class RatesTable:
+    """Dated exchange rates held as a (date x currency) matrix of units per USD.
+
+    Missing days are carried forward from the last known rate, dates before
+    a currency's first rate use that first rate and undated amounts use the
+    latest one. Conversion works on whole columns: amounts, currency codes
+    and dates are turned into row/column indexes with searchsorted and
+    np.unique, so the per-row work is all NumPy.
+    """
+
+    def __init__(self, rows):
+        rows = [(date, currency.upper(), float(per_usd)) for date, currency, per_usd in rows]
+        self.currencies = sorted({currency for _, currency, _ in rows})
+        self._columns = {currency: i for i, currency in enumerate(self.currencies)}
+        self.dates = np.unique(np.array([date for date, _, _ in rows], dtype="datetime64[D]"))
+
+        self.matrix = np.full((len(self.dates), len(self.currencies)), np.nan)
+        date_rows = np.searchsorted(self.dates, np.array([date for date, _, _ in rows], dtype="datetime64[D]"))
+        columns = np.array([self._columns[currency] for _, currency, _ in rows])
+        self.matrix[date_rows, columns] = [per_usd for _, _, per_usd in rows]
+
+        # Carry rates forward over missing dates, then back over the leading gap
+        for i in range(1, len(self.dates)):
+            missing = np.isnan(self.matrix[i])
+            self.matrix[i, missing] = self.matrix[i - 1, missing]
+        for i in range(len(self.dates) - 2, -1, -1):
+            missing = np.isnan(self.matrix[i])
+            self.matrix[i, missing] = self.matrix[i + 1, missing]
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            return cls((row["date"], row["currency"], row["per_usd"]) for row in csv.DictReader(f))
+
+    def column(self, currency):
+        column = self._columns.get((currency or DEFAULT_CURRENCY).upper())
+        if column is None:
+            raise ValueError(f"No exchange rates for currency {currency}")
+        return column
+
+    def columns(self, currencies):
+        """Map currency codes to matrix columns; -1 for currencies without rates."""
+        codes = np.asarray(currencies, dtype=object)
+        codes = np.where(np.equal(codes, None), DEFAULT_CURRENCY, codes).astype(str)
+        unique, inverse = np.unique(codes, return_inverse=True)
+        lookup = np.array([self._columns.get(code.upper(), -1) for code in unique], dtype=np.intp)
+        return lookup[inverse.reshape(-1)]
+
+    def rows(self, dates):
+        """Map dates (datetimes, ISO strings or None) to the row of the rate in effect."""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        return np.clip(np.searchsorted(self.dates, dates, side="right") - 1, 0, len(self.dates) - 1)
+
+    def convert(self, amounts, currencies, dates, target):
+        """Convert columns of amounts to `target`; NaN where the source currency has no rates."""
+        amounts = np.asarray(amounts, dtype=float)
+        target_column = self.column(target)
+        columns = self.columns(currencies)
+        rows = self.rows(dates)
+
+        known = columns >= 0
+        source = np.where(known, self.matrix[rows, np.where(known, columns, 0)], np.nan)
+        return amounts / source * self.matrix[rows, target_column]
+
+_rates = None
+_rates_lock = threading.Lock()
+
+def get_rates():
+    """Return the rates table, loading CURRENCY_RATES_PATH on first use."""
+    global _rates
+    with _rates_lock:
+        if _rates is None:
+            _rates = RatesTable.from_csv(CURRENCY_RATES_PATH)
+        return _rates
+
+def convert_amounts(amounts, currencies, dates, target):
+    return get_rates().convert(amounts, currencies, dates, target)
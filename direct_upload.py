@@ -0,0 +1,157 @@
+import json
+import time
+import base64
+import hmac
+from datetime import datetime, timedelta
+from werkzeug.utils import secure_filename
+from config import UPLOAD_URL_EXPIRY_SECONDS, MAX_PHOTO_UPLOAD_BYTES
+from id_allocator import allocate_ids
+from batch_writer import write_rows
+from repository import get_repository
+from storage_backend import get_bucket, delete_blobs, sign
+from image_pipeline import store_photo, rendition_urls
+from upload_executor import run_uploads
+
+# Two-phase photo uploads. issue_uploads hands out one signed PUT URL per
+# photo for a staging object, plus an upload id that is signed too, so the
+# completion call needs no server-side state. complete_uploads checks the
+# staged objects, stores them like a regular upload and inserts the
+# photos rows in one batch, owned by the user the upload id was issued to. The photo bytes travel from the client to
+# storage without passing through a web worker.
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+STAGING_PREFIX = "uploads/"
+
+def staged_blob_name(entry_id, photo_id, filename):
+    """Where a photo is staged. Always rebuilt on the server, never read from an upload id."""
+    return f"{STAGING_PREFIX}{secure_filename(entry_id)}/{secure_filename(photo_id)}/{secure_filename(filename)}"
+
+def encode_upload_id(upload):
+    payload = base64.urlsafe_b64encode(json.dumps(upload).encode()).decode().rstrip("=")
+    return f"{payload}.{sign(payload)}"
+
+def decode_upload_id(upload_id):
+    """Return the upload an id was issued for; ValueError if forged, garbled or expired."""
+    try:
+        payload, signature = upload_id.rsplit(".", 1)
+        if not hmac.compare_digest(signature, sign(payload)):
+            raise ValueError("bad signature")
+        upload = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError("Invalid upload id") from e
+    if upload["expires"] < time.time():
+        raise ValueError("Upload id has expired")
+    return upload
+
+def issue_uploads(entry_id, user_id, filenames):
+    """Return a signed upload for each filename; ValueError for unsupported files."""
+    content_types = []
+    for filename in filenames:
+        extension = "." + filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+        if extension not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported file type: {filename}")
+        content_types.append(CONTENT_TYPES[extension])
+
+    photo_ids = allocate_ids(len(filenames), "photos", "photo_id")
+    bucket = get_bucket()
+    expiration = timedelta(seconds=UPLOAD_URL_EXPIRY_SECONDS)
+    expires = int(time.time()) + UPLOAD_URL_EXPIRY_SECONDS
+
+    uploads = []
+    for photo_id, filename, content_type in zip(photo_ids, filenames, content_types):
+        blob_name = staged_blob_name(entry_id, photo_id, filename)
+        headers = {
+            "Content-Type": content_type,
+            "x-goog-content-length-range": f"0,{MAX_PHOTO_UPLOAD_BYTES}"
+        }
+        upload_url = bucket.blob(blob_name).generate_signed_url(
+            version="v4",
+            expiration=expiration,
+            method="PUT",
+            content_type=content_type,
+            headers={"x-goog-content-length-range": headers["x-goog-content-length-range"]}
+        )
+        uploads.append({
+            "photo_id": photo_id,
+            "filename": filename,
+            "upload_id": encode_upload_id({
+                "entry_id": entry_id,
+                "user_id": user_id,
+                "photo_id": photo_id,
+                "filename": filename,
+                "expires": expires
+            }),
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": headers,
+            "expires_at": datetime.utcfromtimestamp(expires).strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return uploads
+
+def complete_uploads(entry_id, upload_ids):
+    """Verify staged uploads, render them and insert their photos rows in one batch"""
+    bucket = get_bucket()
+    errors = []
+    uploads = []
+
+    for upload_id in upload_ids:
+        try:
+            upload = decode_upload_id(upload_id)
+        except ValueError as e:
+            errors.append({"input": upload_id, "errors": [str(e)]})
+            continue
+        if upload["entry_id"] != entry_id:
+            errors.append({"input": upload["filename"], "errors": ["Upload was issued for another entry"]})
+            continue
+        uploads.append(upload)
+
+    # A retried completion finds its rows already written
+    photo_ids = [upload["photo_id"] for upload in uploads]
+    done = get_repository().find_existing_ids("photos", "photo_id", photo_ids) if photo_ids else set()
+    for upload in uploads:
+        if upload["photo_id"] in done:
+            errors.append({"input": upload["filename"], "errors": ["Upload already completed"]})
+    uploads = [upload for upload in uploads if upload["photo_id"] not in done]
+
+    for upload in uploads:
+        upload["blob"] = staged_blob_name(entry_id, upload["photo_id"], upload["filename"])
+
+    def process(upload):
+        blob = bucket.get_blob(upload["blob"])
+        if blob is None:
+            raise ValueError("Nothing was uploaded")
+        if blob.size > MAX_PHOTO_UPLOAD_BYTES:
+            raise ValueError(f"Photo is larger than {MAX_PHOTO_UPLOAD_BYTES} bytes")
+        return store_photo(bucket, "photos", blob.download_as_bytes())
+
+    photo_rows = []
+    filenames = []
+    staged = []
+    for upload, (photo_url, error) in zip(uploads, run_uploads(process, uploads)):
+        if error:
+            errors.append({"input": upload["filename"], "errors": [str(error)]})
+            continue
+        staged.append(upload["blob"])
+        photo_rows.append({
+            "photo_id": upload["photo_id"],
+            "entry_id": entry_id,
+            "photo_url": photo_url,
+            "user_id": upload["user_id"],
+            "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        filenames.append(upload["filename"])
+
+    # Insert all photo rows with one call
+    insert_errors = write_rows("photos", photo_rows, filenames)
+    errors.extend(insert_errors)
+
+    # Staged objects of completed photos are no longer needed. Failed ones
+    # stay for a retry; a lifecycle rule on uploads/ should expire them
+    failed = {error["index"] for error in insert_errors}
+    delete_blobs(name for i, name in enumerate(staged) if i not in failed and name.startswith(STAGING_PREFIX))
+
+    photos = [
+        {"photo_id": row["photo_id"], "user_id": row["user_id"], "photo_url": row["photo_url"], "renditions": rendition_urls(row["photo_url"])}
+        for i, row in enumerate(photo_rows) if i not in failed
+    ]
+    return {"photos": photos, "errors": errors}
@@ -0,0 +1,230 @@
+import threading
+import numpy as np
+from datetime import datetime
+from config import EXPENSE_ROLLUP_REFRESH_SECONDS
+from repository import get_repository
+from currency import convert_amounts
+from refreshing_index import RefreshingIndex
+
+# Dimensions /api/expenses/summary can group and filter by. user_id and
+# location are the entry's, like /api/expenses/search; month is the
+# expense's created_at as YYYY-MM. Facts also keep the day, for currency
+# conversion at the rate of the day the expense was made.
+DIMENSIONS = ("category", "currency", "entry_id", "user_id", "location", "month")
+
+def day_of(created_at):
+    if isinstance(created_at, datetime):
+        return created_at.strftime("%Y-%m-%d")
+    return str(created_at)[:10] if created_at else None
+
+class ExpenseRollups:
+    """Per-worker count/sum rollups of the expenses table.
+
+    Every expense is kept as one fact (its dimension values and amount).
+    A rollup for a set of dimensions maps each combination of their values
+    to [count, total]; it is built from the facts the first time a summary
+    needs it and from then on updated with every write, so reads only walk
+    the groups, never the expenses.
+    """
+
+    def __init__(self):
+        self._facts = {}     # expense_id -> {dimension: value, "amount": amount}
+        self._by_entry = {}  # entry_id -> {expense_id}
+        self._entries = {}   # entry_id -> (user_id, location)
+        self._rollups = {}   # dimensions -> {values: [count, total]}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._facts)
+
+    def _apply(self, fact, sign):
+        for dimensions, groups in self._rollups.items():
+            key = tuple(fact[dimension] for dimension in dimensions)
+            group = groups.setdefault(key, [0, 0.0])
+            group[0] += sign
+            group[1] += sign * fact["amount"]
+            if group[0] == 0:
+                del groups[key]
+
+    def set_entry(self, entry_id, user_id, location):
+        with self._lock:
+            self._entries[entry_id] = (str(user_id) if user_id is not None else None, location)
+
+    def has_entry(self, entry_id):
+        return entry_id in self._entries
+
+    def add(self, expense):
+        """Add an expense row; its entry must have been registered with set_entry."""
+        user_id, location = self._entries.get(expense["entry_id"], (None, None))
+        day = day_of(expense.get("created_at"))
+        fact = {
+            "category": expense.get("category"),
+            "currency": expense.get("currency"),
+            "entry_id": expense["entry_id"],
+            "user_id": user_id,
+            "location": location,
+            "month": day[:7] if day else None,
+            "day": day,
+            "amount": float(expense.get("amount") or 0.0),
+        }
+        expense_id = expense["expense_id"]
+        with self._lock:
+            self.remove(expense_id)
+            self._facts[expense_id] = fact
+            self._by_entry.setdefault(fact["entry_id"], set()).add(expense_id)
+            self._apply(fact, 1)
+
+    def update(self, entry_id, expense_id, fields):
+        """Apply an update of amount, category or currency."""
+        with self._lock:
+            fact = self._facts.get(expense_id)
+            if fact is None or fact["entry_id"] != entry_id:
+                return
+            self._apply(fact, -1)
+            for name in ("category", "currency"):
+                if name in fields:
+                    fact[name] = fields[name]
+            if "amount" in fields:
+                fact["amount"] = float(fields["amount"])
+            self._apply(fact, 1)
+
+    def remove(self, expense_id):
+        with self._lock:
+            fact = self._facts.pop(expense_id, None)
+            if fact is None:
+                return
+            self._apply(fact, -1)
+            expense_ids = self._by_entry[fact["entry_id"]]
+            expense_ids.discard(expense_id)
+            if not expense_ids:
+                del self._by_entry[fact["entry_id"]]
+
+    def remove_where(self, entry_id=None, user_id=None):
+        """Drop the expenses of entries matching entry_id and/or the entry author user_id."""
+        with self._lock:
+            entry_ids = [entry_id] if entry_id is not None else list(self._by_entry)
+            for eid in entry_ids:
+                if user_id is not None and self._entries.get(eid, (None,))[0] != str(user_id):
+                    continue
+                for expense_id in list(self._by_entry.get(eid, ())):
+                    self.remove(expense_id)
+
+    def _rollup(self, dimensions):
+        groups = self._rollups.get(dimensions)
+        if groups is None:
+            groups = {}
+            for fact in self._facts.values():
+                key = tuple(fact[dimension] for dimension in dimensions)
+                group = groups.setdefault(key, [0, 0.0])
+                group[0] += 1
+                group[1] += fact["amount"]
+            self._rollups[dimensions] = groups
+        return groups
+
+    def summary(self, group_by, filters, convert_to=None):
+        """Return [{dimension: value, ..., "count", "total"}] grouped by group_by.
+
+        Filters are matched on the rollup of group_by plus the filtered
+        dimensions, then the matching groups are merged down to group_by.
+        With convert_to, that rollup is also split by currency and day so
+        each partial total is converted at its own date's rate; groups whose
+        currency has no rates are left out and counted in "unconverted".
+        """
+        wanted = set(group_by) | set(filters)
+        if convert_to:
+            wanted |= {"currency", "day"}
+        dimensions = tuple(d for d in DIMENSIONS + ("day",) if d in wanted)
+        positions = [dimensions.index(d) for d in group_by]
+        checks = [(dimensions.index(d), str(value)) for d, value in filters.items()]
+
+        with self._lock:
+            matches = [
+                (key, count, total) for key, (count, total) in self._rollup(dimensions).items()
+                if not any(str(key[i]) != value for i, value in checks)
+            ]
+
+        unconverted = 0
+        if convert_to and matches:
+            currency, day = dimensions.index("currency"), dimensions.index("day")
+            totals = convert_amounts(
+                [total for _, _, total in matches],
+                [key[currency] for key, _, _ in matches],
+                [key[day] for key, _, _ in matches],
+                convert_to
+            )
+            missing = np.isnan(totals)
+            unconverted = int(sum(count for (_, count, _), skip in zip(matches, missing) if skip))
+            matches = [
+                (key, count, total)
+                for (key, count, _), total, skip in zip(matches, totals, missing) if not skip
+            ]
+
+        merged = {}
+        for key, count, total in matches:
+            group = merged.setdefault(tuple(key[i] for i in positions), [0, 0.0])
+            group[0] += count
+            group[1] += total
+
+        groups = [
+            dict(zip(group_by, key), count=count, total=round(float(total), 2))
+            for key, (count, total) in merged.items()
+        ]
+        return groups, unconverted
+
+def build_expense_rollups():
+    rollups = ExpenseRollups()
+    for row in get_repository().list_expense_facts():
+        row = dict(row)
+        if not rollups.has_entry(row["entry_id"]):
+            rollups.set_entry(row["entry_id"], row["user_id"], row["location"])
+        rollups.add(row)
+    return rollups
+
+_rollups = RefreshingIndex("expense rollups", build_expense_rollups, EXPENSE_ROLLUP_REFRESH_SECONDS)
+
+def get_expense_rollups():
+    """Return this worker's rollups, built from the expenses table on first use."""
+    return _rollups.get()
+
+# Write hooks. They run after the write has committed; see RefreshingIndex.apply.
+
+def track_entry(entry_id, user_id, location):
+    """Register a new entry's author and location for the expenses added to it."""
+    _rollups.apply(lambda rollups: rollups.set_entry(entry_id, user_id, location))
+
+def track_expenses(expenses):
+    """Add newly written expense rows."""
+    if not _rollups.tracking:
+        return
+
+    # Entries without expenses aren't in the rollups yet; look them up at
+    # once, outside the index lock
+    current = _rollups.index
+    unknown = {
+        expense["entry_id"] for expense in expenses
+        if current is None or not current.has_entry(expense["entry_id"])
+    }
+    try:
+        entries = list(get_repository().get_entries(list(unknown))) if unknown else []
+    except Exception as e:
+        print(f"Error looking up entries for expense rollups: {e}")
+        return
+
+    def add(rollups):
+        for entry in entries:
+            if not rollups.has_entry(entry["entry_id"]):
+                rollups.set_entry(entry["entry_id"], entry["user_id"], entry["location"])
+        for expense in expenses:
+            if rollups.has_entry(expense["entry_id"]):
+                rollups.add(expense)
+    _rollups.apply(add)
+
+def track_expense_update(entry_id, expense_id, fields):
+    _rollups.apply(lambda rollups: rollups.update(entry_id, expense_id, fields))
+
+def untrack_expense(expense_id):
+    _rollups.apply(lambda rollups: rollups.remove(expense_id))
+
+def untrack_entry_expenses(filters):
+    """Drop the expenses removed with these entry_id/user_id entry filters."""
+    _rollups.apply(lambda rollups: rollups.remove_where(filters.get("entry_id"), filters.get("user_id")))
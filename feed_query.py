@@ -0,0 +1,86 @@
+from config import PROJECT_ID, DATASET_NAME
+from image_pipeline import rendition_urls
+
+def build_feed_query(conditions, limit=False):
+    """Build the entries feed query.
+
+    Entries are selected first, then photos and expenses are aggregated per
+    entry_id in their own subqueries before being joined back on. An entry
+    with 10 photos and 20 expenses therefore produces one row, not 200, and
+    only children of the selected entries are read. Author fields are not
+    joined in; utils.with_authors adds them from the user cache.
+
+    `conditions` are ANDed together and may reference text_entries as `t`.
+    When `limit` is set the query takes an @limit parameter.
+    """
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    page_order = "ORDER BY t.created_at DESC, t.entry_id DESC\n            LIMIT @limit" if limit else ""
+
+    return f"""
+        WITH page AS (
+            SELECT
+                t.entry_id,
+                t.user_id,
+                t.title,
+                t.content,
+                t.location,
+                t.latitude,
+                t.longitude,
+                t.created_at
+            FROM `{PROJECT_ID}.{DATASET_NAME}.text_entries` t
+            {where}
+            {page_order}
+        ),
+        photo_agg AS (
+            SELECT p.entry_id, ARRAY_AGG(p.photo_url IGNORE NULLS) AS photo_urls
+            FROM `{PROJECT_ID}.{DATASET_NAME}.photos` p
+            WHERE p.entry_id IN (SELECT entry_id FROM page)
+            GROUP BY p.entry_id
+        ),
+        expense_agg AS (
+            SELECT
+                e.entry_id,
+                ARRAY_AGG(STRUCT(e.expense_id, e.category, e.amount, e.currency)) AS expenses
+            FROM `{PROJECT_ID}.{DATASET_NAME}.expenses` e
+            WHERE e.entry_id IN (SELECT entry_id FROM page)
+            GROUP BY e.entry_id
+        )
+        SELECT
+            page.*,
+            pa.photo_urls,
+            ea.expenses
+        FROM page
+        LEFT JOIN photo_agg pa ON pa.entry_id = page.entry_id
+        LEFT JOIN expense_agg ea ON ea.entry_id = page.entry_id
+        ORDER BY page.created_at DESC, page.entry_id DESC
+    """
+
+def format_entry_row(row):
+    """Shape one feed row, after utils.with_authors, into the entry JSON returned by the API."""
+    expenses = []
+    for expense in row["expenses"] or []:
+        if expense["category"]:
+            expenses.append({
+                "expense_id": expense["expense_id"],
+                "category": expense["category"],
+                "amount": expense["amount"],
+                "currency": expense["currency"]
+            })
+
+    return {
+        "entry_id": row["entry_id"],
+        "user_id": row["user_id"],
+        "title": row["title"],
+        "content": row["content"],
+        "location": row["location"],
+        "latitude": row["latitude"],
+        "longitude": row["longitude"],
+        "created_at": row["created_at"].strftime('%Y-%m-%d %H:%M:%S') if row["created_at"] else None,
+        "author": {
+            "name": row["full_name"],
+            "profile_pic": row["profile_pic_url"]
+        } if row["full_name"] else None,
+        "photos": list(row["photo_urls"] or []),
+        "photo_renditions": [rendition_urls(url) for url in row["photo_urls"] or []],
+        "expenses": expenses
+    }
@@ -0,0 +1,161 @@
+import math
+import threading
+from config import GEO_CELL_DEGREES, GEO_INDEX_REFRESH_SECONDS
+from repository import get_repository
+from refreshing_index import RefreshingIndex
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GeoIndex:
+    """Grid index over entry coordinates.
+
+    Points are bucketed into cells of cell_deg x cell_deg degrees. A query
+    only visits the cells overlapping its bounding box, and exact distance
+    or box checks run on the points in those cells.
+    """
+
+    def __init__(self, cell_deg=GEO_CELL_DEGREES):
+        self.cell_deg = cell_deg
+        self.rows = math.ceil(180 / cell_deg)
+        self.cols = math.ceil(360 / cell_deg)
+        self._cells = {}   # (row, col) -> {entry_id: (lat, lon)}
+        self._points = {}  # entry_id -> (lat, lon, user_id, cell)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _row(self, lat):
+        return min(max(math.floor((lat + 90) / self.cell_deg), 0), self.rows - 1)
+
+    def _col(self, lon):
+        return math.floor((lon + 180) / self.cell_deg) % self.cols
+
+    def add(self, entry_id, lat, lon, user_id=None):
+        if lat is None or lon is None:
+            return
+        lat, lon = float(lat), float(lon)
+        cell = (self._row(lat), self._col(lon))
+        with self._lock:
+            self.remove(entry_id)
+            self._cells.setdefault(cell, {})[entry_id] = (lat, lon)
+            self._points[entry_id] = (lat, lon, user_id, cell)
+
+    def remove(self, entry_id):
+        with self._lock:
+            point = self._points.pop(entry_id, None)
+            if point is None:
+                return
+            cell = point[3]
+            self._cells[cell].pop(entry_id, None)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def remove_where(self, entry_id=None, user_id=None):
+        """Remove the points matching both entry_id and user_id (when given)."""
+        with self._lock:
+            entry_ids = [entry_id] if entry_id else list(self._points)
+            for candidate in entry_ids:
+                point = self._points.get(candidate)
+                if point and (not user_id or str(point[2]) == str(user_id)):
+                    self.remove(candidate)
+
+    def _candidates(self, min_lat, max_lat, lon_ranges):
+        """Return (entry_id, lat, lon) for the points in cells overlapping the box.
+
+        lon_ranges is a list of (min_lon, max_lon) pairs, or None for all
+        longitudes.
+        """
+        row_range = range(self._row(max(min_lat, -90)), self._row(min(max_lat, 90)) + 1)
+        if lon_ranges is None:
+            cols = set(range(self.cols))
+        else:
+            cols = set()
+            for min_lon, max_lon in lon_ranges:
+                first = math.floor((min_lon + 180) / self.cell_deg)
+                last = math.floor((max_lon + 180) / self.cell_deg)
+                cols.update(col % self.cols for col in range(first, min(last, first + self.cols - 1) + 1))
+
+        with self._lock:
+            # For very large boxes walking the occupied cells is cheaper
+            if len(row_range) * len(cols) > len(self._cells):
+                cells = [
+                    points for (row, col), points in self._cells.items()
+                    if row in row_range and col in cols
+                ]
+            else:
+                cells = [
+                    self._cells[(row, col)] for row in row_range for col in cols
+                    if (row, col) in self._cells
+                ]
+            return [(entry_id, lat, lon) for points in cells for entry_id, (lat, lon) in points.items()]
+
+    def nearby(self, lat, lon, radius_km, limit):
+        """Return up to `limit` (distance_km, entry_id) pairs within radius_km, nearest first."""
+        angular = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angular)
+        min_lat, max_lat = lat - dlat, lat + dlat
+
+        lon_ranges = None
+        # The box spans every longitude once it reaches a pole
+        if min_lat > -90 and max_lat < 90:
+            ratio = math.sin(angular) / math.cos(math.radians(lat))
+            if ratio < 1:
+                dlon = math.degrees(math.asin(ratio))
+                lon_ranges = [(lon - dlon, lon + dlon)]
+
+        results = []
+        for entry_id, point_lat, point_lon in self._candidates(min_lat, max_lat, lon_ranges):
+            distance = haversine_km(lat, lon, point_lat, point_lon)
+            if distance <= radius_km:
+                results.append((distance, entry_id))
+        results.sort()
+        return results[:limit]
+
+    def within_box(self, min_lat, min_lon, max_lat, max_lon, limit):
+        """Return up to `limit` (distance_km, entry_id) pairs inside the box, nearest its centre first.
+
+        A box with min_lon > max_lon crosses the antimeridian.
+        """
+        crosses = min_lon > max_lon
+        lon_ranges = [(min_lon, 180), (-180, max_lon)] if crosses else [(min_lon, max_lon)]
+        center_lat = (min_lat + max_lat) / 2
+        center_lon = (min_lon + max_lon + (360 if crosses else 0)) / 2
+        center_lon = (center_lon + 180) % 360 - 180
+
+        results = []
+        for entry_id, lat, lon in self._candidates(min_lat, max_lat, lon_ranges):
+            in_lon = (lon >= min_lon or lon <= max_lon) if crosses else min_lon <= lon <= max_lon
+            if min_lat <= lat <= max_lat and in_lon:
+                results.append((haversine_km(center_lat, center_lon, lat, lon), entry_id))
+        results.sort()
+        return results[:limit]
+
+def build_geo_index():
+    index = GeoIndex()
+    for row in get_repository().list_entry_locations():
+        index.add(row["entry_id"], row["latitude"], row["longitude"], row["user_id"])
+    return index
+
+_index = RefreshingIndex("geo index", build_geo_index, GEO_INDEX_REFRESH_SECONDS)
+
+def get_geo_index():
+    """Return this worker's index, built from text_entries on first use."""
+    return _index.get()
+
+def index_entry(entry_id, latitude, longitude, user_id=None):
+    """Add a new entry to the index."""
+    _index.apply(lambda index: index.add(entry_id, latitude, longitude, user_id))
+
+def unindex_entries(filters):
+    """Drop the entries deleted with these entry_id/user_id filters from the index."""
+    _index.apply(lambda index: index.remove_where(filters.get("entry_id"), filters.get("user_id")))
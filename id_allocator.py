@@ -0,0 +1,60 @@
+import os
+import time
+import uuid
+import threading
+from config import ID_COLLISION_CHECK
+from repository import get_repository
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+def uuid7():
+    """Return a new time-ordered UUIDv7 string.
+
+    The first 48 bits are the Unix time in milliseconds, so IDs sort by
+    creation time. The 12-bit rand_a field is used as a counter within the
+    same millisecond to keep IDs from one process strictly increasing.
+    """
+    global _last_ms, _counter
+
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Start low in the counter space to leave room for increments
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        timestamp_ms, counter = _last_ms, _counter
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (timestamp_ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= rand_b
+    return str(uuid.UUID(int=value))
+
+def find_existing_ids(table, column, ids):
+    """Return the subset of ids already present in table.column, in one query."""
+    return get_repository().find_existing_ids(table, column, ids)
+
+def allocate_ids(count, table=None, column=None):
+    """Allocate `count` new IDs without a database round trip.
+
+    When ID_COLLISION_CHECK is enabled and a table/column is given, the whole
+    batch is checked with a single query and only colliding IDs are re-drawn.
+    """
+    ids = [uuid7() for _ in range(count)]
+
+    if ids and table and ID_COLLISION_CHECK:
+        taken = find_existing_ids(table, column, ids)
+        while taken:
+            ids = [uuid7() if id_ in taken else id_ for id_ in ids]
+            taken = find_existing_ids(table, column, ids)
+
+    return ids
@@ -0,0 +1,133 @@
+import io
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from upload_executor import run_uploads
+from config import IMAGE_RENDITIONS, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_PROCESS_WORKERS
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Renditions are stored next to each other as <base>_<rendition>.<ext>,
+# with <base> named after the upload's SHA-256; the photo_url saved in the
+# database is the "original" one, so the others can be derived from it
+# without a schema change.
+EXTENSION = EXTENSIONS[IMAGE_FORMAT]
+CONTENT_TYPE = CONTENT_TYPES[IMAGE_FORMAT]
+
+def render(data, renditions=IMAGE_RENDITIONS, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """Decode an uploaded image and return {rendition: encoded bytes}.
+
+    Runs in the worker processes. EXIF orientation is applied before the
+    metadata is dropped; transparency is flattened onto white.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+
+        options = {"quality": quality, "optimize": True}
+        if image_format == "JPEG":
+            options["progressive"] = True
+
+        output = {}
+        for name, size in renditions.items():
+            resized = image
+            if size and max(image.size) > size:
+                resized = image.copy()
+                resized.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            output[name] = buffer.getvalue()
+        return output
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process has threads (uploads, jobs, batching)
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+def submit_render(data):
+    """Start rendering one image in the process pool and return its future."""
+    pool = get_pool()
+    try:
+        future = pool.submit(render, data)
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory on a huge image); start a new pool
+        reset_pool(pool)
+        pool = get_pool()
+        future = pool.submit(render, data)
+
+    # A worker dying mid-render breaks the pool too; the render fails, but
+    # the next upload gets a fresh pool
+    def check(future):
+        if isinstance(future.exception(), BrokenProcessPool):
+            reset_pool(pool)
+    future.add_done_callback(check)
+    return future
+
+def rendition_name(base, name):
+    return f"{base}_{name}.{EXTENSION}"
+
+def rendition_urls(url):
+    """Return {rendition: url} for a stored photo URL or blob name.
+
+    Photos stored before the pipeline existed only have their original.
+    """
+    if not url:
+        return {}
+    stem, _, extension = url.rpartition(".")
+    if not stem.endswith("_original"):
+        return {"original": url}
+    base = stem[:-len("_original")]
+    return {name: f"{base}_{name}.{extension}" for name in IMAGE_RENDITIONS}
+
+def upload_renditions(bucket, base, renditions, public=False):
+    """Upload rendered images as <base>_<rendition>.<ext>; return the original's URL.
+
+    The other renditions go up concurrently and the original last, so an
+    existing original means the whole set is there.
+    """
+    def upload(name):
+        blob = bucket.blob(rendition_name(base, name))
+        blob.upload_from_string(renditions[name], content_type=CONTENT_TYPE)
+        if public:
+            blob.make_public()
+        return blob.public_url
+
+    others = [name for name in renditions if name != "original"]
+    for url, error in run_uploads(upload, others):
+        if error:
+            raise error
+    return upload("original")
+
+def store_photo(bucket, prefix, data, public=False):
+    """Store an image's renditions under <prefix>/<sha256 of the upload>; return the original's URL.
+
+    Storage is content-addressed: identical uploads share one set of blobs,
+    and when the original already exists nothing is rendered or uploaded.
+    """
+    base = f"{prefix}/{hashlib.sha256(data).hexdigest()}"
+    original = bucket.blob(rendition_name(base, "original"))
+    if original.exists():
+        return original.public_url
+    return upload_renditions(bucket, base, submit_render(data).result(), public)
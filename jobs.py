@@ -0,0 +1,73 @@
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from id_allocator import uuid7
+from config import JOB_WORKERS, JOB_HISTORY_SIZE
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+class JobQueue:
+    """In-process background job queue backed by a worker thread pool.
+
+    Jobs are plain callables returning a JSON-serializable result. Their
+    status is kept in memory, with only the most recent JOB_HISTORY_SIZE
+    finished jobs retained, so job ids are only meaningful to the worker
+    process that accepted them.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, history_size=JOB_HISTORY_SIZE):
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return the new job's id."""
+        job_id = uuid7()
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "kind": kind,
+                "status": "queued",
+                "result": None,
+                "error": None,
+                "created_at": _now(),
+                "started_at": None,
+                "finished_at": None
+            }
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of the job's status, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status="running", started_at=_now())
+        try:
+            result = fn(*args, **kwargs)
+            self._update(job_id, status="succeeded", result=result, finished_at=_now())
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status="failed", error=str(e), finished_at=_now())
+        self._trim()
+
+    def _trim(self):
+        with self._lock:
+            finished = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in ("succeeded", "failed")
+            ]
+            for job_id in finished[:max(0, len(finished) - self.history_size)]:
+                del self._jobs[job_id]
+
+job_queue = JobQueue()
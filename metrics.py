@@ -0,0 +1,213 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context, Response
+from id_allocator import uuid7
+from cache import cache_stats
+from config import TRACE_LOGS, LATENCY_BUCKETS
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by route, method and status."),
+    "backend_call_duration_seconds": ("histogram", "Latency of BigQuery/SQLite and storage calls."),
+    "bigquery_bytes_processed_total": ("counter", "Bytes processed by BigQuery query jobs."),
+    "bigquery_bytes_billed_total": ("counter", "Bytes billed for BigQuery query jobs."),
+    "cache_hits_total": ("counter", "Cache hits per cache."),
+    "cache_misses_total": ("counter", "Cache misses per cache."),
+}
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+
+        for name, stats in cache_stats().items():
+            counters[("cache_hits_total", (("cache", name),))] = stats["hits"]
+            counters[("cache_misses_total", (("cache", name),))] = stats["misses"]
+
+        lines = []
+        for metric, (type_, help_text) in HELP.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {type_}")
+            if type_ == "counter":
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for (name, labels), histogram in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+metrics = Metrics()
+
+@contextmanager
+def timed(backend, operation):
+    """Time a backend call into backend_call_duration_seconds and the request trace."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("backend_call_duration_seconds", {
+            "backend": backend, "operation": operation, "outcome": outcome
+        }, elapsed)
+        if has_request_context() and "trace" in g:
+            g.trace.append({
+                "backend": backend,
+                "operation": operation,
+                "outcome": outcome,
+                "ms": round(elapsed * 1000, 3)
+            })
+
+def record_bigquery_job(operation, job):
+    """Count the bytes a finished query job processed and billed."""
+    processed = job.total_bytes_processed or 0
+    billed = job.total_bytes_billed or 0
+    metrics.inc("bigquery_bytes_processed_total", {"operation": operation}, processed)
+    metrics.inc("bigquery_bytes_billed_total", {"operation": operation}, billed)
+    if has_request_context() and "trace" in g:
+        g.bytes_processed += processed
+
+class InstrumentedRepository:
+    """Times every Repository method call."""
+
+    def __init__(self, repository, backend):
+        self._repository = repository
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attribute = getattr(self._repository, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        def call(*args, **kwargs):
+            with timed(self._backend, name):
+                return attribute(*args, **kwargs)
+        return call
+
+class InstrumentedBlob:
+    """Times uploads, downloads and deletes of a storage blob."""
+
+    TIMED = ("upload_from_file", "upload_from_string", "download_as_bytes", "delete", "make_public", "exists")
+
+    def __init__(self, blob, backend):
+        self._blob = blob
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attribute = getattr(self._blob, name)
+        if name not in self.TIMED:
+            return attribute
+
+        def call(*args, **kwargs):
+            with timed(self._backend, f"blob.{name}"):
+                return attribute(*args, **kwargs)
+        return call
+
+class InstrumentedBucket:
+    def __init__(self, bucket, backend):
+        self._bucket = bucket
+        self._backend = backend
+
+    def blob(self, name):
+        return InstrumentedBlob(self._bucket.blob(name), self._backend)
+
+    def get_blob(self, name):
+        with timed(self._backend, "bucket.get_blob"):
+            blob = self._bucket.get_blob(name)
+        return InstrumentedBlob(blob, self._backend) if blob is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+def before_request():
+    g.request_id = request.headers.get("X-Request-ID") or uuid7()
+    g.request_start = time.perf_counter()
+    g.trace = []
+    g.bytes_processed = 0
+
+def after_request(response):
+    if "request_start" not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method, path = request.method, request.path
+    state = g._get_current_object()
+    response.headers["X-Request-ID"] = g.request_id
+
+    def record():
+        elapsed = time.perf_counter() - state.request_start
+        metrics.observe("http_request_duration_seconds", {
+            "method": method, "route": route, "status": response.status_code
+        }, elapsed)
+
+        if TRACE_LOGS:
+            print(json.dumps({
+                "event": "request",
+                "request_id": state.request_id,
+                "method": method,
+                "route": route,
+                "path": path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 3),
+                "bigquery_bytes_processed": state.bytes_processed,
+                "backend_calls": state.trace
+            }), flush=True)
+
+    # A streamed body (ndjson/json-stream) is produced after this hook
+    # returns; time it, and its backend calls, once it has been sent
+    if response.is_streamed:
+        response.call_on_close(record)
+    else:
+        record()
+    return response
+
+def init_app(app):
+    """Install the request hooks and the /metrics endpoint."""
+    app.before_request(before_request)
+    app.after_request(after_request)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
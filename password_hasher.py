@@ -0,0 +1,106 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import (
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE,
+    PASSWORD_HASH_TIMEOUT_SECONDS
+)
+
+class HasherBusy(Exception):
+    """Raised when a hash can't be done now (queue full, slow or dead worker); the request should get a 503."""
+
+def method_of(pwhash):
+    """The method and parameters a werkzeug hash was made with, e.g. "scrypt:32768:8:1"."""
+    return (pwhash or "").split("$", 1)[0]
+
+# These run in the worker processes
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+def _verify(pwhash, password, method):
+    """Check a password, and rehash it when pwhash was made with another method."""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if method_of(pwhash) == method:
+        return True, None
+    return True, generate_password_hash(password, method)
+
+class PasswordHasher:
+    """Runs password hashing in a process pool, so KDF work never runs on request threads.
+
+    A semaphore bounds the hashes in flight (running or queued) to
+    workers + queue_size; past that, calls fail fast with HasherBusy
+    instead of piling up behind a burst of logins.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE,
+                 method=PASSWORD_HASH_METHOD, timeout=PASSWORD_HASH_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.method = method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers + queue_size, 1))
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _reset(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Too many password hashes in progress")
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died; replace the pool and try once more
+            self._reset(pool)
+            pool = self._executor()
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool as e:
+                self._slots.release()
+                self._reset(pool)
+                raise HasherBusy("Password hashing workers are restarting") from e
+            except BaseException:
+                self._slots.release()
+                raise
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # The slot is only freed when the hash finishes, even if we time out
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError as e:
+            raise HasherBusy("Password hashing timed out") from e
+        except BrokenProcessPool as e:
+            self._reset(pool)
+            raise HasherBusy("Password hashing workers are restarting") from e
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Return (matches, new_hash); new_hash is set when the stored hash should be upgraded."""
+        return self._run(_verify, pwhash, password, self.method)
+
+hasher = PasswordHasher()
@@ -0,0 +1,87 @@
+import time
+import threading
+
+class RefreshingIndex:
+    """One worker's in-memory index over a table, kept fresh in the background.
+
+    The first get() builds the index; callers arriving meanwhile wait for it.
+    Once it is older than refresh_seconds, get() keeps returning it and
+    starts a rebuild on a background thread, so no request waits for a
+    table scan after the first. Writes applied while a build is scanning are
+    replayed onto the new index before it replaces the old one; the indexes'
+    add/remove methods are idempotent, so a row the scan already saw is safe.
+    """
+
+    def __init__(self, name, build, refresh_seconds):
+        self.name = name
+        self.build = build
+        self.refresh_seconds = refresh_seconds
+        self.index = None
+        self._built_at = 0
+        self._replay = None  # hooks applied since the running build started
+        self._lock = threading.Lock()
+        self._first_build = threading.Lock()
+
+    @property
+    def tracking(self):
+        """Whether write hooks have an index to update, now or once a build finishes."""
+        return self.index is not None or self._replay is not None
+
+    def get(self):
+        index = self.index
+        if index is None:
+            with self._first_build:
+                if self.index is None:
+                    self._start_build()
+                    self._finish_build(self._build())
+            return self.index
+
+        if time.monotonic() - self._built_at > self.refresh_seconds and self._start_build():
+            threading.Thread(target=self._refresh, name=f"{self.name}-refresh", daemon=True).start()
+        return index
+
+    def apply(self, hook):
+        """Apply a write hook(index) to the current index and any build in progress.
+
+        Before the first build this is a no-op. The write has already
+        committed, so errors are logged; the next rebuild corrects the index.
+        """
+        with self._lock:
+            if self.index is not None:
+                self._call(hook, self.index)
+            if self._replay is not None:
+                self._replay.append(hook)
+
+    def _start_build(self):
+        with self._lock:
+            if self._replay is not None:
+                return False
+            self._replay = []
+            return True
+
+    def _build(self):
+        try:
+            return self.build()
+        except Exception:
+            with self._lock:
+                self._replay = None
+                self._built_at = time.monotonic()  # retry after another interval
+            raise
+
+    def _finish_build(self, index):
+        with self._lock:
+            for hook in self._replay:
+                self._call(hook, index)
+            self.index, self._built_at, self._replay = index, time.monotonic(), None
+
+    def _refresh(self):
+        try:
+            self._finish_build(self._build())
+        except Exception as e:
+            print(f"Error rebuilding {self.name}: {e}")
+
+    def _call(self, hook, index):
+        try:
+            hook(index)
+        except Exception as e:
+            print(f"Error updating {self.name}: {e}")
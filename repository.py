@@ -0,0 +1,117 @@
+import threading
+from config import DATA_BACKEND, LOCAL_DB_PATH
+
+# User columns the API may return; password_hash is never one of them
+USER_PUBLIC_FIELDS = ("user_id", "email", "full_name", "profile_pic_url", "created_at")
+
+class Repository:
+    """Data access used by the routes.
+
+    Filters are dicts of request parameters (only the non-empty ones), and
+    read methods return rows that support row["column"] access. Inserts
+    report failures the way BigQuery's insert_rows_json does:
+    [{"index": i, "errors": [...]}].
+    """
+
+    # Entries feed
+    def iter_feed(self, limit, cursor=None):
+        """Yield up to `limit` feed rows, newest first, after the (created_at, entry_id) cursor."""
+        raise NotImplementedError
+
+    def search_entries(self, filters):
+        """Return feed rows matching user_id, entry_id, location, title, latitude or longitude."""
+        raise NotImplementedError
+
+    def get_entries(self, entry_ids):
+        """Return the feed rows of the given entries, in no particular order."""
+        raise NotImplementedError
+
+    def list_entry_texts(self):
+        """Return entry_id, user_id, title, content and location of every entry."""
+        raise NotImplementedError
+
+    def list_entry_locations(self):
+        """Return entry_id, user_id, latitude and longitude of every entry."""
+        raise NotImplementedError
+
+    # Expenses
+    def search_expenses(self, filters):
+        """Return expense rows joined with their entry and author, filtered by entry_id, user_id or category."""
+        raise NotImplementedError
+
+    def list_expense_facts(self):
+        """Return every expense with its entry's author and location, and the expense's created_at."""
+        raise NotImplementedError
+
+    def update_expense(self, entry_id, expense_id, fields):
+        raise NotImplementedError
+
+    def delete_expense(self, expense_id):
+        raise NotImplementedError
+
+    def delete_entry_expenses(self, entry_id):
+        raise NotImplementedError
+
+    # Photos
+    def list_photos(self, filters):
+        """Return photo rows filtered by photo_id, entry_id or user_id."""
+        raise NotImplementedError
+
+    def delete_photos(self, filters):
+        raise NotImplementedError
+
+    # Entries with all of their photos and expenses
+    def delete_entries(self, filters):
+        raise NotImplementedError
+
+    # Users
+    def get_user(self, column, value):
+        """Return the user whose `column` (email or user_id) equals value, or None."""
+        raise NotImplementedError
+
+    def get_user_profiles(self, user_ids):
+        """Return user_id, full_name and profile_pic_url of the given users, one query."""
+        raise NotImplementedError
+
+    def update_user_password(self, user_id, password_hash):
+        raise NotImplementedError
+
+    def list_users(self, fields):
+        """Return the given columns of every user."""
+        raise NotImplementedError
+
+    def iter_users(self, limit, cursor=None, fields=USER_PUBLIC_FIELDS):
+        """Yield up to `limit` users, newest first, after the (created_at, user_id) cursor.
+
+        Only `fields` are read, plus created_at and user_id for the cursor.
+        """
+        raise NotImplementedError
+
+    def search_users(self, filters):
+        """Return users matching any of user_id, email or name."""
+        raise NotImplementedError
+
+    # Writes and ID checks
+    def insert_rows(self, table, rows):
+        raise NotImplementedError
+
+    def find_existing_ids(self, table, column, ids):
+        """Return the subset of ids already present in table.column."""
+        raise NotImplementedError
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """Return the repository for the configured DATA_BACKEND ("bigquery" or "sqlite")."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            from metrics import InstrumentedRepository
+            if DATA_BACKEND == "sqlite":
+                from sqlite_repository import SQLiteRepository
+                _repository = InstrumentedRepository(SQLiteRepository(LOCAL_DB_PATH), "sqlite")
+            else:
+                from bigquery_repository import BigQueryRepository
+                _repository = InstrumentedRepository(BigQueryRepository(), "bigquery")
+        return _repository
@@ -0,0 +1,130 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, make_response
+from cache import make_cache
+from id_allocator import uuid7
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+
+response_cache = make_cache("responses", maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+# Each tag maps to a token that changes whenever the tag is invalidated.
+# Cached responses record the tokens of their tags when stored and are
+# only served while every token still matches, so a missing (evicted)
+# token counts as invalidated rather than valid.
+tag_tokens = make_cache("response_tags", maxsize=RESPONSE_CACHE_SIZE * 20, ttl=RESPONSE_CACHE_TTL * 10)
+
+# Keys whose values identify the rows a response was built from
+TAG_FIELDS = ("entry_id", "user_id", "expense_id", "photo_id")
+SCOPE_PARAMS = {"entry_id": "entry", "user_id": "user", "photo_id": "photo"}
+
+def cache_key(endpoint, args):
+    """Key a response by endpoint and its normalized query parameters."""
+    params = sorted(
+        (key, value.strip())
+        for key in args
+        for value in args.getlist(key)
+        if value.strip()
+    )
+    return f"{endpoint}?{urlencode(params)}"
+
+def request_tags(endpoint, args):
+    """Tags known before the view runs: the ids a response was filtered on.
+
+    Responses not scoped to an entry or user also get an "open:<endpoint>"
+    tag, since any new row could match.
+    """
+    tags = set()
+    for param, prefix in SCOPE_PARAMS.items():
+        if args.get(param):
+            tags.add(f"{prefix}:{args[param]}")
+    if not (args.get("entry_id") or args.get("user_id")):
+        tags.add(f"open:{endpoint}")
+    return tags
+
+def payload_tags(payload):
+    """Tags for every entry/user/expense/photo id a response contains."""
+    tags = set()
+    stack = [payload]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            for field in TAG_FIELDS:
+                if value.get(field) is not None:
+                    tags.add(f"{field[:-3]}:{value[field]}")
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return tags
+
+def current_token(tag):
+    token = tag_tokens.get(tag)
+    if token is None:
+        token = uuid7()
+        tag_tokens.set(tag, token)
+    return token
+
+def is_fresh(entry):
+    return all(tag_tokens.get(tag) == token for tag, token in entry["tags"].items())
+
+def not_modified_or(body, etag):
+    """Answer a conditional GET with 304 if the client's copy is current."""
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = make_response(body, 200)
+        response.mimetype = "application/json"
+    response.set_etag(etag)
+    return response
+
+def cached_response(endpoint):
+    """Serve a GET view from the response cache, with ETag/If-None-Match support.
+
+    Only 200 JSON responses are cached; streamed formats bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get("format", "json") != "json":
+                return view(*args, **kwargs)
+
+            key = cache_key(endpoint, request.args)
+            entry = response_cache.get(key)
+            if entry and is_fresh(entry):
+                return not_modified_or(entry["body"], entry["etag"])
+
+            # Tokens are taken before the view reads anything, so a write
+            # landing while it runs leaves the stored entry already stale
+            started = uuid7()
+            tokens = {tag: current_token(tag) for tag in request_tags(endpoint, request.args)}
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or not response.is_json:
+                return response
+
+            body = response.get_data(as_text=True)
+            etag = hashlib.sha1(body.encode()).hexdigest()
+
+            # Ids found in the payload are only known now. Tokens are UUIDv7s,
+            # so one newer than `started` was set by a write during the view;
+            # such a response is returned but not stored.
+            for tag in payload_tags(response.get_json()) - tokens.keys():
+                token = tag_tokens.get(tag)
+                if token is not None and token > started:
+                    return not_modified_or(body, etag)
+                tokens[tag] = token or current_token(tag)
+
+            response_cache.set(key, {"body": body, "etag": etag, "tags": tokens})
+            return not_modified_or(body, etag)
+        return wrapper
+    return decorator
+
+def invalidate(entry_ids=(), user_ids=(), expense_ids=(), photo_ids=(), endpoints=()):
+    """Evict cached responses touching these ids, and unscoped responses of `endpoints`."""
+    tags = [f"entry:{id_}" for id_ in entry_ids]
+    tags += [f"user:{id_}" for id_ in user_ids]
+    tags += [f"expense:{id_}" for id_ in expense_ids]
+    tags += [f"photo:{id_}" for id_ in photo_ids]
+    tags += [f"open:{endpoint}" for endpoint in endpoints]
+    for tag in tags:
+        tag_tokens.set(tag, uuid7())
@@ -1,12 +1,17 @@
 from flask import Blueprint, jsonify, request
-from werkzeug.security import generate_password_hash, check_password_hash
-from google.cloud import bigquery
 from datetime import datetime
-from config import client, DATASET_NAME, TABLE_NAME
-from utils import upload_image_to_gcs, get_user_by_email
+from config import TABLE_NAME
+from batch_writer import write_rows
+from repository import get_repository
+from password_hasher import hasher, HasherBusy
+from user_index import index_user
+from utils import upload_image_to_gcs, get_user_by_email, invalidate_user
 
 auth_bp = Blueprint('auth', __name__)
 
+def hasher_busy():
+    return jsonify({"error": "Too many login attempts in progress, try again shortly"}), 503, {"Retry-After": "1"}
+
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'GET':
@@ -42,7 +47,7 @@ def register():
     profile_pic_url = None
 
     if profile_pic:
-        profile_pic_url = upload_image_to_gcs(profile_pic, user_id)
+        profile_pic_url = upload_image_to_gcs(profile_pic)
 
     if not email or not password or not full_name:
         return jsonify({"error": "Missing required fields"}), 400
@@ -51,22 +56,30 @@ def register():
     if get_user_by_email(email):
         return jsonify({"error": "User already exists"}), 400
 
+    try:
+        password_hash = hasher.hash(password)
+    except HasherBusy:
+        return hasher_busy()
+
     # Insert new user
     user_data = {
         "user_id": user_id,
         "email": email,
-        "password_hash": generate_password_hash(password),
+        "password_hash": password_hash,
         "full_name": full_name,
         "profile_pic_url": profile_pic_url,
         "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
     }
 
-    table_id = f"{client.project}.{DATASET_NAME}.{TABLE_NAME}"
-    errors = client.insert_rows_json(table_id, [user_data])
+    errors = write_rows(TABLE_NAME, [user_data], inputs=[{"email": email}])
     
     if errors:
         return jsonify({"error": f"Error inserting user: {errors}"}), 500
 
+    # The email or user_id may be cached from an earlier lookup on another worker
+    invalidate_user(email, user_id)
+    index_user(user_data)
+
     return jsonify({"message": "User created successfully"}), 201
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -90,13 +103,29 @@ def login():
     email = request.form.get('email')
     password = request.form.get('password')
 
+    if not email or not password:
+        return jsonify({"error": "Missing required fields"}), 400
+
     user = get_user_by_email(email)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    if not check_password_hash(user['password_hash'], password):
+    try:
+        matches, new_hash = hasher.verify(user['password_hash'], password)
+    except HasherBusy:
+        return hasher_busy()
+
+    if not matches:
         return jsonify({"error": "Invalid password"}), 401
-    
+
+    # The stored hash used older parameters; upgrade it now that we have the password
+    if new_hash:
+        try:
+            get_repository().update_user_password(user['user_id'], new_hash)
+            invalidate_user(email)
+        except Exception as e:
+            print(f"Error rehashing password: {e}")
+
     return jsonify({"message": "Login successful"}), 200
     
     
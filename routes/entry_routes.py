@@ -1,93 +1,64 @@
-from flask import Blueprint, jsonify, request
-from werkzeug.utils import secure_filename
-from config import client, DATASET_NAME, storage_client, BUCKET_NAME
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from werkzeug.datastructures import FileStorage
 from utils import (
-    delete_photos_from_storage, 
+    delete_photo_records,
+    delete_entry_records,
+    save_entry_photos,
     insert_text_entry, 
     handle_photos, 
     handle_expenses,
-    generate_unique_id
+    parse_limit,
+    decode_cursor,
+    collect_page,
+    stream_page,
+    with_authors,
+    non_empty
 )
-import uuid
+from feed_query import format_entry_row
+from repository import get_repository
+from geo_index import get_geo_index
+from text_index import get_text_index
+from expense_rollups import (
+    DIMENSIONS as EXPENSE_DIMENSIONS,
+    get_expense_rollups,
+    track_entry,
+    track_expenses,
+    track_expense_update,
+    untrack_expense,
+    untrack_entry_expenses
+)
+from currency import convert_amounts
+from image_pipeline import rendition_urls
+from direct_upload import issue_uploads, complete_uploads
+from batch_ingest import ingest_entries
+from id_allocator import allocate_ids
+from batch_writer import write_rows
+from jobs import job_queue
+from response_cache import cached_response, invalidate
+import numpy as np
+from io import BytesIO
 from datetime import datetime
-from google.cloud import bigquery
+from upload_executor import run_tasks
+from config import NEARBY_MAX_RADIUS_KM, CREATE_ENTRY_FAN_OUT, MAX_UPLOADS_PER_REQUEST, MAX_BATCH_ENTRIES, ASYNC_BY_DEFAULT, UPLOAD_SIGNING_KEY
 
 entry_bp = Blueprint('entry', __name__)
 
-def insert_text_entry(entry_id, form_data):
-    
-    try:
-        text_entry = {
-            "entry_id": entry_id,
-            "title": form_data.get("title"),
-            "content": form_data.get("content"),
-            "location": form_data.get("location"),
-            "latitude": float(form_data.get("latitude")) if form_data.get("latitude") else 0.0,
-            "longitude": float(form_data.get("longitude")) if form_data.get("longitude") else 0.0,
-            "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        text_table_id = f"{client.project}.{DATASET_NAME}.text_entries"
-        errors = client.insert_rows_json(text_table_id, [text_entry])
-        return errors
-    except Exception as e:
-        print(f"Error in insert_text_entry: {str(e)}")
-        raise
+def wants_async():
+    """Whether the operation should run as a background job.
 
-def handle_photos(entry_id, photos):
-    """Handle photo uploads and return their URLs."""
-    photo_urls = []
-    
-    try:
-        for i, photo in enumerate(photos):
-            if photo:
-                photo_id = generate_unique_id("photos", "photo_id")
-                
-                photo_url = upload_image_to_gcs(photo, entry_id)
-                
-                if photo_url:
-                    photo_data = {
-                        "photo_id": photo_id,
-                        "entry_id": entry_id,
-                        "photo_url": photo_url,
-                        "user_id": 1,
-                        "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    
-                    photos_table_id = f"{client.project}.{DATASET_NAME}.photos"
-                    errors = client.insert_rows_json(photos_table_id, [photo_data])
-                    
-                    photo_urls.append(photo_url)
-        return photo_urls
-    except Exception as e:
-        print(f"Error in handle_photos: {str(e)}")
-        raise
+    ?async=true/false decides; without it, ASYNC_BY_DEFAULT does.
+    """
+    value = request.args.get('async', '').lower()
+    if not value:
+        return ASYNC_BY_DEFAULT
+    return value in ('1', 'true', 'yes')
 
-def handle_expenses(entry_id, expenses):
-    """Handle expenses and insert them into the database."""
-    
-    try:
-        for i, expense in enumerate(expenses):
-            if expense:
-                category, amount = expense.split(":")
-                
-                expense_id = generate_unique_id("expenses", "expense_id")
-                
-                expense_data = {
-                    "expense_id": expense_id,
-                    "entry_id": entry_id,
-                    "category": category,
-                    "amount": float(amount),
-                    "user_id": 1,
-                    "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
-                expenses_table_id = f"{client.project}.{DATASET_NAME}.expenses"
-                errors = client.insert_rows_json(expenses_table_id, [expense_data])
-                print(f"Expense insert errors (if any): {errors}")
-    except Exception as e:
-        print(f"Error in handle_expenses: {str(e)}")
-        raise
+def queued_response(job_id, message):
+    return jsonify({
+        "message": message,
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
 
 @entry_bp.route('/entry-form')
 def entry_form():
@@ -104,25 +75,81 @@ def entry_form():
     </form>
     '''
 
+def written_children(results, expenses):
+    """The photo URLs and expenses create_entry's stages managed to write."""
+    photos, photo_error = results["photos"]
+    expense_errors, expense_error = results["expenses"]
+    failed = {error["index"] for error in expense_errors or []}
+    return {
+        "photo_urls": [] if photo_error else photos[0],
+        "expenses": [] if expense_error else [
+            expense for i, expense in enumerate(e for e in expenses if e) if i not in failed
+        ]
+    }
+
 @entry_bp.route('/api/entries', methods=['POST'])
 def create_entry():
     
     try:
         # Generate entry ID
-        entry_id = generate_unique_id("text_entries", "entry_id")
-        
-        # Insert text entry
-        errors = insert_text_entry(entry_id, request.form)
-        if errors:
-            return jsonify({"error": f"Error inserting text entry: {errors}"}), 500
+        entry_id = allocate_ids(1, "text_entries", "entry_id")[0]
 
-        # Handle photos
+        # Read the form here; the stages may run on other threads
+        form = request.form
         photos = request.files.getlist("photos")
-        photo_urls = handle_photos(entry_id, photos)
-
-        # Handle expenses
         expenses = request.form.getlist("expenses")
-        handle_expenses(entry_id, expenses)
+
+        # Expenses may be written before the entry row, so the rollups learn
+        # the entry's location up front
+        track_entry(entry_id, None, form.get("location"))
+
+        # The text insert, photo uploads and expense inserts only share the entry_id
+        tasks = {
+            "text": lambda: insert_text_entry(entry_id, form),
+            "photos": lambda: handle_photos(entry_id, photos),
+            "expenses": lambda: handle_expenses(entry_id, expenses)
+        }
+        results = run_tasks(tasks, concurrent=CREATE_ENTRY_FAN_OUT)
+
+        errors, error = results["text"]
+        if error or errors:
+            response = {"error": f"Error inserting text entry: {error or errors}"}
+            # Don't leave photos or expenses behind for an entry that doesn't
+            # exist. On BigQuery the DELETE fails while the rows are still in
+            # the streaming buffer; then report what was left behind instead
+            try:
+                delete_entry_records({"entry_id": entry_id})
+            except Exception as e:
+                print(f"Error cleaning up entry {entry_id}: {e}")
+                response["orphaned"] = written_children(results, expenses)
+            return jsonify(response), 500
+
+        # A new entry can show up in any unfiltered feed or search; its child
+        # rows are written with the placeholder user_id 1. This runs before a
+        # failed stage is re-raised, since the other stages' rows are written
+        invalidate(
+            entry_ids=[entry_id],
+            user_ids=[1],
+            endpoints=["entries", "entries_search", "entries_nearby", "expenses_search"]
+        )
+
+        for name in ("photos", "expenses"):
+            if results[name][1]:
+                raise results[name][1]
+        photo_urls, photo_errors = results["photos"][0]
+        expense_errors = results["expenses"][0]
+
+        if photo_errors or expense_errors:
+            return jsonify({
+                "message": "Partial success",
+                "entry_id": entry_id,
+                "photo_urls": photo_urls,
+                "expenses": expenses,
+                "errors": {
+                    "photos": photo_errors,
+                    "expenses": expense_errors
+                }
+            }), 207
 
         return jsonify({
             "message": "Entry created successfully",
@@ -134,89 +161,129 @@ def create_entry():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@entry_bp.route('/api/entries/batch', methods=['POST'])
+def create_entries_batch():
+    try:
+        # {"user_id": ..., "device_id": ...,
+        #  "entries": [{"idempotency_key": ..., "title": ..., "expenses": [...], "photos": [photo_url, ...]}, ...]}
+        payload = request.get_json(silent=True) or {}
+        entries = payload.get("entries")
+        user_id = payload.get("user_id")
+        device_id = payload.get("device_id")
+
+        # Idempotency keys are scoped to the sending user and device
+        if not all(isinstance(value, str) and value.strip() for value in (user_id, device_id)):
+            return jsonify({"error": "Please provide user_id and device_id"}), 400
+        if not isinstance(entries, list) or not entries:
+            return jsonify({"error": "Please provide entries as a non-empty list"}), 400
+        if len(entries) > MAX_BATCH_ENTRIES:
+            return jsonify({"error": f"At most {MAX_BATCH_ENTRIES} entries per batch"}), 400
+
+        def ingest(entries):
+            result = ingest_entries(entries, user_id, device_id)
+            entry_ids = [item["entry_id"] for item in result["results"].values()]
+            if entry_ids:
+                invalidate(
+                    entry_ids=entry_ids,
+                    user_ids=[user_id],
+                    endpoints=["entries", "entries_search", "entries_nearby", "expenses_search"]
+                )
+            return result
+
+        if wants_async():
+            job_id = job_queue.submit("entry_batch", ingest, entries)
+            return queued_response(job_id, "Entry batch queued")
+
+        result = ingest(entries)
+        failed = [key for key, item in result["results"].items() if item["status"] == "failed"]
+
+        # Failed items can be retried with the same idempotency_key
+        if failed or result["errors"]:
+            status = 400 if len(failed) + len(result["errors"]) == len(entries) else 207
+            return jsonify({
+                "message": "Partial success" if status == 207 else "No entries were written",
+                "results": result["results"],
+                "errors": result["errors"]
+            }), status
+
+        return jsonify({
+            "message": f"Processed {len(entries)} entries",
+            "results": result["results"]
+        }), 200
+
+    except Exception as e:
+        print(f"Error ingesting entry batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @entry_bp.route('/api/entries', methods=['GET'])
+@cached_response('entries')
 def get_entries():
     try:
-        query = f"""
-        SELECT 
-            t.entry_id,
-            t.user_id,
-            t.title,
-            t.content,
-            t.location,
-            t.latitude,
-            t.longitude,
-            t.created_at,
-            ARRAY_AGG(p.photo_url IGNORE NULLS) as photo_urls,
-            ARRAY_AGG(e.category IGNORE NULLS) as expense_categories,
-            ARRAY_AGG(e.amount IGNORE NULLS) as expense_amounts,
-            ARRAY_AGG(e.currency IGNORE NULLS) as expense_currencies,
-            u.full_name,
-            u.profile_pic_url
-        FROM `{client.project}.{DATASET_NAME}.text_entries` t
-        LEFT JOIN `{client.project}.{DATASET_NAME}.photos` p 
-            ON t.entry_id = p.entry_id
-        LEFT JOIN `{client.project}.{DATASET_NAME}.expenses` e 
-            ON t.entry_id = e.entry_id
-        LEFT JOIN `{client.project}.{DATASET_NAME}.users` u 
-            ON CAST(t.user_id AS STRING) = u.user_id
-        GROUP BY 
-            t.entry_id,
-            t.user_id,
-            t.title,
-            t.content,
-            t.location,
-            t.latitude,
-            t.longitude,
-            t.created_at,
-            u.full_name,
-            u.profile_pic_url
-        ORDER BY t.created_at DESC
-        """
-
-        query_job = client.query(query)
-        entries = []
+        output_format = request.args.get('format', 'json')
+        if output_format not in ('json', 'ndjson', 'json-stream'):
+            return jsonify({"error": "format must be one of json, ndjson or json-stream"}), 400
 
-        for row in query_job:
-            expenses = []
-            for i in range(len(row.expense_categories)):
-                if row.expense_categories[i]:
-                    expenses.append({
-                        "category": row.expense_categories[i],
-                        "amount": row.expense_amounts[i],
-                        "currency": row.expense_currencies[i]
-                    })
-
-            entry = {
-                "entry_id": row.entry_id,
-                "user_id": row.user_id,
-                "title": row.title,
-                "content": row.content,
-                "location": row.location,
-                "latitude": row.latitude,
-                "longitude": row.longitude,
-                "created_at": row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None,
-                "author": {
-                    "name": row.full_name,
-                    "profile_pic": row.profile_pic_url
-                } if row.full_name else None,
-                "photos": [url for url in row.photo_urls if url is not None],
-                "expenses": expenses
-            }
-            entries.append(entry)
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Keyset pagination on (created_at, entry_id), newest first; the
+        # extra row tells us whether there is a next page
+        rows = with_authors(get_repository().iter_feed(limit + 1, cursor))
+
+        if output_format != 'json':
+            mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+            page = stream_page(rows, limit, output_format, format_entry_row, "entry_id", "entries")
+            return Response(stream_with_context(page), mimetype=mimetype)
+
+        entries, next_cursor = collect_page(rows, limit, format_entry_row, "entry_id")
 
         return jsonify({
             "entries": entries,
-            "count": len(entries)
+            "count": len(entries),
+            "next_cursor": next_cursor
         }), 200
 
     except Exception as e:
         print("Error details:", e) 
         return jsonify({"error": str(e)}), 500
 
+def full_text_search(q, user_id):
+    """Rank entries for `q` with the text index, best match first."""
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    matches = get_text_index().search(q, limit, user_id=user_id)
+    scores = {entry_id: score for score, entry_id in matches}
+    rows = with_authors(get_repository().get_entries(list(scores))) if scores else []
+
+    entries = []
+    for row in rows:
+        entry = format_entry_row(row)
+        entry["score"] = round(scores[row["entry_id"]], 4)
+        entries.append(entry)
+    entries.sort(key=lambda entry: entry["score"], reverse=True)
+
+    return jsonify({
+        "entries": entries,
+        "count": len(entries)
+    }), 200
+
 @entry_bp.route('/api/entries/search', methods=['GET'])
+@cached_response('entries_search')
 def search_entries():
     try:
+        # q= searches title, content and location through the text index and
+        # can only be narrowed further by user_id
+        q = request.args.get('q')
+        if q:
+            return full_text_search(q, request.args.get('user_id'))
+
         # Get search parameters from query string
         user_id = request.args.get('user_id')
         entry_id = request.args.get('entry_id')
@@ -225,112 +292,18 @@ def search_entries():
         latitude = request.args.get('latitude')
         longitude = request.args.get('longitude')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
-
-        if user_id:
-            conditions.append("CAST(t.user_id AS STRING) = @user_id")
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
-            
-        if entry_id:
-            conditions.append("t.entry_id = @entry_id")
-            query_params.append(bigquery.ScalarQueryParameter("entry_id", "INTEGER", int(entry_id)))
-            
-        if location:
-            conditions.append("LOWER(t.location) LIKE CONCAT('%', LOWER(@location), '%')")
-            query_params.append(bigquery.ScalarQueryParameter("location", "STRING", location))
-            
-        if title:
-            conditions.append("LOWER(t.title) LIKE CONCAT('%', LOWER(@title), '%')")
-            query_params.append(bigquery.ScalarQueryParameter("title", "STRING", title))
-            
-        if latitude:
-            conditions.append("t.latitude = @latitude")
-            query_params.append(bigquery.ScalarQueryParameter("latitude", "FLOAT64", float(latitude)))
-            
-        if longitude:
-            conditions.append("t.longitude = @longitude")
-            query_params.append(bigquery.ScalarQueryParameter("longitude", "FLOAT64", float(longitude)))
+        filters = non_empty(
+            user_id=user_id, entry_id=entry_id, location=location,
+            title=title, latitude=latitude, longitude=longitude
+        )
 
         # If no search params provided, return error
-        if not conditions:
+        if not filters:
             return jsonify({
-                "error": "Please provide at least one search parameter (user_id, entry_id, location, title, latitude, or longitude)"
+                "error": "Please provide at least one search parameter (q, user_id, entry_id, location, title, latitude, or longitude)"
             }), 400
 
-        # Construct query
-        query = f"""
-        SELECT 
-            t.entry_id,
-            t.user_id,
-            t.title,
-            t.content,
-            t.location,
-            t.latitude,
-            t.longitude,
-            t.created_at,
-            ARRAY_AGG(e.expense_id IGNORE NULLS) as expense_ids,  -- Added this line
-            ARRAY_AGG(p.photo_url IGNORE NULLS) as photo_urls,
-            ARRAY_AGG(e.category IGNORE NULLS) as expense_categories,
-            ARRAY_AGG(e.amount IGNORE NULLS) as expense_amounts,
-            ARRAY_AGG(e.currency IGNORE NULLS) as expense_currencies,
-            u.full_name,
-            u.profile_pic_url
-        FROM `{client.project}.{DATASET_NAME}.text_entries` t
-        LEFT JOIN `{client.project}.{DATASET_NAME}.photos` p 
-            ON t.entry_id = p.entry_id
-        LEFT JOIN `{client.project}.{DATASET_NAME}.expenses` e 
-            ON t.entry_id = e.entry_id
-        LEFT JOIN `{client.project}.{DATASET_NAME}.users` u 
-            ON CAST(t.user_id AS STRING) = u.user_id
-        WHERE {" AND ".join(conditions)}
-        GROUP BY 
-            t.entry_id,
-            t.user_id,
-            t.title,
-            t.content,
-            t.location,
-            t.latitude,
-            t.longitude,
-            t.created_at,
-            u.full_name,
-            u.profile_pic_url
-        ORDER BY t.created_at DESC
-        """
-
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-        query_job = client.query(query, job_config=job_config)
-        entries = []
-
-        for row in query_job:
-            expenses = []
-            for i in range(len(row.expense_categories or [])):
-                if row.expense_categories[i]:
-                    expenses.append({
-                        "category": row.expense_categories[i],
-                        "amount": row.expense_amounts[i],
-                        "currency": row.expense_currencies[i]
-                    })
-
-            entry = {
-                "expense_id": row.expense_id,
-                "entry_id": row.entry_id,
-                "user_id": row.user_id,
-                "title": row.title,
-                "content": row.content,
-                "location": row.location,
-                "latitude": row.latitude,
-                "longitude": row.longitude,
-                "created_at": row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None,
-                "author": {
-                    "name": row.full_name,
-                    "profile_pic": row.profile_pic_url
-                } if row.full_name else None,
-                "photos": [url for url in row.photo_urls if url is not None],
-                "expenses": expenses
-            }
-            entries.append(entry)
+        entries = [format_entry_row(row) for row in with_authors(get_repository().search_entries(filters))]
 
         return jsonify({
             "entries": entries,
@@ -341,7 +314,63 @@ def search_entries():
         print(f"Error searching entries: {e}")
         return jsonify({"error": str(e)}), 500
     
+def parse_nearby_args(args):
+    """Read a radius (lat, lon, radius_km) or bbox (min_lat,min_lon,max_lat,max_lon) query."""
+    if args.get('bbox'):
+        min_lat, min_lon, max_lat, max_lon = (float(value) for value in args['bbox'].split(','))
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon in degrees")
+        return {"bbox": (min_lat, min_lon, max_lat, max_lon)}
+
+    if not (args.get('lat') and args.get('lon')):
+        raise ValueError("Please provide lat and lon, or bbox")
+    lat = float(args['lat'])
+    lon = float(args['lon'])
+    radius_km = float(args.get('radius_km', 10))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat must be within [-90, 90] and lon within [-180, 180]")
+    if not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+        raise ValueError(f"radius_km must be greater than 0 and at most {NEARBY_MAX_RADIUS_KM}")
+    return {"lat": lat, "lon": lon, "radius_km": radius_km}
+
+@entry_bp.route('/api/entries/nearby', methods=['GET'])
+@cached_response('entries_nearby')
+def nearby_entries():
+    try:
+        try:
+            query = parse_nearby_args(request.args)
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Candidates come from the grid index; only those are distance-checked
+        index = get_geo_index()
+        if "bbox" in query:
+            matches = index.within_box(*query["bbox"], limit)
+        else:
+            matches = index.nearby(query["lat"], query["lon"], query["radius_km"], limit)
+
+        distances = {entry_id: distance for distance, entry_id in matches}
+        rows = with_authors(get_repository().get_entries(list(distances))) if distances else []
+
+        entries = []
+        for row in rows:
+            entry = format_entry_row(row)
+            entry["distance_km"] = round(distances[row["entry_id"]], 3)
+            entries.append(entry)
+        entries.sort(key=lambda entry: entry["distance_km"])
+
+        return jsonify({
+            "entries": entries,
+            "count": len(entries)
+        }), 200
+
+    except Exception as e:
+        print(f"Error finding nearby entries: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @entry_bp.route('/api/expenses/search', methods=['GET'])
+@cached_response('expenses_search')
 def search_expenses():
     try:
         # Get search parameters from query string
@@ -349,97 +378,107 @@ def search_expenses():
         user_id = request.args.get('user_id')
         category = request.args.get('category')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
-
-        if entry_id:
-            conditions.append("e.entry_id = @entry_id")
-            query_params.append(bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id))
-            
-        if user_id:
-            conditions.append("t.user_id = @user_id") 
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
-            
-        if category:
-            conditions.append("e.category = @category")
-            query_params.append(bigquery.ScalarQueryParameter("category", "STRING", category))
+        filters = non_empty(entry_id=entry_id, user_id=user_id, category=category)
 
         # If no search params provided, return error
-        if not conditions:
+        if not filters:
             return jsonify({"error": "Please provide at least one search parameter (entry_id, user_id, or category)"}), 400
 
-        # Construct query
-        query = f"""
-            SELECT 
-                e.entry_id,
-                e.expense_id,
-                t.user_id,
-                e.category,
-                e.amount,
-                e.currency,
-                t.title,
-                t.location,
-                t.created_at,
-                u.full_name,
-                u.profile_pic_url
-            FROM `{client.project}.{DATASET_NAME}.expenses` e
-            JOIN `{client.project}.{DATASET_NAME}.text_entries` t ON e.entry_id = t.entry_id
-            LEFT JOIN `{client.project}.{DATASET_NAME}.users` u ON t.user_id = u.user_id
-            WHERE {" AND ".join(conditions)}
-            ORDER BY t.created_at DESC
-        """
-
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-        query_job = client.query(query, job_config=job_config)
-        results = list(query_job.result())
+        convert_to = request.args.get('convert_to')
+        results = list(get_repository().search_expenses(filters))
+
+        # Convert every amount in one pass, at the rate of the entry's date
+        converted = None
+        if convert_to:
+            try:
+                converted = convert_amounts(
+                    [row["amount"] for row in results],
+                    [row["currency"] for row in results],
+                    [row["created_at"] for row in results],
+                    convert_to
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
         # Format results
         expenses = []
-        for row in results:
+        for i, row in enumerate(results):
             expense = {
-                "expense_id": row.expense_id,
-                "entry_id": row.entry_id,
-                "user_id": row.user_id,
-                "category": row.category,
-                "amount": row.amount,
-                "currency": row.currency,
-                "entry_title": row.title,
-                "location": row.location,
-                "created_at": row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None,
+                "expense_id": row["expense_id"],
+                "entry_id": row["entry_id"],
+                "user_id": row["user_id"],
+                "category": row["category"],
+                "amount": row["amount"],
+                "currency": row["currency"],
+                "entry_title": row["title"],
+                "location": row["location"],
+                "created_at": row["created_at"].strftime('%Y-%m-%d %H:%M:%S') if row["created_at"] else None,
                 "author": {
-                    "name": row.full_name,
-                    "profile_pic": row.profile_pic_url
-                } if row.full_name else None
+                    "name": row["full_name"],
+                    "profile_pic": row["profile_pic_url"]
+                } if row["full_name"] else None
             }
+            if converted is not None:
+                expense["converted_amount"] = None if np.isnan(converted[i]) else round(float(converted[i]), 2)
             expenses.append(expense)
 
-        return jsonify({
+        response = {
             "expenses": expenses,
             "count": len(expenses)
-        }), 200
+        }
+        if converted is not None:
+            response["currency"] = convert_to.upper()
+            response["total"] = round(float(np.nansum(converted)), 2)
+            response["unconverted"] = int(np.isnan(converted).sum())
+        return jsonify(response), 200
 
     except Exception as e:
         print(f"Error searching expenses: {e}")
         return jsonify({"error": str(e)}), 500
 
+@entry_bp.route('/api/expenses/summary', methods=['GET'])
+def expenses_summary():
+    try:
+        # group_by=category,month; filters on any dimension narrow the groups
+        group_by = request.args.get('group_by', 'category').split(',')
+        group_by = list(dict.fromkeys(name.strip() for name in group_by if name.strip()))
+        unknown = [name for name in group_by if name not in EXPENSE_DIMENSIONS]
+        if unknown or not group_by:
+            return jsonify({
+                "error": f"group_by must be a comma-separated list of: {', '.join(EXPENSE_DIMENSIONS)}"
+            }), 400
+        filters = non_empty(**{name: request.args.get(name) for name in EXPENSE_DIMENSIONS})
+        convert_to = request.args.get('convert_to')
+
+        try:
+            groups, unconverted = get_expense_rollups().summary(group_by, filters, convert_to)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        groups.sort(key=lambda group: group["total"], reverse=True)
+
+        summary = {
+            "group_by": group_by,
+            "filters": filters,
+            "groups": groups,
+            "count": sum(group["count"] for group in groups),
+            "total": round(sum(group["total"] for group in groups), 2)
+        }
+        if convert_to:
+            summary["currency"] = convert_to.upper()
+            summary["unconverted"] = unconverted
+        return jsonify(summary), 200
+
+    except Exception as e:
+        print(f"Error summarizing expenses: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @entry_bp.route('/api/expenses/<expense_id>', methods=['DELETE'])
 def delete_expense(expense_id):
     try:
         # Delete expense by expense_id
-        query = f"""
-            DELETE FROM `{client.project}.{DATASET_NAME}.expenses`
-            WHERE expense_id = @expense_id
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("expense_id", "STRING", expense_id)
-            ]
-        )
-        
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for query to complete
+        get_repository().delete_expense(expense_id)
+        untrack_expense(expense_id)
+        invalidate(expense_ids=[expense_id])
 
         return jsonify({"message": "Expense deleted successfully"}), 200
 
@@ -451,19 +490,9 @@ def delete_expense(expense_id):
 def delete_entry_expenses(entry_id):
     try:
         # Delete all expenses for an entry
-        query = f"""
-            DELETE FROM `{client.project}.{DATASET_NAME}.expenses`
-            WHERE entry_id = @entry_id
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id)
-            ]
-        )
-        
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for query to complete
+        get_repository().delete_entry_expenses(entry_id)
+        untrack_entry_expenses({"entry_id": entry_id})
+        invalidate(entry_ids=[entry_id])
 
         return jsonify({"message": "All expenses for entry deleted successfully"}), 200
 
@@ -479,7 +508,7 @@ def add_entry_expense(entry_id):
         expense_data = request.get_json()
         
         # Generate unique expense ID
-        expense_id = generate_unique_id("expenses", "expense_id")
+        expense_id = allocate_ids(1, "expenses", "expense_id")[0]
         
         # Prepare expense data for insertion
         expense = {
@@ -488,15 +517,18 @@ def add_entry_expense(entry_id):
             "amount": float(expense_data.get("amount", 0.0)),
             "currency": expense_data.get("currency", "USD"),
             "category": expense_data.get("category", "Other"),
-            "user_id": 1 # TODO: change to user_id
+            "user_id": 1, # TODO: change to user_id
+            "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         }
         
         # Insert into expenses table
-        expenses_table_id = f"{client.project}.{DATASET_NAME}.expenses"
-        errors = client.insert_rows_json(expenses_table_id, [expense])
+        errors = write_rows("expenses", [expense])
         
         if errors:
             raise Exception(f"Error inserting expense: {errors}")
+
+        track_expenses([expense])
+        invalidate(entry_ids=[entry_id], user_ids=[1], endpoints=["expenses_search"])
             
         return jsonify({
             "message": "Expense added successfully",
@@ -514,46 +546,27 @@ def update_entry_expense(entry_id, expense_id):
         # Get updated expense data from request
         expense_data = request.get_json()
         
-        # Build update query based on provided fields
-        update_fields = []
+        # Collect the provided fields to update
+        update_fields = {}
         if "amount" in expense_data:
-            update_fields.append(f"amount = {float(expense_data['amount'])}")
+            update_fields["amount"] = float(expense_data["amount"])
         if "category" in expense_data:
-            update_fields.append(f"category = '{expense_data['category']}'")
+            update_fields["category"] = expense_data["category"]
         if "currency" in expense_data:
-            update_fields.append(f"currency = '{expense_data['currency']}'")
+            update_fields["currency"] = expense_data["currency"]
             
         if not update_fields:
             return jsonify({"error": "No fields to update provided"}), 400
-            
-        update_query = f"""
-            UPDATE `{client.project}.{DATASET_NAME}.expenses`
-            SET {', '.join(update_fields)}
-            WHERE expense_id = @expense_id
-            AND entry_id = @entry_id
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("expense_id", "STRING", expense_id),
-                bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id)
-            ]
-        )
-        
-        query_job = client.query(update_query, job_config=job_config)
-        query_job.result()  # Wait for query to complete
+
+        get_repository().update_expense(entry_id, expense_id, update_fields)
+        track_expense_update(entry_id, expense_id, update_fields)
+        invalidate(entry_ids=[entry_id], expense_ids=[expense_id], endpoints=["expenses_search"])
         
         return jsonify({"message": "Expense updated successfully"}), 200
 
     except Exception as e:
         print(f"Error updating expense: {e}")
         return jsonify({"error": str(e)}), 500
-    
-    # Error occured:
-    # This error occurs because BigQuery has a limitation with streaming inserts: 
-    # you cannot UPDATE or DELETE records that are in the streaming buffer 
-    # (recently inserted data). The data needs to be "settled" first, which 
-    # typically takes about 30 minutes to a few hours.
 
 
 @entry_bp.route('/test-photo-upload')
@@ -610,50 +623,37 @@ def add_entry_photo(entry_id):
         if not files:
             return jsonify({"error": "No photos selected"}), 400
 
-        uploaded_photos = []
-        
-        for photo in files:
-            if photo.filename == '':
-                continue
-                
-            if not photo.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                continue
+        files = [
+            photo for photo in files
+            if photo.filename != '' and photo.filename.lower().endswith(('.png', '.jpg', '.jpeg'))
+        ]
+
+        def upload_photos(files):
+            result = save_entry_photos(entry_id, files)
+            invalidate(entry_ids=[entry_id], user_ids=list({photo["user_id"] for photo in result["photos"]}))
+            return result
+
+        if files and wants_async():
+            # Buffer the uploads; request.files is closed once we return
+            buffered = [
+                FileStorage(stream=BytesIO(photo.read()), filename=photo.filename)
+                for photo in files
+            ]
+            job_id = job_queue.submit("photo_upload", upload_photos, buffered)
+            return queued_response(job_id, "Photo upload queued")
 
-            # Generate unique IDs
-            photo_id = generate_unique_id("photos", "photo_id")
-            filename = f"{entry_id}_{secure_filename(photo.filename)}"
-            
-            # Upload photo to Cloud Storage
-            bucket = storage_client.bucket(BUCKET_NAME)
-            blob = bucket.blob(f"entry_photos/{filename}")
-            blob.upload_from_file(photo)
-            
-            # Get public URL
-            photo_url = blob.public_url
-            
-            # Insert into photos table
-            photo_data = {
-                "photo_id": photo_id,
-                "entry_id": entry_id,
-                "photo_url": photo_url,
-                "user_id": 1  # TODO: Replace with actual user_id
-            }
-            
-            photos_table_id = f"{client.project}.{DATASET_NAME}.photos"
-            errors = client.insert_rows_json(photos_table_id, [photo_data])
-            
-            if errors:
-                print(f"Error inserting photo {filename}: {errors}")
-                continue
-                
-            uploaded_photos.append({
-                "photo_id": photo_id,
-                "photo_url": photo_url
-            })
+        result = upload_photos(files)
+        uploaded_photos, errors = result["photos"], result["errors"]
         
         if not uploaded_photos:
-            return jsonify({"error": "No photos were successfully uploaded"}), 400
-        
+            return jsonify({"error": "No photos were successfully uploaded", "errors": errors}), 400
+
+        if errors:
+            return jsonify({
+                "message": "Partial success",
+                "photos": uploaded_photos,
+                "errors": errors
+            }), 207
         
         return jsonify({
             "message": f"Successfully uploaded {len(uploaded_photos)} photos",
@@ -664,52 +664,105 @@ def add_entry_photo(entry_id):
         print(f"Error uploading photos: {e}")
         return jsonify({"error": str(e)}), 500
 
+@entry_bp.route('/api/entries/<entry_id>/photos/uploads', methods=['POST'])
+def create_photo_uploads(entry_id):
+    try:
+        if not UPLOAD_SIGNING_KEY:
+            return jsonify({"error": "Direct uploads are not configured"}), 503
+
+        # {"user_id": ..., "photos": [{"filename": "beach.jpg"}, ...]}
+        payload = request.get_json(silent=True) or {}
+        user_id = payload.get("user_id")
+        photos = payload.get("photos") or []
+        filenames = [photo.get("filename", "") for photo in photos if isinstance(photo, dict)]
+
+        if not isinstance(user_id, str) or not user_id.strip():
+            return jsonify({"error": "Please provide user_id"}), 400
+        if not filenames:
+            return jsonify({"error": "Please provide photos as [{\"filename\": ...}]"}), 400
+        if len(filenames) > MAX_UPLOADS_PER_REQUEST:
+            return jsonify({"error": f"At most {MAX_UPLOADS_PER_REQUEST} photos per request"}), 400
+
+        try:
+            uploads = issue_uploads(entry_id, user_id, filenames)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({
+            "uploads": uploads,
+            "complete_url": f"/api/entries/{entry_id}/photos/complete"
+        }), 201
+
+    except Exception as e:
+        print(f"Error creating photo uploads: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@entry_bp.route('/api/entries/<entry_id>/photos/complete', methods=['POST'])
+def complete_photo_uploads(entry_id):
+    try:
+        if not UPLOAD_SIGNING_KEY:
+            return jsonify({"error": "Direct uploads are not configured"}), 503
+
+        # {"upload_ids": [...]} as returned by the uploads endpoint
+        upload_ids = (request.get_json(silent=True) or {}).get("upload_ids") or []
+        if not upload_ids:
+            return jsonify({"error": "Please provide upload_ids"}), 400
+
+        def complete(upload_ids):
+            result = complete_uploads(entry_id, upload_ids)
+            invalidate(entry_ids=[entry_id], user_ids=list({photo["user_id"] for photo in result["photos"]}))
+            return result
+
+        if wants_async():
+            job_id = job_queue.submit("photo_upload_complete", complete, upload_ids)
+            return queued_response(job_id, "Photo upload completion queued")
+
+        result = complete(upload_ids)
+        uploaded_photos, errors = result["photos"], result["errors"]
+
+        if not uploaded_photos:
+            return jsonify({"error": "No photos were successfully uploaded", "errors": errors}), 400
+
+        if errors:
+            return jsonify({
+                "message": "Partial success",
+                "photos": uploaded_photos,
+                "errors": errors
+            }), 207
+
+        return jsonify({
+            "message": f"Successfully uploaded {len(uploaded_photos)} photos",
+            "photos": uploaded_photos
+        }), 200
+
+    except Exception as e:
+        print(f"Error completing photo uploads: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @entry_bp.route('/api/photos', methods=['GET'])
+@cached_response('photos')
 def get_photos():
     try:
         # Get query parameters
         entry_id = request.args.get('entry_id')
         user_id = request.args.get('user_id')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
-
-        if entry_id:
-            conditions.append("p.entry_id = @entry_id")
-            query_params.append(bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id))
-            
-        if user_id:
-            conditions.append("CAST(p.user_id AS STRING) = @user_id") 
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
+        filters = non_empty(entry_id=entry_id, user_id=user_id)
 
         # If no search params provided, return error
-        if not conditions:
+        if not filters:
             return jsonify({
                 "error": "Please provide either entry_id or user_id as a search parameter"
             }), 400
 
-        # Construct query
-        query = f"""
-        SELECT 
-            p.photo_id,
-            p.entry_id,
-            p.photo_url,
-            p.user_id
-        FROM `{client.project}.{DATASET_NAME}.photos` p
-        WHERE {" AND ".join(conditions)}
-        """
-
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-        query_job = client.query(query, job_config=job_config)
         photos = []
-
-        for row in query_job:
+        for row in get_repository().list_photos(filters):
             photo = {
-                "photo_id": row.photo_id,
-                "entry_id": row.entry_id,
-                "photo_url": row.photo_url,
-                "user_id": row.user_id,
+                "photo_id": row["photo_id"],
+                "entry_id": row["entry_id"],
+                "photo_url": row["photo_url"],
+                "renditions": rendition_urls(row["photo_url"]),
+                "user_id": row["user_id"],
             }
             photos.append(photo)
 
@@ -732,38 +785,28 @@ def delete_photo():
         entry_id = request.args.get('entry_id') 
         user_id = request.args.get('user_id')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
+        filters = non_empty(photo_id=photo_id, entry_id=entry_id, user_id=user_id)
 
-        if photo_id:
-            conditions.append("photo_id = @photo_id")
-            query_params.append(bigquery.ScalarQueryParameter("photo_id", "STRING", photo_id))
-            
-        if entry_id:
-            conditions.append("entry_id = @entry_id")
-            query_params.append(bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id))
-            
-        if user_id:
-            conditions.append("CAST(user_id AS STRING) = @user_id")
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
-
-        if not conditions:
+        if not filters:
             return jsonify({
                 "error": "Please provide at least one parameter (photo_id, entry_id, or user_id)"
             }), 400
 
-        deleted_photos, errors = delete_photos_from_storage(conditions, query_params)
-        
-        # Delete from database
-        if deleted_photos:
-            delete_query = f"""
-            DELETE FROM `{client.project}.{DATASET_NAME}.photos`
-            WHERE {" AND ".join(conditions)}
-            """
-            job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-            delete_job = client.query(delete_query, job_config=job_config)
-            delete_job.result()
+        def delete_photos():
+            result = delete_photo_records(filters)
+            invalidate(
+                entry_ids=result.pop("entry_ids"),
+                photo_ids=[photo_id] if photo_id else [],
+                user_ids=[user_id] if user_id else []
+            )
+            return result
+
+        if wants_async():
+            job_id = job_queue.submit("photo_delete", delete_photos)
+            return queued_response(job_id, "Photo deletion queued")
+
+        result = delete_photos()
+        deleted_photos, errors = result["deleted_photos"], result["errors"]
 
         if errors:
             return jsonify({
@@ -789,48 +832,27 @@ def delete_entries():
         entry_id = request.args.get('entry_id')
         user_id = request.args.get('user_id')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
-
-        if entry_id:
-            conditions.append("entry_id = @entry_id")
-            query_params.append(bigquery.ScalarQueryParameter("entry_id", "STRING", entry_id))
-            
-        if user_id:
-            conditions.append("CAST(user_id AS STRING) = @user_id")
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
+        filters = non_empty(entry_id=entry_id, user_id=user_id)
 
-        if not conditions:
+        if not filters:
             return jsonify({
                 "error": "Please provide either entry_id or user_id as a parameter"
             }), 400
 
-        # Create job_config once and reuse it
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
+        def delete_entries_data():
+            result = delete_entry_records(filters)
+            invalidate(
+                entry_ids=[entry_id] if entry_id else [],
+                user_ids=[user_id] if user_id else []
+            )
+            return result
 
-        deleted_photos, errors = delete_photos_from_storage(conditions, query_params)
-        
-        # Delete all related records
-        delete_photos = f"""
-        DELETE FROM `{client.project}.{DATASET_NAME}.photos`
-        WHERE {" AND ".join(conditions)}
-        """
-        
-        delete_expenses = f"""
-        DELETE FROM `{client.project}.{DATASET_NAME}.expenses`
-        WHERE {" AND ".join(conditions)}
-        """
-        
-        delete_entries = f"""
-        DELETE FROM `{client.project}.{DATASET_NAME}.text_entries`
-        WHERE {" AND ".join(conditions)}
-        """
-
-        # Execute deletions using the same job_config
-        client.query(delete_photos, job_config=job_config).result()
-        client.query(delete_expenses, job_config=job_config).result()
-        client.query(delete_entries, job_config=job_config).result()
+        if wants_async():
+            job_id = job_queue.submit("entry_delete", delete_entries_data)
+            return queued_response(job_id, "Entry deletion queued")
+
+        result = delete_entries_data()
+        deleted_photos, errors = result["deleted_photos"], result["errors"]
 
         if errors:
             return jsonify({
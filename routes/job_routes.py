@@ -0,0 +1,12 @@
+from flask import Blueprint, jsonify
+from jobs import job_queue
+
+job_bp = Blueprint('job', __name__)
+
+@job_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        # Also the answer for jobs accepted by another worker process
+        return jsonify({"error": "Job not found on this worker"}), 404
+    return jsonify(job), 200
@@ -0,0 +1,33 @@
+import os
+import hmac
+import time
+from urllib.parse import urlparse
+from flask import Blueprint, jsonify, request, send_from_directory
+from config import LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL, MAX_PHOTO_UPLOAD_BYTES
+from storage_backend import get_bucket, local_signature
+
+# Serves LocalBucket objects at LOCAL_STORAGE_URL and accepts PUTs to the
+# signed URLs LocalBlob.generate_signed_url issues, standing in for Cloud
+# Storage when STORAGE_BACKEND=local.
+storage_bp = Blueprint('storage', __name__, url_prefix=urlparse(LOCAL_STORAGE_URL).path.rstrip('/') or None)
+
+@storage_bp.route('/<path:name>', methods=['GET'])
+def get_object(name):
+    return send_from_directory(os.path.abspath(LOCAL_STORAGE_DIR), name)
+
+@storage_bp.route('/<path:name>', methods=['PUT'])
+def put_object(name):
+    expires = request.args.get('expires', '')
+    signature = request.args.get('signature', '')
+    content_type = request.headers.get('Content-Type')
+
+    if not expires.isdigit() or int(expires) < time.time():
+        return jsonify({"error": "Signed URL has expired"}), 403
+    if not hmac.compare_digest(signature, local_signature("PUT", name, int(expires), content_type)):
+        return jsonify({"error": "Signature does not match"}), 403
+    if request.content_length is None or request.content_length > MAX_PHOTO_UPLOAD_BYTES:
+        return jsonify({"error": "Content-Length missing or too large"}), 400
+
+    # Copied from the request stream, never held in memory
+    get_bucket().blob(name).upload_from_file(request.stream)
+    return '', 200
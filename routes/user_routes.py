@@ -1,34 +1,61 @@
-from flask import Blueprint, jsonify, request
-from google.cloud import bigquery
-from config import client, DATASET_NAME
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from repository import get_repository, USER_PUBLIC_FIELDS
+from utils import non_empty, parse_limit, decode_cursor, collect_page, stream_page
+from user_index import get_user_index
+from config import USER_SUGGEST_LIMIT, MAX_PAGE_SIZE
 
 user_bp = Blueprint('user', __name__)
 
-def read_users():
-    query = f"""
-        SELECT user_id, email, full_name, profile_pic_url, created_at, password_hash
-        FROM `{client.project}.{DATASET_NAME}.users`
-    """
-    query_job = client.query(query)
-    results = list(query_job.result())
-    return results
+def parse_fields(value):
+    """Read a comma-separated `fields` projection, defaulting to every public field."""
+    if not value:
+        return USER_PUBLIC_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in USER_PUBLIC_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a comma-separated subset of {', '.join(USER_PUBLIC_FIELDS)}")
+    return fields
+
+def format_user_row(row, fields):
+    user = {field: row[field] for field in fields}
+    if "created_at" in user:
+        user["created_at"] = user["created_at"].strftime('%Y-%m-%d %H:%M:%S') if user["created_at"] else None
+    return user
 
 @user_bp.route('/api/users', methods=['GET'])
 def get_users():
     try:
-        users = read_users()
-        user_list = []
-        for user in users:
-            user_data = {
-                "user_id": user.user_id,
-                "email": user.email,
-                "password_hash": user.password_hash,
-                "full_name": user.full_name,
-                "profile_pic_url": user.profile_pic_url,
-                "created_at": user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else None
-            }
-            user_list.append(user_data)
-        return jsonify({"users": user_list}), 200
+        output_format = request.args.get('format', 'json')
+        if output_format not in ('json', 'ndjson', 'json-stream'):
+            return jsonify({"error": "format must be one of json, ndjson or json-stream"}), 400
+
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Keyset pagination on (created_at, user_id), newest first, reading
+        # only the requested columns
+        rows = get_repository().iter_users(limit + 1, cursor, fields)
+
+        def format_row(row):
+            return format_user_row(row, fields)
+
+        if output_format != 'json':
+            mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+            page = stream_page(rows, limit, output_format, format_row, "user_id", "users")
+            return Response(stream_with_context(page), mimetype=mimetype)
+
+        users, next_cursor = collect_page(rows, limit, format_row, "user_id")
+
+        return jsonify({
+            "users": users,
+            "count": len(users),
+            "next_cursor": next_cursor
+        }), 200
 
     except Exception as e:
         print(f"Error fetching users: {e}")
@@ -42,46 +69,23 @@ def search_users():
         email = request.args.get('email') 
         name = request.args.get('name')
 
-        # Build query conditions
-        conditions = []
-        query_params = []
-
-        if user_id:
-            conditions.append("user_id = @user_id")
-            query_params.append(bigquery.ScalarQueryParameter("user_id", "STRING", user_id))
-            
-        if email:
-            conditions.append("email = @email")
-            query_params.append(bigquery.ScalarQueryParameter("email", "STRING", email))
-            
-        if name:
-            conditions.append("LOWER(full_name) LIKE CONCAT('%', LOWER(@name), '%')")
-            query_params.append(bigquery.ScalarQueryParameter("name", "STRING", name))
+        filters = non_empty(user_id=user_id, email=email, name=name)
 
         # If no search params provided, return error
-        if not conditions:
+        if not filters:
             return jsonify({"error": "Please provide at least one search parameter (id, email, or name)"}), 400
 
-        # Construct query
-        query = f"""
-            SELECT user_id, email, full_name, profile_pic_url, created_at
-            FROM `{client.project}.{DATASET_NAME}.users`
-            WHERE {" OR ".join(conditions)}
-        """
-
-        job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-        query_job = client.query(query, job_config=job_config)
-        results = list(query_job.result())
+        results = list(get_repository().search_users(filters))
 
         # Format results
         users = []
         for user in results:
             users.append({
-                "user_id": user.user_id,
-                "email": user.email,
-                "full_name": user.full_name,
-                "profile_pic_url": user.profile_pic_url,
-                "created_at": user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else None
+                "user_id": user["user_id"],
+                "email": user["email"],
+                "full_name": user["full_name"],
+                "profile_pic_url": user["profile_pic_url"],
+                "created_at": user["created_at"].strftime('%Y-%m-%d %H:%M:%S') if user["created_at"] else None
             })
 
         return jsonify({
@@ -93,3 +97,27 @@ def search_users():
         print(f"Error searching users: {e}")
         return jsonify({"error": str(e)}), 500
 
+@user_bp.route('/api/users/suggest', methods=['GET'])
+def suggest_users():
+    try:
+        prefix = request.args.get('prefix', '')
+        if not prefix.strip():
+            return jsonify({"error": "Please provide a prefix"}), 400
+
+        try:
+            limit = min(int(request.args.get('limit', USER_SUGGEST_LIMIT)), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        if limit < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+
+        users = get_user_index().suggest(prefix, limit)
+
+        return jsonify({
+            "users": users,
+            "count": len(users)
+        }), 200
+
+    except Exception as e:
+        print(f"Error suggesting users: {e}")
+        return jsonify({"error": str(e)}), 500
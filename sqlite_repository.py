@@ -0,0 +1,354 @@
+import os
+import csv
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from repository import Repository, USER_PUBLIC_FIELDS
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        email TEXT,
+        password_hash TEXT,
+        full_name TEXT,
+        profile_pic_url TEXT,
+        created_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS text_entries (
+        entry_id TEXT PRIMARY KEY,
+        title TEXT,
+        content TEXT,
+        location TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at TEXT,
+        user_id TEXT
+    );
+    CREATE TABLE IF NOT EXISTS photos (
+        photo_id TEXT PRIMARY KEY,
+        entry_id TEXT,
+        photo_url TEXT,
+        user_id TEXT,
+        uploaded_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS expenses (
+        expense_id TEXT PRIMARY KEY,
+        entry_id TEXT,
+        category TEXT,
+        amount REAL,
+        currency TEXT,
+        user_id TEXT,
+        created_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS users_email ON users (email);
+    CREATE INDEX IF NOT EXISTS users_feed ON users (created_at DESC, user_id DESC);
+    CREATE INDEX IF NOT EXISTS text_entries_feed ON text_entries (created_at DESC, entry_id DESC);
+    CREATE INDEX IF NOT EXISTS text_entries_user ON text_entries (user_id);
+    CREATE INDEX IF NOT EXISTS photos_entry ON photos (entry_id);
+    CREATE INDEX IF NOT EXISTS photos_user ON photos (user_id);
+    CREATE INDEX IF NOT EXISTS expenses_entry ON expenses (entry_id);
+"""
+
+SEED_FILES = {
+    "text_entries": "entries.csv",
+    "photos": "photos.csv",
+    "expenses": "expenses.csv",
+}
+
+# Same filters as bigquery_repository, in SQLite syntax
+ENTRY_FILTERS = {
+    "user_id": "CAST(t.user_id AS TEXT) = :user_id",
+    "entry_id": "t.entry_id = :entry_id",
+    "location": "LOWER(t.location) LIKE '%' || LOWER(:location) || '%'",
+    "title": "LOWER(t.title) LIKE '%' || LOWER(:title) || '%'",
+    "latitude": "t.latitude = :latitude",
+    "longitude": "t.longitude = :longitude",
+}
+
+EXPENSE_FILTERS = {
+    "entry_id": "e.entry_id = :entry_id",
+    "user_id": "t.user_id = :user_id",
+    "category": "e.category = :category",
+}
+
+PHOTO_FILTERS = {
+    "photo_id": "photo_id = :photo_id",
+    "entry_id": "entry_id = :entry_id",
+    "user_id": "CAST(user_id AS TEXT) = :user_id",
+}
+
+USER_FILTERS = {
+    "user_id": "user_id = :user_id",
+    "email": "email = :email",
+    "name": "LOWER(full_name) LIKE '%' || LOWER(:name) || '%'",
+}
+
+FLOAT_FILTERS = ("latitude", "longitude")
+EXPENSE_UPDATE_FIELDS = ("amount", "category", "currency")
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def parse_timestamp(value):
+    """Read a stored timestamp ("2024-07-26 10:00:00[ UTC]") back into a datetime."""
+    if not value:
+        return None
+    return datetime.strptime(value.replace(" UTC", ""), TIMESTAMP_FORMAT)
+
+def build_conditions(filters, allowed):
+    conditions = [allowed[name] for name in filters]
+    params = {
+        name: float(value) if name in FLOAT_FILTERS else value
+        for name, value in filters.items()
+    }
+    return conditions, params
+
+class SQLiteRepository(Repository):
+    """Embedded repository for offline runs, load tests and as a local hot store.
+
+    Uses one SQLite connection guarded by a lock, so it also works with
+    ":memory:". An empty database is seeded from the bundled CSV files.
+    """
+
+    def __init__(self, path=":memory:", seed=True):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+        if seed and not self._fetchall("SELECT 1 FROM text_entries LIMIT 1"):
+            self.seed_from_csv()
+
+    def seed_from_csv(self, root=ROOT):
+        for table, filename in SEED_FILES.items():
+            with open(os.path.join(root, filename), newline="") as f:
+                rows = list(csv.DictReader(f))
+            for row in rows:
+                if "created_at" in row:
+                    row["created_at"] = parse_timestamp(row["created_at"]).strftime(TIMESTAMP_FORMAT)
+            self.insert_rows(table, rows)
+
+    def _fetchall(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def _feed_rows(self, conditions, params, limit=None):
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_clause = "LIMIT :limit" if limit else ""
+        query = f"""
+            WITH page AS (
+                SELECT t.*
+                FROM text_entries t
+                {where}
+                ORDER BY t.created_at DESC, t.entry_id DESC
+                {limit_clause}
+            )
+            SELECT
+                page.*,
+                (SELECT json_group_array(p.photo_url) FROM photos p
+                 WHERE p.entry_id = page.entry_id AND p.photo_url IS NOT NULL) AS photo_urls,
+                (SELECT json_group_array(json_object(
+                    'expense_id', e.expense_id, 'category', e.category,
+                    'amount', e.amount, 'currency', e.currency))
+                 FROM expenses e WHERE e.entry_id = page.entry_id) AS expenses
+            FROM page
+            ORDER BY page.created_at DESC, page.entry_id DESC
+        """
+        if limit:
+            params = dict(params, limit=limit)
+
+        rows = []
+        for row in self._fetchall(query, params):
+            row = dict(row)
+            row["created_at"] = parse_timestamp(row["created_at"])
+            row["photo_urls"] = json.loads(row["photo_urls"])
+            row["expenses"] = json.loads(row["expenses"])
+            rows.append(row)
+        return rows
+
+    def iter_feed(self, limit, cursor=None):
+        conditions = []
+        params = {}
+        if cursor:
+            conditions.append(
+                "(t.created_at < :cursor_created_at"
+                " OR (t.created_at = :cursor_created_at AND t.entry_id < :cursor_entry_id))"
+            )
+            params["cursor_created_at"] = cursor[0].strftime(TIMESTAMP_FORMAT)
+            params["cursor_entry_id"] = cursor[1]
+        return iter(self._feed_rows(conditions, params, limit))
+
+    def search_entries(self, filters):
+        conditions, params = build_conditions(filters, ENTRY_FILTERS)
+        return self._feed_rows(conditions, params)
+
+    def get_entries(self, entry_ids):
+        params = {f"entry_id_{i}": entry_id for i, entry_id in enumerate(entry_ids)}
+        if not params:
+            return []
+        placeholders = ", ".join(f":{name}" for name in params)
+        return self._feed_rows([f"t.entry_id IN ({placeholders})"], params)
+
+    def list_entry_texts(self):
+        return self._fetchall(
+            "SELECT entry_id, CAST(user_id AS TEXT) AS user_id, title, content, location FROM text_entries"
+        )
+
+    def list_entry_locations(self):
+        return self._fetchall(
+            "SELECT entry_id, CAST(user_id AS TEXT) AS user_id, latitude, longitude FROM text_entries"
+            " WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+
+    def search_expenses(self, filters):
+        conditions, params = build_conditions(filters, EXPENSE_FILTERS)
+        query = f"""
+            SELECT
+                e.entry_id,
+                e.expense_id,
+                t.user_id,
+                e.category,
+                e.amount,
+                e.currency,
+                t.title,
+                t.location,
+                t.created_at,
+                u.full_name,
+                u.profile_pic_url
+            FROM expenses e
+            JOIN text_entries t ON e.entry_id = t.entry_id
+            LEFT JOIN users u ON t.user_id = u.user_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY t.created_at DESC
+        """
+        rows = [dict(row) for row in self._fetchall(query, params)]
+        for row in rows:
+            row["created_at"] = parse_timestamp(row["created_at"])
+        return rows
+
+    def list_expense_facts(self):
+        rows = [dict(row) for row in self._fetchall("""
+            SELECT
+                e.expense_id,
+                e.entry_id,
+                CAST(t.user_id AS TEXT) AS user_id,
+                e.category,
+                e.currency,
+                e.amount,
+                t.location,
+                COALESCE(e.created_at, t.created_at) AS created_at
+            FROM expenses e
+            JOIN text_entries t ON e.entry_id = t.entry_id
+        """)]
+        for row in rows:
+            row["created_at"] = parse_timestamp(row["created_at"])
+        return rows
+
+    def update_expense(self, entry_id, expense_id, fields):
+        assignments = [f"{name} = :new_{name}" for name in fields if name in EXPENSE_UPDATE_FIELDS]
+        params = {f"new_{name}": value for name, value in fields.items()}
+        params.update(entry_id=entry_id, expense_id=expense_id)
+        self._execute(
+            f"UPDATE expenses SET {', '.join(assignments)} "
+            "WHERE expense_id = :expense_id AND entry_id = :entry_id",
+            params
+        )
+
+    def delete_expense(self, expense_id):
+        self._execute("DELETE FROM expenses WHERE expense_id = ?", (expense_id,))
+
+    def delete_entry_expenses(self, entry_id):
+        self._execute("DELETE FROM expenses WHERE entry_id = ?", (entry_id,))
+
+    def list_photos(self, filters):
+        conditions, params = build_conditions(filters, PHOTO_FILTERS)
+        return self._fetchall(
+            f"SELECT photo_id, entry_id, photo_url, user_id FROM photos WHERE {' AND '.join(conditions)}",
+            params
+        )
+
+    def delete_photos(self, filters):
+        conditions, params = build_conditions(filters, PHOTO_FILTERS)
+        self._execute(f"DELETE FROM photos WHERE {' AND '.join(conditions)}", params)
+
+    def delete_entries(self, filters):
+        conditions, params = build_conditions(filters, PHOTO_FILTERS)
+        where = " AND ".join(conditions)
+        with self._lock, self._conn:
+            for table in ("photos", "expenses", "text_entries"):
+                self._conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+
+    def get_user(self, column, value):
+        rows = self._fetchall(
+            f"SELECT user_id, email, password_hash, full_name, profile_pic_url FROM users WHERE {column} = ?",
+            (value,)
+        )
+        return dict(rows[0]) if rows else None
+
+    def get_user_profiles(self, user_ids):
+        placeholders = ", ".join("?" for _ in user_ids)
+        return self._user_rows(
+            f"SELECT user_id, full_name, profile_pic_url FROM users WHERE user_id IN ({placeholders})",
+            list(user_ids)
+        )
+
+    def update_user_password(self, user_id, password_hash):
+        self._execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (password_hash, user_id))
+
+    def _user_rows(self, query, params=()):
+        rows = [dict(row) for row in self._fetchall(query, params)]
+        for row in rows:
+            if "created_at" in row:
+                row["created_at"] = parse_timestamp(row["created_at"])
+        return rows
+
+    def list_users(self, fields):
+        return self._user_rows(f"SELECT {', '.join(fields)} FROM users")
+
+    def iter_users(self, limit, cursor=None, fields=USER_PUBLIC_FIELDS):
+        columns = sorted(set(fields) | {"created_at", "user_id"})
+        conditions = []
+        params = {"limit": limit}
+        if cursor:
+            conditions.append(
+                "(created_at < :cursor_created_at"
+                " OR (created_at = :cursor_created_at AND user_id < :cursor_user_id))"
+            )
+            params["cursor_created_at"] = cursor[0].strftime(TIMESTAMP_FORMAT)
+            params["cursor_user_id"] = cursor[1]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return iter(self._user_rows(
+            f"SELECT {', '.join(columns)} FROM users {where}"
+            " ORDER BY created_at DESC, user_id DESC LIMIT :limit",
+            params
+        ))
+
+    def search_users(self, filters):
+        conditions, params = build_conditions(filters, USER_FILTERS)
+        return self._user_rows(
+            f"SELECT user_id, email, full_name, profile_pic_url, created_at FROM users WHERE {' OR '.join(conditions)}",
+            params
+        )
+
+    def insert_rows(self, table, rows):
+        errors = []
+        with self._lock, self._conn:
+            for index, row in enumerate(rows):
+                columns = ", ".join(row)
+                placeholders = ", ".join(f":{column}" for column in row)
+                try:
+                    self._conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", row)
+                except sqlite3.Error as e:
+                    errors.append({"index": index, "errors": [{"reason": "invalid", "message": str(e)}]})
+        return errors
+
+    def find_existing_ids(self, table, column, ids):
+        placeholders = ", ".join("?" for _ in ids)
+        rows = self._fetchall(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})", list(ids))
+        return {row[0] for row in rows}
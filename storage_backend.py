@@ -0,0 +1,158 @@
+import os
+import hmac
+import time
+import shutil
+import hashlib
+import mimetypes
+from urllib.parse import unquote
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from clients import get_storage_client
+from metrics import InstrumentedBucket
+from config import (
+    BUCKET_NAME,
+    STORAGE_BACKEND,
+    LOCAL_STORAGE_DIR,
+    LOCAL_STORAGE_URL,
+    STORAGE_DELETE_CONCURRENCY,
+    UPLOAD_SIGNING_KEY
+)
+
+class BlobNotFound(Exception):
+    """Raised by LocalBlob where Cloud Storage raises NotFound."""
+
+def not_found_errors():
+    """Exception types meaning a blob doesn't exist; google's is only imported for GCS."""
+    if STORAGE_BACKEND == "local":
+        return (BlobNotFound,)
+    from google.api_core.exceptions import NotFound
+    return (BlobNotFound, NotFound)
+
+def sign(message):
+    """HMAC-SHA256 of message with UPLOAD_SIGNING_KEY, as hex."""
+    if not UPLOAD_SIGNING_KEY:
+        raise RuntimeError("UPLOAD_SIGNING_KEY is not set")
+    return hmac.new(UPLOAD_SIGNING_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+def local_signature(method, name, expires, content_type):
+    return sign(f"{method}\n{name}\n{expires}\n{content_type or ''}")
+
+class LocalBlob:
+    """Filesystem stand-in for google.cloud.storage.Blob."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def public_url(self):
+        return f"{self.bucket.base_url}/{self.name}"
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    @property
+    def content_type(self):
+        return mimetypes.guess_type(self.name)[0]
+
+    def generate_signed_url(self, expiration, method="GET", content_type=None, **kwargs):
+        """A URL for the local storage emulator routes, signed like a V4 URL."""
+        if isinstance(expiration, timedelta):
+            expires = int(time.time() + expiration.total_seconds())
+        elif isinstance(expiration, datetime):
+            expires = int(expiration.timestamp())
+        else:
+            expires = int(expiration)
+        signature = local_signature(method, self.name, expires, content_type)
+        return f"{self.public_url}?expires={expires}&signature={signature}"
+
+    def upload_from_file(self, file_obj, **kwargs):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            shutil.copyfileobj(file_obj, f)
+
+    def upload_from_string(self, data, **kwargs):
+        if isinstance(data, str):
+            data = data.encode()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def download_as_bytes(self, **kwargs):
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFound(f"No such object: {self.name}")
+
+    def make_public(self):
+        pass
+
+    def exists(self, **kwargs):
+        return os.path.exists(self.path)
+
+    def delete(self, **kwargs):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            raise BlobNotFound(f"No such object: {self.name}")
+
+class LocalBucket:
+    """Filesystem stand-in for google.cloud.storage.Bucket, for tests and offline runs."""
+
+    def __init__(self, root=LOCAL_STORAGE_DIR, base_url=LOCAL_STORAGE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob if os.path.exists(blob.path) else None
+
+_local_bucket = None
+
+def get_bucket():
+    """Return the photo bucket for the configured STORAGE_BACKEND."""
+    global _local_bucket
+    if STORAGE_BACKEND == "local":
+        if _local_bucket is None:
+            _local_bucket = InstrumentedBucket(LocalBucket(), "local_storage")
+        return _local_bucket
+    return InstrumentedBucket(get_storage_client().bucket(BUCKET_NAME), "gcs")
+
+def blob_name_from_url(url, bucket=None):
+    """The object name behind a public URL of the bucket, or None for other URLs."""
+    bucket = bucket or get_bucket()
+    prefix = bucket.blob("").public_url
+    if not url or not url.startswith(prefix):
+        return None
+    return unquote(url[len(prefix):])
+
+def delete_blobs(blob_names, bucket=None, max_workers=STORAGE_DELETE_CONCURRENCY):
+    """Delete many blobs concurrently, one request per blob and no exists() check.
+
+    A blob that is already gone counts as deleted. Returns {blob_name: error}
+    for the deletes that failed.
+    """
+    bucket = bucket or get_bucket()
+    blob_names = list(dict.fromkeys(blob_names))
+    missing = not_found_errors()
+
+    def delete(name):
+        try:
+            bucket.blob(name).delete()
+        except missing:
+            pass
+        except Exception as e:
+            return name, e
+        return name, None
+
+    if not blob_names:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(blob_names))) as executor:
+        return {name: error for name, error in executor.map(delete, blob_names) if error}
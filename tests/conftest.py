@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# app.py builds the app at import and config.py reads the environment at
+# import, so the SQLite and local storage backends are chosen before any
+# test module imports them.
+os.environ.update(DATA_BACKEND="sqlite", LOCAL_DB_PATH=":memory:", STORAGE_BACKEND="local",
+                  LOCAL_STORAGE_DIR=tempfile.mkdtemp(), CACHE_BACKEND="memory", TRACE_LOGS="false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
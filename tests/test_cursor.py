@@ -0,0 +1,20 @@
+from datetime import datetime
+
+import pytest
+
+from utils import encode_cursor, decode_cursor
+
+def test_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 250000)
+    cursor = encode_cursor(created_at, "01a14808-003a-70a8-97b7-34987f24e716")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "01a14808-003a-70a8-97b7-34987f24e716")
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(None, "e1"), "WyJ4Il0"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+def test_invalid_cursor_is_a_400(client):
+    response = client.get("/api/entries?cursor=garbage")
+    assert response.status_code == 400
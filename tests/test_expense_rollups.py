@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+
+import sqlite_repository
+from repository import get_repository
+from expense_rollups import ExpenseRollups
+
+def expense(expense_id, entry_id, amount, category="Food", currency="USD", created_at="2024-05-01 10:00:00"):
+    return {"expense_id": expense_id, "entry_id": entry_id, "amount": amount,
+            "category": category, "currency": currency, "created_at": created_at}
+
+@pytest.fixture
+def rollups():
+    rollups = ExpenseRollups()
+    rollups.set_entry("e1", 1, "Oslo")
+    rollups.set_entry("e2", 2, "Lisbon")
+    rollups.add(expense("x1", "e1", 10))
+    rollups.add(expense("x2", "e1", 5, category="Taxi"))
+    rollups.add(expense("x3", "e2", 7, created_at="2024-06-02 09:00:00"))
+    return rollups
+
+def groups(rollups, group_by, **filters):
+    return {tuple(group[d] for d in group_by): (group["count"], group["total"])
+            for group in rollups.summary(group_by, filters)[0]}
+
+def test_add(rollups):
+    assert len(rollups) == 3
+    assert groups(rollups, ["category"]) == {("Food",): (2, 17.0), ("Taxi",): (1, 5.0)}
+    assert groups(rollups, ["location", "month"]) == {("Oslo", "2024-05"): (2, 15.0), ("Lisbon", "2024-06"): (1, 7.0)}
+    assert groups(rollups, ["category"], user_id=1) == {("Food",): (1, 10.0), ("Taxi",): (1, 5.0)}
+
+def test_re_adding_an_expense_replaces_it(rollups):
+    rollups.add(expense("x1", "e1", 12))
+    assert groups(rollups, ["category"]) == {("Food",): (2, 19.0), ("Taxi",): (1, 5.0)}
+
+def test_update(rollups):
+    groups(rollups, ["category"])  # built before the update, so it is maintained incrementally
+    rollups.update("e1", "x1", {"amount": 3, "category": "Taxi"})
+    assert groups(rollups, ["category"]) == {("Food",): (1, 7.0), ("Taxi",): (2, 8.0)}
+
+def test_update_for_another_entry_is_ignored(rollups):
+    rollups.update("e2", "x1", {"amount": 100})
+    assert groups(rollups, ["entry_id"]) == {("e1",): (2, 15.0), ("e2",): (1, 7.0)}
+
+def test_remove(rollups):
+    groups(rollups, ["category"])
+    rollups.remove("x2")
+    rollups.remove("missing")
+    assert groups(rollups, ["category"]) == {("Food",): (2, 17.0)}
+
+def test_remove_where(rollups):
+    rollups.remove_where(user_id=1)
+    assert groups(rollups, ["entry_id"]) == {("e2",): (1, 7.0)}
+    rollups.remove_where(entry_id="e2")
+    assert len(rollups) == 0
+
+def summary(client, entry_id):
+    response = client.get(f"/api/expenses/summary?group_by=category&entry_id={entry_id}")
+    assert response.status_code == 200
+    return {group["category"]: (group["count"], group["total"]) for group in response.get_json()["groups"]}
+
+def test_routes_keep_summary_current(client):
+    entry_id = client.post("/api/entries", data={"title": "Trip", "location": "Oslo"}).get_json()["entry_id"]
+    assert summary(client, entry_id) == {}
+
+    response = client.post(f"/api/entries/{entry_id}/expenses", json={"amount": 9, "category": "Taxi"})
+    assert response.status_code == 201
+    expense_id = response.get_json()["expense_id"]
+    assert summary(client, entry_id) == {"Taxi": (1, 9.0)}
+
+    response = client.put(f"/api/entries/{entry_id}/expenses/{expense_id}", json={"amount": 4, "category": "Food"})
+    assert response.status_code == 200
+    assert summary(client, entry_id) == {"Food": (1, 4.0)}
+
+    assert client.delete(f"/api/expenses/{expense_id}").status_code == 200
+    assert summary(client, entry_id) == {}
+
+def test_adding_expense_when_get_entries_returns_an_iterator(client, monkeypatch):
+    # BigQuery's get_entries returns a RowIterator, which can't be indexed
+    get_entries = sqlite_repository.SQLiteRepository.get_entries
+    monkeypatch.setattr(sqlite_repository.SQLiteRepository, "get_entries",
+                        lambda self, entry_ids: iter(list(get_entries(self, entry_ids))))
+
+    # An entry the rollups have never seen, so adding its expense looks it up
+    client.get("/api/expenses/summary?group_by=location")
+    entry_id = str(uuid.uuid4())
+    assert get_repository().insert_rows("text_entries", [{
+        "entry_id": entry_id, "title": "Trip", "content": "", "location": "Bergen",
+        "latitude": 0.0, "longitude": 0.0, "user_id": 1, "created_at": "2024-05-01 10:00:00"
+    }]) == []
+
+    response = client.post(f"/api/entries/{entry_id}/expenses", json={"amount": 9, "category": "Taxi"})
+    assert response.status_code == 201
+    response = client.get("/api/expenses/summary?group_by=location&location=Bergen")
+    assert response.get_json()["groups"] == [{"location": "Bergen", "count": 1, "total": 9.0}]
@@ -0,0 +1,74 @@
+import uuid
+
+from flask import Flask, jsonify
+
+import pytest
+
+from response_cache import cached_response, invalidate
+
+@pytest.fixture
+def view_app():
+    """An app with one cached view over `rows`, counting how often it runs.
+
+    The response cache is shared by the whole process, so every test caches
+    under its own endpoint name.
+    """
+    app = Flask(__name__)
+    endpoint = f"things-{uuid.uuid4()}"
+    state = {"rows": [{"entry_id": "e1", "user_id": "u1", "title": "first"}], "calls": 0,
+             "during": None, "endpoint": endpoint}
+
+    @app.route("/things")
+    @cached_response(endpoint)
+    def things():
+        state["calls"] += 1
+        rows = list(state["rows"])
+        if state["during"]:
+            state["during"]()
+        return jsonify({"entries": rows}), 200
+
+    return app.test_client(), state
+
+def test_repeat_request_is_served_from_cache(view_app):
+    client, state = view_app
+    first = client.get("/things?user_id=u1")
+    second = client.get("/things?user_id=u1")
+    assert first.get_json() == second.get_json()
+    assert state["calls"] == 1
+
+def test_conditional_get_is_not_modified(view_app):
+    client, _ = view_app
+    etag = client.get("/things").headers["ETag"]
+    assert client.get("/things", headers={"If-None-Match": etag}).status_code == 304
+
+@pytest.mark.parametrize("tags", [
+    {"entry_ids": ["e1"]},
+    {"user_ids": ["u1"]},
+    {"endpoints": None},
+])
+def test_invalidating_a_tag_evicts(view_app, tags):
+    client, state = view_app
+    if "endpoints" in tags:
+        tags = {"endpoints": [state["endpoint"]]}
+    client.get("/things")
+    state["rows"][0] = dict(state["rows"][0], title="edited")
+    invalidate(**tags)
+    assert client.get("/things").get_json()["entries"][0]["title"] == "edited"
+    assert state["calls"] == 2
+
+def test_unrelated_invalidation_keeps_entry(view_app):
+    client, state = view_app
+    client.get("/things?user_id=u1")
+    invalidate(entry_ids=["e2"], user_ids=["u2"], endpoints=["other"])
+    client.get("/things?user_id=u1")
+    assert state["calls"] == 1
+
+@pytest.mark.parametrize("tags", [{"entry_ids": ["e1"]}, {"user_ids": ["u1"]}])
+def test_write_during_view_is_not_cached(view_app, tags):
+    client, state = view_app
+    # The view reads the rows, then a write lands before the response is stored
+    state["during"] = lambda: invalidate(**tags)
+    client.get("/things?user_id=u1")
+    state["during"] = None
+    client.get("/things?user_id=u1")
+    assert state["calls"] == 2
@@ -0,0 +1,215 @@
+import re
+import math
+import heapq
+import bisect
+import threading
+from config import (
+    TEXT_FIELD_WEIGHTS,
+    TEXT_PREFIX_EXPANSIONS,
+    TEXT_CHAMPION_LIST_SIZE,
+    TEXT_INDEX_REFRESH_SECONDS
+)
+from repository import get_repository
+from refreshing_index import RefreshingIndex
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class TextIndex:
+    """Inverted index over entry title, content and location, ranked with BM25.
+
+    Term frequencies are weighted per field (TEXT_FIELD_WEIGHTS), so a match
+    in the title counts for more than one in the content. The last query
+    term also matches as a prefix, which makes search-as-you-type work.
+
+    Terms found in more than TEXT_CHAMPION_LIST_SIZE entries are scored only
+    over their champion list, the entries where the term weighs the most.
+    Single-term results stay exact; for multi-term queries an entry outside
+    every champion list can be missed, the usual trade-off for not scoring
+    near stop words across the whole corpus.
+    """
+
+    def __init__(self, weights=TEXT_FIELD_WEIGHTS, k1=1.2, b=0.75):
+        self.weights = weights
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> {entry_id: weighted term frequency}
+        self._docs = {}      # entry_id -> (weighted length, user_id, terms)
+        self._vocab = []     # sorted terms, for prefix lookups
+        self._total_length = 0.0
+        self._norms = {}     # entry_id -> BM25 length normalisation
+        self._norms_average = None
+        self._champions = {} # term -> [(impact, entry_id)], ascending
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, entry_id, fields, user_id=None):
+        """Index an entry; `fields` maps field name (title, content, location) to text."""
+        frequencies = {}
+        for field, weight in self.weights.items():
+            for term in tokenize(fields.get(field)):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        length = sum(frequencies.values())
+
+        with self._lock:
+            self.remove(entry_id)
+            for term, frequency in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._vocab, term)
+                postings[entry_id] = frequency
+            self._docs[entry_id] = (length, user_id, tuple(frequencies))
+            self._total_length += length
+            if self._norms_average:
+                norm = self._norms[entry_id] = self._norm(length, self._norms_average)
+                for term, frequency in frequencies.items():
+                    champions = self._champions.get(term)
+                    impact = frequency / (frequency + norm)
+                    if champions and impact > champions[0][0]:
+                        bisect.insort(champions, (impact, entry_id))
+                        del champions[0]
+
+    def remove(self, entry_id):
+        with self._lock:
+            doc = self._docs.pop(entry_id, None)
+            if doc is None:
+                return
+            length, _, terms = doc
+            self._total_length -= length
+            self._norms.pop(entry_id, None)
+            for term in terms:
+                champions = self._champions.get(term)
+                if champions and any(champion == entry_id for _, champion in champions):
+                    del self._champions[term]
+                postings = self._postings[term]
+                postings.pop(entry_id, None)
+                if not postings:
+                    del self._postings[term]
+                    del self._vocab[bisect.bisect_left(self._vocab, term)]
+
+    def remove_where(self, entry_id=None, user_id=None):
+        """Remove the entries matching both entry_id and user_id (when given)."""
+        with self._lock:
+            entry_ids = [entry_id] if entry_id else list(self._docs)
+            for candidate in entry_ids:
+                doc = self._docs.get(candidate)
+                if doc and (not user_id or str(doc[1]) == str(user_id)):
+                    self.remove(candidate)
+
+    def _norm(self, length, average_length):
+        return self.k1 * (1 - self.b + self.b * length / average_length)
+
+    def _current_norms(self):
+        """Per-document normalisation, recomputed once the average length drifts by 5%."""
+        average_length = self._total_length / len(self._docs)
+        if not self._norms_average or abs(average_length / self._norms_average - 1) > 0.05:
+            self._norms = {
+                entry_id: self._norm(doc[0], average_length)
+                for entry_id, doc in self._docs.items()
+            }
+            self._norms_average = average_length
+            self._champions = {}
+        return self._norms
+
+    def _champion_postings(self, term, postings, norms):
+        """Return the TEXT_CHAMPION_LIST_SIZE postings of `term` with the highest impact."""
+        champions = self._champions.get(term)
+        if champions is None:
+            champions = heapq.nlargest(TEXT_CHAMPION_LIST_SIZE, (
+                (frequency / (frequency + norms[entry_id]), entry_id)
+                for entry_id, frequency in postings.items()
+            ))
+            champions.reverse()
+            self._champions[term] = champions
+        return {entry_id: postings[entry_id] for _, entry_id in champions}
+
+    def _expand(self, term):
+        """Return the indexed terms starting with `term`, at most TEXT_PREFIX_EXPANSIONS."""
+        start = bisect.bisect_left(self._vocab, term)
+        terms = []
+        for candidate in self._vocab[start:start + TEXT_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            terms.append(candidate)
+        return terms
+
+    def search(self, query, limit, user_id=None):
+        """Return up to `limit` (score, entry_id) pairs for the query, best first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            norms = self._current_norms()
+            k1_plus_1 = self.k1 + 1
+
+            scores = {}
+            for position, term in enumerate(terms):
+                is_last = position == len(terms) - 1
+                matches = self._expand(term) if is_last else [term]
+
+                # A document matching several expansions of one query term
+                # only scores its best one
+                term_scores = {}
+                for match in matches:
+                    postings = self._postings.get(match)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    # Filtering by user needs every posting; otherwise common
+                    # terms are scored over their champion list
+                    if len(postings) > TEXT_CHAMPION_LIST_SIZE and not user_id:
+                        postings = self._champion_postings(match, postings, norms)
+                    match_scores = {
+                        entry_id: idf * frequency * k1_plus_1 / (frequency + norms[entry_id])
+                        for entry_id, frequency in postings.items()
+                    }
+                    if not term_scores:
+                        term_scores = match_scores
+                        continue
+                    for entry_id, score in match_scores.items():
+                        if score > term_scores.get(entry_id, 0.0):
+                            term_scores[entry_id] = score
+
+                if not scores:
+                    scores = term_scores
+                    continue
+                for entry_id, score in term_scores.items():
+                    scores[entry_id] = scores.get(entry_id, 0.0) + score
+
+            if user_id:
+                scores = {
+                    entry_id: score for entry_id, score in scores.items()
+                    if str(self._docs[entry_id][1]) == str(user_id)
+                }
+
+        return heapq.nlargest(limit, ((score, entry_id) for entry_id, score in scores.items()))
+
+def build_text_index():
+    index = TextIndex()
+    for row in get_repository().list_entry_texts():
+        fields = {field: row[field] for field in index.weights}
+        index.add(row["entry_id"], fields, row["user_id"])
+    return index
+
+_index = RefreshingIndex("text index", build_text_index, TEXT_INDEX_REFRESH_SECONDS)
+
+def get_text_index():
+    """Return this worker's index, built from text_entries on first use."""
+    return _index.get()
+
+def index_entry_text(entry_id, fields, user_id=None):
+    """Add a new entry to the index."""
+    _index.apply(lambda index: index.add(entry_id, fields, user_id))
+
+def unindex_entry_texts(filters):
+    """Drop the entries deleted with these entry_id/user_id filters from the index."""
+    _index.apply(lambda index: index.remove_where(filters.get("entry_id"), filters.get("user_id")))
@@ -0,0 +1,51 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from config import PHOTO_UPLOAD_CONCURRENCY
+
+def run_uploads(upload_fn, items, max_workers=PHOTO_UPLOAD_CONCURRENCY):
+    """Run upload_fn over items concurrently, at most max_workers at a time.
+
+    Returns one (result, error) pair per item, in input order, so callers
+    can report partial failures instead of aborting the whole batch.
+    """
+    if not items:
+        return []
+
+    def attempt(item):
+        try:
+            return upload_fn(item), None
+        except Exception as e:
+            return None, e
+
+    if len(items) == 1 or max_workers <= 1:
+        return [attempt(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(attempt, items))
+
+def run_tasks(tasks, concurrent=True):
+    """Run independent zero-argument callables concurrently.
+
+    Returns {name: (result, error)} for the {name: fn} given. Each task runs
+    in a copy of the caller's context, so the request's g (and with it the
+    backend call trace) stays visible from the worker threads. With
+    concurrent=False the tasks run one after another on the calling thread.
+    """
+    if not tasks:
+        return {}
+
+    def attempt(fn):
+        try:
+            return fn(), None
+        except Exception as e:
+            return None, e
+
+    if not concurrent or len(tasks) == 1:
+        return {name: attempt(fn) for name, fn in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, attempt, fn)
+            for name, fn in tasks.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,132 @@
+import bisect
+import threading
+from config import USER_INDEX_REFRESH_SECONDS
+from repository import get_repository
+from refreshing_index import RefreshingIndex
+
+SUGGEST_FIELDS = ("user_id", "email", "full_name", "profile_pic_url")
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def prefix_range(items, prefix):
+    """Yield the user_ids of a sorted (key, user_id) list whose key starts with prefix."""
+    position = bisect.bisect_left(items, (prefix,))
+    while position < len(items) and items[position][0].startswith(prefix):
+        yield items[position][1]
+        position += 1
+
+class UserIndex:
+    """Typeahead index over user names and emails.
+
+    Suggestions come in three tiers, each only read as far as needed to
+    fill the limit: names starting with the prefix (alphabetical), then
+    users with a name word or email starting with it, then, for prefixes of
+    three or more characters, names or emails containing it anywhere. The
+    last tier scans the smallest trigram posting set of the prefix.
+    """
+
+    def __init__(self):
+        self._users = {}     # user_id -> user fields, without password_hash
+        self._keys = {}      # user_id -> (name, email), lowercased
+        self._trigrams = {}  # trigram -> {user_id}
+        self._names = []     # sorted (name, user_id)
+        self._words = []     # sorted (name word or email, user_id)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def _entries(self, user):
+        user = {field: user[field] for field in SUGGEST_FIELDS}
+        name = " ".join((user["full_name"] or "").lower().split())
+        email = (user["email"] or "").lower()
+        words = set(name.split()) | {email}
+        return user, name, email, words
+
+    def _index_keys(self, user_id, name, email):
+        self._keys[user_id] = (name, email)
+        for trigram in trigrams(name) | trigrams(email):
+            self._trigrams.setdefault(trigram, set()).add(user_id)
+
+    def add(self, user):
+        user, name, email, words = self._entries(user)
+        user_id = user["user_id"]
+        with self._lock:
+            self.remove(user_id)
+            self._users[user_id] = user
+            self._index_keys(user_id, name, email)
+            bisect.insort(self._names, (name, user_id))
+            for word in words:
+                bisect.insort(self._words, (word, user_id))
+
+    def add_all(self, users):
+        """Bulk load into an empty index, sorting the prefix lists once."""
+        with self._lock:
+            for user in users:
+                user, name, email, words = self._entries(user)
+                user_id = user["user_id"]
+                if user_id in self._users:
+                    continue
+                self._users[user_id] = user
+                self._index_keys(user_id, name, email)
+                self._names.append((name, user_id))
+                self._words.extend((word, user_id) for word in words)
+            self._names.sort()
+            self._words.sort()
+
+    def remove(self, user_id):
+        with self._lock:
+            if user_id not in self._users:
+                return
+            del self._users[user_id]
+            name, email = self._keys.pop(user_id)
+            for trigram in trigrams(name) | trigrams(email):
+                users = self._trigrams[trigram]
+                users.discard(user_id)
+                if not users:
+                    del self._trigrams[trigram]
+            del self._names[bisect.bisect_left(self._names, (name, user_id))]
+            for word in set(name.split()) | {email}:
+                del self._words[bisect.bisect_left(self._words, (word, user_id))]
+
+    def _substring_matches(self, prefix):
+        postings = [self._trigrams.get(trigram, ()) for trigram in trigrams(prefix)]
+        for user_id in min(postings, key=len):
+            name, email = self._keys[user_id]
+            if prefix in name or prefix in email:
+                yield user_id
+
+    def suggest(self, prefix, limit):
+        """Return up to `limit` users matching `prefix`, best first."""
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        with self._lock:
+            tiers = [prefix_range(self._names, prefix), prefix_range(self._words, prefix)]
+            if len(prefix) >= 3:
+                tiers.append(self._substring_matches(prefix))
+
+            found = {}
+            for tier in tiers:
+                for user_id in tier:
+                    if len(found) == limit:
+                        break
+                    found.setdefault(user_id, self._users[user_id])
+            return list(found.values())
+
+def build_user_index():
+    index = UserIndex()
+    index.add_all(get_repository().list_users(SUGGEST_FIELDS))
+    return index
+
+_index = RefreshingIndex("user index", build_user_index, USER_INDEX_REFRESH_SECONDS)
+
+def get_user_index():
+    """Return this worker's index, built from the users table on first use."""
+    return _index.get()
+
+def index_user(user):
+    """Add a newly registered user to the index."""
+    _index.apply(lambda index: index.add(user))
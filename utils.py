@@ -1,103 +1,266 @@
-from google.cloud import storage, bigquery
-import os
-import uuid
+import json
+import base64
 from datetime import datetime
+from werkzeug.utils import secure_filename
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, USER_CACHE_SIZE, USER_CACHE_TTL
+from cache import make_cache
+from id_allocator import allocate_ids
+from batch_writer import write_rows
+from storage_backend import get_bucket, delete_blobs, blob_name_from_url
+from upload_executor import run_uploads
+from image_pipeline import store_photo, rendition_urls
+from repository import get_repository
+from geo_index import index_entry, unindex_entries
+from text_index import index_entry_text, unindex_entry_texts
+from expense_rollups import track_expenses, untrack_entry_expenses
 
-storage_client = storage.Client()
-client = bigquery.Client(project='nomads-nest') 
-DATASET_NAME = 'NomadNest'
-BUCKET_NAME = "nomads-nest-profile-pics"
-TABLE_NAME = 'users'
-
-def upload_image_to_gcs(file, user_id):
-    """Upload image to Google Cloud Storage and return public URL"""
+def upload_image_to_gcs(file):
+    """Upload image renditions to Google Cloud Storage and return the original's public URL"""
     try:
-        bucket = storage_client.bucket(BUCKET_NAME)
-        
-        # Create a unique filename using user_id
-        extension = os.path.splitext(file.filename)[1]
-        blob_name = f"profile_pics/{user_id}{extension}"
-        
-        blob = bucket.blob(blob_name)
-        blob.upload_from_file(file)
-        
-        # Make the file publicly readable
-        blob.make_public()
-        
-        return blob.public_url
+        bucket = get_bucket()
+
+        # Stored under the image's digest, made publicly readable
+        return store_photo(bucket, "profile_pics", file.read(), public=True)
     except Exception as e:
         print(f"Error uploading image: {e}")
         return None
 
-def check_id_exists(table, column, value):
-    """Check if a given ID already exists in a specified table and column."""
-    query = f"""
-        SELECT COUNT(*) AS count
-        FROM `{client.project}.{DATASET_NAME}.{table}`
-        WHERE {column} = @value
+def upload_entry_photos(photos):
+    """Store entry photos by content; one (photo_url, error) pair per photo.
+
+    Photos are read up front, then stored concurrently. An image that is
+    already stored is neither rendered nor uploaded again.
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[bigquery.ScalarQueryParameter("value", "STRING", value)]
-    )
-    query_job = client.query(query, job_config=job_config)
-    result = list(query_job.result())
-    return result[0].count > 0
-
-def generate_unique_id(table, column):
-    """Generate a unique ID for a given table and column."""
-    while True:
-        unique_id = str(uuid.uuid4())
-        try:
-            exists = check_id_exists(table, column, unique_id)
-            if not exists:
-                return unique_id
-        except Exception as e:
-            print(f"Error in check_id_exists: {str(e)}")
-            raise
+    bucket = get_bucket()
+    uploads = [photo.read() for photo in photos]
+    return run_uploads(lambda data: store_photo(bucket, "photos", data), uploads)
+
+def non_empty(**values):
+    """Keep only the parameters that were actually provided."""
+    return {name: value for name, value in values.items() if value}
+
+def parse_limit(value):
+    """Parse a page size from the query string, clamped to MAX_PAGE_SIZE."""
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset position as an opaque cursor."""
+    payload = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor back into (created_at, id)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def collect_page(rows, limit, format_row, id_column):
+    """Format up to `limit` rows of a keyset page fetched with limit + 1.
+
+    Returns the formatted rows and the cursor of the next page, if any.
+    """
+    items = []
+    last_row = None
+    for row in rows:
+        if len(items) == limit:
+            return items, encode_cursor(last_row["created_at"], last_row[id_column])
+        items.append(format_row(row))
+        last_row = row
+    return items, None
+
+def stream_page(rows, limit, output_format, format_row, id_column, collection):
+    """Yield a keyset page chunk by chunk as rows come off the query job.
+
+    The query fetches limit + 1 rows; the extra row only tells us whether a
+    next page exists and is never emitted. `output_format` is ndjson (one
+    object per line, then a trailer with next_cursor) or json-stream (a
+    single JSON document written incrementally).
+    """
+    if output_format == 'json-stream':
+        yield f'{{"{collection}": ['
+
+    last_row = None
+    count = 0
+    has_more = False
+    for row in rows:
+        if count == limit:
+            has_more = True
+            break
+        item = json.dumps(format_row(row))
+        if output_format == 'ndjson':
+            yield item + "\n"
+        else:
+            yield ("," if count else "") + item
+        last_row = row
+        count += 1
+
+    next_cursor = encode_cursor(last_row["created_at"], last_row[id_column]) if has_more else None
+    if output_format == 'ndjson':
+        yield json.dumps({"next_cursor": next_cursor, "count": count}) + "\n"
+    else:
+        yield f'], "count": {count}, "next_cursor": {json.dumps(next_cursor)}}}'
+
+user_cache = make_cache("users", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def _query_user(column, value):
+    row = get_repository().get_user(column, value)
+    if not row:
+        return None
+
+    user = dict(row.items())
+    user_cache.set(f"email:{user['email']}", user)
+    return user
 
 def get_user_by_email(email):
-    """Get user details from database by email."""
-    query = f"""
-        SELECT user_id, email, password_hash
-        FROM `{client.project}.{DATASET_NAME}.{TABLE_NAME}`
-        WHERE email = @email
+    """Get user details by email, from the user cache when possible."""
+    return user_cache.get(f"email:{email}") or _query_user("email", email)
+
+def get_user_profiles(user_ids):
+    """Return {user_id: profile} for feed authors, from the user cache when possible.
+
+    Cache misses are fetched with one query. Unknown users are cached too,
+    as a profile without a name, so they don't cost a query on every read.
+    """
+    profiles = {}
+    missing = []
+    for user_id in {str(user_id) for user_id in user_ids if user_id is not None}:
+        profile = user_cache.get(f"id:{user_id}")
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        found = {str(row["user_id"]): dict(row.items()) for row in get_repository().get_user_profiles(missing)}
+        for user_id in missing:
+            profile = found.get(user_id, {"user_id": user_id, "full_name": None, "profile_pic_url": None})
+            user_cache.set(f"id:{user_id}", profile)
+            profiles[user_id] = profile
+    return profiles
+
+def with_authors(rows, chunk_size=50):
+    """Yield feed rows with the author's full_name and profile_pic_url filled in.
+
+    Rows are handled in chunks so streamed feeds still stream, with at most
+    one user query per chunk.
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("email", "STRING", email)
-        ]
-    )
-    query_job = client.query(query, job_config=job_config)
-    results = list(query_job.result())
-    return results[0] if results else None
-
-def delete_photos_from_storage(conditions, query_params):
-    """Helper function to delete photos from both storage and database"""
-    photo_query = f"""
-    SELECT photo_id, photo_url
-    FROM `{client.project}.{DATASET_NAME}.photos`
-    WHERE {" AND ".join(conditions)}
+    rows = iter(rows)
+    while True:
+        chunk = [dict(row.items()) for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return
+        profiles = get_user_profiles(row["user_id"] for row in chunk)
+        for row in chunk:
+            profile = profiles.get(str(row["user_id"]), {})
+            row["full_name"] = profile.get("full_name")
+            row["profile_pic_url"] = profile.get("profile_pic_url")
+            yield row
+
+def invalidate_user(email, user_id=None):
+    """Drop a user's cache entries after their row changes."""
+    user_cache.delete(f"email:{email}")
+    if user_id:
+        user_cache.delete(f"id:{user_id}")
+
+def delete_photos_from_storage(rows):
+    """Delete the blobs of deleted photo rows that no remaining photo references.
+
+    Photos are stored by content, so one blob can back many rows; the photos
+    table itself is the reference count.
     """
+    bucket = get_bucket()
+    urls = {row["photo_url"] for row in rows if row["photo_url"]}
+    still_referenced = get_repository().find_existing_ids("photos", "photo_url", list(urls)) if urls else set()
 
-    job_config = bigquery.QueryJobConfig(query_parameters=query_params)
-    query_job = client.query(photo_query, job_config=job_config)
+    # Each unreferenced photo's blob and, for processed photos, its other
+    # renditions. An upload of the same image between the check above and the
+    # delete below can lose its blobs; store_photo would re-upload it on the
+    # next attempt, so the window is accepted rather than locked.
+    blob_names = {}
+    for url in urls - still_referenced:
+        names = [blob_name_from_url(rendition, bucket) for rendition in rendition_urls(url).values()]
+        blob_names[url] = [name for name in names if name]
+    failures = delete_blobs((name for names in blob_names.values() for name in names), bucket)
 
     deleted_photos = []
     errors = []
-    
-    bucket = storage_client.bucket(BUCKET_NAME)
-    for row in query_job:
-        try:
-            if row.photo_url:
-                blob_name = f"entry_photos/{row.photo_url.split('/')[-1]}"
-                blob = bucket.blob(blob_name)
-                if blob.exists():
-                    blob.delete()
-                deleted_photos.append(row.photo_id)
-        except Exception as e:
-            errors.append(f"Error deleting photo {row.photo_id}: {str(e)}")
-
-    return deleted_photos, errors
+    entry_ids = set()
+    for row in rows:
+        error = next((failures[name] for name in blob_names.get(row["photo_url"], []) if name in failures), None)
+        entry_ids.add(row["entry_id"])
+        if error:
+            # The row is gone but its blobs are not; report it only as an error
+            errors.append(f"Error deleting photo {row['photo_id']}: {str(error)}")
+            continue
+        deleted_photos.append(row["photo_id"])
+
+    return deleted_photos, errors, sorted(entry_ids)
+
+def delete_photo_records(filters):
+    """Delete matching photo rows, then the blobs no other photo uses"""
+    rows = list(get_repository().list_photos(filters))
+    if rows:
+        get_repository().delete_photos(filters)
+
+    deleted_photos, errors, entry_ids = delete_photos_from_storage(rows)
+    return {"deleted_photos": deleted_photos, "errors": errors, "entry_ids": entry_ids}
+
+def delete_entry_records(filters):
+    """Delete matching entries with their photos and expenses"""
+    rows = list(get_repository().list_photos(filters))
+    get_repository().delete_entries(filters)
+    deleted_photos, errors, _ = delete_photos_from_storage(rows)
+    unindex_entries(filters)
+    unindex_entry_texts(filters)
+    untrack_entry_expenses(filters)
+    return {"deleted_photos": deleted_photos, "errors": errors}
+
+def save_entry_photos(entry_id, files):
+    """Upload photos for an entry and insert their rows in one batch"""
+    photo_rows = []
+    filenames = []
+
+    # Generate unique IDs for the whole batch at once
+    photo_ids = allocate_ids(len(files), "photos", "photo_id")
+
+    # Render and upload photos to Cloud Storage concurrently
+    results = upload_entry_photos(files)
+    upload_errors = []
+
+    for photo_id, photo, (photo_url, error) in zip(photo_ids, files, results):
+        filename = f"{entry_id}_{secure_filename(photo.filename)}"
+        if error:
+            print(f"Error uploading photo {filename}: {error}")
+            upload_errors.append({"input": filename, "errors": [str(error)]})
+            continue
+
+        photo_rows.append({
+            "photo_id": photo_id,
+            "entry_id": entry_id,
+            "photo_url": photo_url,
+            "user_id": 1  # TODO: Replace with actual user_id
+        })
+        filenames.append(filename)
+
+    # Insert all photo rows with one call
+    errors = write_rows("photos", photo_rows, filenames)
+    for error in errors:
+        print(f"Error inserting photo {error['input']}: {error['errors']}")
+
+    failed = {error["index"] for error in errors}
+    uploaded_photos = [
+        {"photo_id": row["photo_id"], "photo_url": row["photo_url"], "renditions": rendition_urls(row["photo_url"])}
+        for i, row in enumerate(photo_rows) if i not in failed
+    ]
+    return {"photos": uploaded_photos, "errors": upload_errors + errors}
 
 def insert_text_entry(entry_id, form_data):
     """Insert a new text entry into the database"""
@@ -112,61 +275,80 @@ def insert_text_entry(entry_id, form_data):
             "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        text_table_id = f"{client.project}.{DATASET_NAME}.text_entries"
-        errors = client.insert_rows_json(text_table_id, [text_entry])
+        errors = write_rows("text_entries", [text_entry])
+        if not errors:
+            index_entry(entry_id, text_entry["latitude"], text_entry["longitude"])
+            index_entry_text(entry_id, text_entry)
         return errors
     except Exception as e:
         print(f"Error in insert_text_entry: {str(e)}")
         raise
 
 def handle_photos(entry_id, photos):
-    """Handle photo uploads and return their URLs"""
+    """Handle photo uploads and return their URLs and any per-photo errors"""
     photo_urls = []
+    photo_rows = []
+    photo_names = []
+    errors = []
     
     try:
-        for i, photo in enumerate(photos):
-            if photo:
-                photo_id = generate_unique_id("photos", "photo_id")
-                photo_url = upload_image_to_gcs(photo, entry_id)
-                
-                if photo_url:
-                    photo_data = {
-                        "photo_id": photo_id,
-                        "entry_id": entry_id,
-                        "photo_url": photo_url,
-                        "user_id": 1,
-                        "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    
-                    photos_table_id = f"{client.project}.{DATASET_NAME}.photos"
-                    errors = client.insert_rows_json(photos_table_id, [photo_data])
-                    
-                    photo_urls.append(photo_url)
-        return photo_urls
+        photos = [photo for photo in photos if photo]
+        photo_ids = allocate_ids(len(photos), "photos", "photo_id")
+
+        # Upload concurrently; failed uploads are reported, not fatal
+        results = upload_entry_photos(photos)
+
+        for photo_id, photo, (photo_url, error) in zip(photo_ids, photos, results):
+            if not photo_url:
+                errors.append({"input": photo.filename, "errors": [str(error) if error else "Upload failed"]})
+                continue
+
+            photo_rows.append({
+                "photo_id": photo_id,
+                "entry_id": entry_id,
+                "photo_url": photo_url,
+                "user_id": 1,
+                "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            photo_names.append(photo.filename)
+
+        # One insert for all of the request's photos
+        insert_errors = write_rows("photos", photo_rows, photo_names)
+        errors.extend(insert_errors)
+
+        failed = {error["index"] for error in insert_errors}
+        photo_urls = [row["photo_url"] for i, row in enumerate(photo_rows) if i not in failed]
+        return photo_urls, errors
     except Exception as e:
         print(f"Error in handle_photos: {str(e)}")
         raise
 
 def handle_expenses(entry_id, expenses):
-    """Handle expenses and insert them into the database"""
+    """Insert expenses into the database and return any per-expense errors"""
     try:
-        for i, expense in enumerate(expenses):
-            if expense:
-                category, amount = expense.split(":")
-                expense_id = generate_unique_id("expenses", "expense_id")
-                
-                expense_data = {
-                    "expense_id": expense_id,
-                    "entry_id": entry_id,
-                    "category": category,
-                    "amount": float(amount),
-                    "user_id": 1,
-                    "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
-                expenses_table_id = f"{client.project}.{DATASET_NAME}.expenses"
-                errors = client.insert_rows_json(expenses_table_id, [expense_data])
-                print(f"Expense insert errors (if any): {errors}")
+        expenses = [expense for expense in expenses if expense]
+        expense_ids = allocate_ids(len(expenses), "expenses", "expense_id")
+        expense_rows = []
+
+        for expense_id, expense in zip(expense_ids, expenses):
+            category, amount = expense.split(":")
+            
+            expense_rows.append({
+                "expense_id": expense_id,
+                "entry_id": entry_id,
+                "category": category,
+                "amount": float(amount),
+                "user_id": 1,
+                "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            })
+
+        # One insert for all of the request's expenses
+        errors = write_rows("expenses", expense_rows, expenses)
+        if errors:
+            print(f"Expense insert errors: {errors}")
+        failed = {error["index"] for error in errors}
+        track_expenses([row for i, row in enumerate(expense_rows) if i not in failed])
+        return errors
     except Exception as e:
         print(f"Error in handle_expenses: {str(e)}")
-        raise
\ No newline at end of file
+        raise